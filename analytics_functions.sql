@@ -0,0 +1,86 @@
+-- ==============================================================================
+-- AquaWatch - Analytics aggregation functions
+-- Run after supabase_schema.sql. The backend calls these through Supabase RPC so
+-- the admin dashboard never pulls the whole submissions table.
+-- ==============================================================================
+
+-- Indexes backing the aggregations
+create index if not exists submissions_created_at_idx on submissions (created_at);
+create index if not exists submissions_status_idx on submissions (status);
+
+-- Average coverage per ~1 km area (coordinates rounded to 2 decimals), worst first.
+-- Rows with a missing/zero coordinate or zero coverage are ignored, as before.
+create or replace function analytics_severity_by_area(p_limit int default 10)
+returns table (latitude numeric, longitude numeric, severity double precision, submissions bigint)
+language sql stable
+as $$
+  select
+    round(s.latitude::numeric, 2) as latitude,
+    round(s.longitude::numeric, 2) as longitude,
+    avg(s.coverage_percent) as severity,
+    count(*) as submissions
+  from submissions s
+  where s.latitude is not null and s.latitude <> 0
+    and s.longitude is not null and s.longitude <> 0
+    and s.coverage_percent is not null and s.coverage_percent <> 0
+  group by 1, 2
+  order by severity desc
+  limit greatest(p_limit, 0);
+$$;
+
+-- Average coverage per UTC calendar day, optionally restricted to [p_from, p_to].
+create or replace function analytics_daily_trend(p_from date default null, p_to date default null)
+returns table (day date, average_coverage double precision, submissions bigint)
+language sql stable
+as $$
+  select
+    (s.created_at at time zone 'utc')::date as day,
+    avg(s.coverage_percent) as average_coverage,
+    count(*) as submissions
+  from submissions s
+  where s.coverage_percent is not null and s.coverage_percent <> 0
+    and (p_from is null or s.created_at >= (p_from::timestamp at time zone 'utc'))
+    and (p_to is null or s.created_at < ((p_to + 1)::timestamp at time zone 'utc'))
+  group by 1
+  order by 1;
+$$;
+
+-- Number of submissions in each status.
+create or replace function analytics_status_counts()
+returns table (status text, count bigint)
+language sql stable
+as $$
+  select s.status, count(*) as count
+  from submissions s
+  group by s.status;
+$$;
+
+-- These expose data across all users, so only the backend (service role) may call them.
+revoke execute on function analytics_severity_by_area(int) from public, anon, authenticated;
+revoke execute on function analytics_daily_trend(date, date) from public, anon, authenticated;
+revoke execute on function analytics_status_counts() from public, anon, authenticated;
+grant execute on function analytics_severity_by_area(int) to service_role;
+grant execute on function analytics_daily_trend(date, date) to service_role;
+grant execute on function analytics_status_counts() to service_role;
+
+-- Keep updated_at current on every change (e.g. admin status updates) so the
+-- backend's incremental analytics store can fetch only rows changed since its watermark.
+create or replace function submissions_touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.updated_at := now();
+  return new;
+end;
+$$;
+
+drop trigger if exists submissions_touch_updated_at on submissions;
+create trigger submissions_touch_updated_at
+  before update on submissions
+  for each row execute procedure submissions_touch_updated_at();
+
+create index if not exists submissions_updated_at_id_idx on submissions (updated_at, id);
+
+-- Keyset pagination for the streaming submissions export (/analytics/export/submissions)
+create index if not exists submissions_created_at_id_idx on submissions (created_at, id);
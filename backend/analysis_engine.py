@@ -0,0 +1,270 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metrics
+from detection_params import DEFAULT_QUALITY, get_config
+from result_cache import ResultCache, result_cache
+
+
+class EngineSaturated(Exception):
+    """Raised when the admission queue is full and the request should be retried later."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Analysis engine saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+WARM_UP_TIMEOUT_SECONDS = float(os.getenv("ANALYSIS_WARM_UP_TIMEOUT_SECONDS", "300"))
+
+class WorkerLost(Exception):
+    """Raised when a pool worker died mid-job (e.g. out of memory); a fresh pool is starting."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Analysis worker died, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# Worker-side helpers (run inside the pool processes)
+_worker_startup: Dict[str, Any] = {}
+
+
+def _warm_worker(barrier=None):
+    # Import the heavy modules (cv2, numpy, skimage) once per worker process
+    # so the first real request does not pay for it.
+    started = time.perf_counter()
+    import image_processing  # noqa: F401
+    _worker_startup["import_seconds"] = time.perf_counter() - started
+    _worker_startup["barrier"] = barrier
+
+
+def _warm_up() -> Dict[str, Any]:
+    from image_processing import warm_up
+    started = time.perf_counter()
+    warm_up()
+    result = {
+        "pid": os.getpid(),
+        "import_seconds": round(_worker_startup.get("import_seconds", 0.0), 3),
+        "warm_up_seconds": round(time.perf_counter() - started, 3),
+    }
+    # Hold this worker until every worker has warmed up: a worker that finished
+    # first can't take another warm-up task, so each task runs on its own worker
+    barrier = _worker_startup.get("barrier")
+    if barrier is not None:
+        barrier.wait(WARM_UP_TIMEOUT_SECONDS)
+    return result
+
+
+def _run_detection(image_bytes: bytes, quality: str = DEFAULT_QUALITY,
+                   strict: bool = False) -> Tuple[float, Dict[str, float]]:
+    from image_processing import detect_hyacinth
+    timings = {}
+    coverage = detect_hyacinth(image_bytes, timings, quality, strict)
+    return coverage, timings
+
+
+def _run_overlay_detection(image_bytes: bytes, scale: float, encoding: str,
+                           quality: str = DEFAULT_QUALITY) -> Tuple[dict, Dict[str, float]]:
+    from image_processing import detect_hyacinth_overlay
+    timings = {}
+    result = detect_hyacinth_overlay(image_bytes, scale, encoding, timings, quality)
+    return result, timings
+
+
+def _run_tiled_detection(path: str, tile_size: int, overlap: int, threads: int) -> dict:
+    from image_processing import detect_hyacinth_tiled_file
+    return detect_hyacinth_tiled_file(path, tile_size=tile_size, overlap=overlap, workers=threads)
+
+
+class AnalysisEngine:
+    """
+    Process pool for CPU-bound image analysis with a bounded admission queue.
+
+    At most `max_pending` jobs may be running or waiting at once; anything beyond
+    that is rejected with EngineSaturated instead of being buffered in memory.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 cache: Optional[ResultCache] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.cache = cache
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._start_lock = threading.Lock()
+        self._warm_up_barrier = None
+        # Set once every worker has imported the image stack and run a dummy image
+        self.ready = False
+        self.startup: Dict[str, Any] = {}
+        self._pending = 0
+        self.restarts = 0
+        # Exponentially weighted average of job duration, used for Retry-After
+        self._avg_seconds = 1.0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def started(self) -> bool:
+        return self._pool is not None
+
+    def start(self):
+        """
+        Spawns and warms the workers; blocks until they are ready. Safe to call
+        from a background thread: jobs submitted meanwhile queue behind the warm-up.
+        """
+        with self._start_lock:
+            if self._pool is not None:
+                return
+            started = time.perf_counter()
+            # spawn (not fork) so workers never inherit the event loop or open sockets
+            context = multiprocessing.get_context("spawn")
+            self._warm_up_barrier = context.Barrier(self.workers)
+            pool = self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_warm_worker,
+                initargs=(self._warm_up_barrier,),
+            )
+            # Pre-spawn every worker so the imports happen now, not on the first
+            # upload; the barrier in _warm_up puts one warm-up on each worker
+            futures = [pool.submit(_warm_up) for _ in range(self.workers)]
+        try:
+            workers = [f.result() for f in futures]
+        except (CancelledError, threading.BrokenBarrierError):
+            return  # shut down while warming up
+        if self._pool is pool:
+            self.startup = {"seconds": round(time.perf_counter() - started, 3), "workers": workers}
+            self.ready = True
+            print(f"Analysis engine ready: {self.workers} worker(s) in {self.startup['seconds']}s")
+
+    def shutdown(self):
+        self.ready = False
+        pool, self._pool = self._pool, None
+        if self._warm_up_barrier is not None:
+            self._warm_up_barrier.abort()  # release workers still waiting for the others
+            self._warm_up_barrier = None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _replace_broken(self, pool: ProcessPoolExecutor):
+        """
+        A worker died, which leaves a ProcessPoolExecutor unusable for good: drop
+        it and warm a new pool in the background. Not ready until that is done.
+        """
+        with self._start_lock:
+            if self._pool is not pool:
+                return  # another job already replaced it
+            self.ready = False
+            self._pool = None
+            self._warm_up_barrier = None
+            self.restarts += 1
+        print("Analysis worker died; restarting the pool")
+        pool.shutdown(wait=False, cancel_futures=True)
+        threading.Thread(target=self.start, name="analysis-engine-restart", daemon=True).start()
+
+    def retry_after(self) -> int:
+        backlog = max(self._pending - self.workers + 1, 1)
+        return max(1, math.ceil(self._avg_seconds * backlog / self.workers))
+
+    async def submit(self, fn: Callable, *args) -> Any:
+        if self._pending >= self.max_pending:
+            raise EngineSaturated(self.retry_after())
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            if self._pool is None:
+                # Not started yet: spawn the workers without blocking the event loop
+                await loop.run_in_executor(None, self.start)
+            pool = self._pool
+            try:
+                return await loop.run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                # Not retried here: the job may be what killed the worker
+                self._replace_broken(pool)
+                raise WorkerLost(self.retry_after())
+        finally:
+            self._pending -= 1
+            elapsed = time.perf_counter() - started
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+
+    @staticmethod
+    def tier_namespace(namespace: str, quality: str) -> str:
+        """Cache namespace for a quality tier; the standard tier keeps the plain namespace."""
+        if quality == DEFAULT_QUALITY:
+            return namespace
+        # The cache version only tracks the standard parameters, so key other tiers by their own
+        return f"{namespace}@{quality}:{get_config(quality).version}"
+
+    async def analyze(self, image_bytes: bytes, quality: str = DEFAULT_QUALITY, strict: bool = False) -> float:
+        # Cache hits are served even when the pool is saturated.
+        # strict: raise for undecodable images instead of reporting 0% coverage
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(image_bytes, self.tier_namespace("coverage", quality))
+            cached = await self.cache.get_async(key)
+            if cached is not None:
+                return cached
+
+        coverage, timings = await self.submit(_run_detection, image_bytes, quality, strict)
+        metrics.observe_stages(timings)
+
+        if key is not None:
+            await self.cache.set_async(key, coverage)
+        return coverage
+
+    @classmethod
+    def overlay_namespace(cls, scale: float, encoding: str, quality: str = DEFAULT_QUALITY) -> str:
+        return cls.tier_namespace(f"overlay:{encoding}:{scale:g}", quality)
+
+    async def analyze_overlay(self, image_bytes: bytes, scale: float, encoding: str,
+                              quality: str = DEFAULT_QUALITY) -> dict:
+        """Coverage plus encoded mask and blob stats, cached by image hash (see cached_overlay)."""
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(image_bytes, self.overlay_namespace(scale, encoding, quality))
+            cached = await self.cache.get_async(key)
+            if cached is not None:
+                return cached
+
+        result, timings = await self.submit(_run_overlay_detection, image_bytes, scale, encoding, quality)
+        metrics.observe_stages(timings)
+
+        if key is not None:
+            await self.cache.set_async(key, result)
+        return result
+
+    def cached_overlay(self, digest: str, scale: float, encoding: str,
+                       quality: str = DEFAULT_QUALITY) -> Optional[dict]:
+        """An overlay computed earlier for the image with this sha256 digest, if still cached."""
+        if self.cache is None:
+            return None
+        return self.cache.get(self.cache.key_for_digest(digest, self.overlay_namespace(scale, encoding, quality)))
+
+    @property
+    def tile_threads(self) -> int:
+        """Tile threads per tiled job: one worker's share of the cores, as it holds one admission slot."""
+        return max(1, (os.cpu_count() or 1) // self.workers)
+
+    async def analyze_tiled(self, path: str, tile_size: int, overlap: int) -> dict:
+        return await self.submit(_run_tiled_detection, path, tile_size, overlap, self.tile_threads)
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+# Shared engine for the API process
+engine = AnalysisEngine(
+    workers=_env_int("ANALYSIS_WORKERS"),
+    max_pending=_env_int("ANALYSIS_MAX_PENDING"),
+    cache=result_cache,
+)
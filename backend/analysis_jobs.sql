@@ -0,0 +1,24 @@
+-- ==============================================================================
+-- AquaWatch - Analysis job results
+-- Run after supabase_schema.sql. The backend's job worker (job_queue.py) writes
+-- finished coverage values in batches through this function: one RPC per batch
+-- instead of one update per submission.
+-- ==============================================================================
+
+-- p_results: [{"id": "<submission uuid>", "coverage_percent": 12.5}, ...]
+create or replace function apply_coverage_results(p_results jsonb)
+returns int
+language sql
+as $$
+  with updated as (
+    update submissions s
+       set coverage_percent = r.coverage_percent
+      from jsonb_to_recordset(p_results) as r(id uuid, coverage_percent double precision)
+     where s.id = r.id
+    returning 1
+  )
+  select count(*)::int from updated;
+$$;
+
+revoke execute on function apply_coverage_results(jsonb) from public, anon, authenticated;
+grant execute on function apply_coverage_results(jsonb) to service_role;
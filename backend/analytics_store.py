@@ -0,0 +1,194 @@
+import asyncio
+import heapq
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from geo_index import GeoGridIndex
+
+# fetch(cursor, limit) -> submissions ordered by (updated_at, id) strictly after cursor
+FetchPage = Callable[[Optional[Tuple[str, str]], int], Awaitable[List[dict]]]
+
+NIL_UUID = "00000000-0000-0000-0000-000000000000"
+
+STATUS_COLORS = (
+    ("Pending", "pending", "#f59e0b"),  # Amber
+    ("Accepted", "accepted", "#0ea5e9"),  # Sky
+    ("Completed", "completed", "#10b981"),  # Emerald
+    ("Rejected", "rejected", "#ef4444"),  # Red
+)
+
+
+class _Contribution:
+    """What one submission currently adds to the aggregates, so it can be taken back out."""
+
+    __slots__ = ("area", "day", "status", "coverage", "cell")
+
+    def __init__(self, row: dict):
+        coverage = row.get("coverage_percent")
+        lat, lon = row.get("latitude"), row.get("longitude")
+        # Same filters as the original endpoints: falsy coordinates/coverage are skipped
+        self.area = (round(lat, 2), round(lon, 2)) if lat and lon and coverage else None
+        self.day = row["created_at"].split("T")[0] if coverage and row.get("created_at") else None
+        self.status = row.get("status") or "unknown"
+        self.coverage = coverage or 0.0
+        # Geohash cell in the spatial index, set once the point is indexed
+        self.cell: Optional[str] = None
+
+
+class AnalyticsStore:
+    """
+    Running aggregates of submissions per area cell and per status, daily
+    rollups per area cell for trend queries (see trend_engine.py), plus a
+    multi-resolution geohash index of submission locations for the map.
+
+    refresh() pulls only rows whose updated_at is past the last watermark (keyset
+    paginated on (updated_at, id)) and re-applies them, subtracting each row's
+    previous contribution first, so status and coverage changes are handled.
+    A small overlap window re-reads rows from transactions that committed late.
+    """
+
+    def __init__(self, fetch_page: FetchPage, page_size: int = 1000, max_age: float = 5.0,
+                 overlap: float = 10.0, full_resync_every: float = 3600.0):
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.max_age = max_age
+        self.overlap = timedelta(seconds=overlap)
+        self.full_resync_every = full_resync_every
+
+        self._lock = asyncio.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.contributions: Dict[str, _Contribution] = {}
+        self.area_totals: Dict[Tuple[float, float], List[float]] = {}
+        self._trends = None
+        self.status_counts: Dict[str, int] = {}
+        self.geo = GeoGridIndex()
+        self.watermark: Optional[datetime] = None
+        self._watermark_key: Optional[Tuple[str, str]] = None
+        self.refreshed_at: Optional[datetime] = None
+        self._refreshed_monotonic = 0.0
+        self._full_sync_monotonic = 0.0
+
+    @property
+    def trends(self):
+        """The daily TrendRollup, created on first use: trend_engine imports NumPy,
+        which the API process should not pay for at startup."""
+        if self._trends is None:
+            from trend_engine import TrendRollup
+            self._trends = TrendRollup()
+        return self._trends
+
+    @property
+    def loaded(self) -> bool:
+        return self.refreshed_at is not None
+
+    # Aggregate maintenance
+
+    @staticmethod
+    def _add(totals: dict, key, coverage: float, sign: int):
+        entry = totals.get(key)
+        if entry is None:
+            entry = totals[key] = [0.0, 0]
+        entry[0] += sign * coverage
+        entry[1] += sign
+        if entry[1] == 0:
+            del totals[key]
+
+    def _apply_contribution(self, c: _Contribution, sign: int):
+        if c.area is not None:
+            self._add(self.area_totals, c.area, c.coverage, sign)
+        if c.day is not None:
+            self.trends.add(c.area, c.day, c.coverage, sign)
+        count = self.status_counts.get(c.status, 0) + sign
+        if count:
+            self.status_counts[c.status] = count
+        else:
+            self.status_counts.pop(c.status, None)
+
+    def apply(self, row: dict):
+        previous = self.contributions.get(row["id"])
+        if previous is not None:
+            self._apply_contribution(previous, -1)
+            if previous.cell is not None:
+                self.geo.remove(row["id"], previous.cell)
+        current = _Contribution(row)
+        self._apply_contribution(current, +1)
+        lat, lon = row.get("latitude"), row.get("longitude")
+        if lat and lon:
+            current.cell = self.geo.add(row["id"], lat, lon, current.coverage, current.status)
+        self.contributions[row["id"]] = current
+
+        updated = datetime.fromisoformat(row["updated_at"])
+        if self.watermark is None or (updated, row["id"]) > (self.watermark, self._watermark_key[1]):
+            self.watermark = updated
+            self._watermark_key = (row["updated_at"], row["id"])
+
+    # Refresh
+
+    async def refresh(self, force: bool = False):
+        if not force and self.loaded and time.monotonic() - self._refreshed_monotonic < self.max_age:
+            return
+        async with self._lock:
+            # Another request may have refreshed while we waited for the lock
+            if not force and self.loaded and time.monotonic() - self._refreshed_monotonic < self.max_age:
+                return
+
+            # Deletes are never seen by the delta query, so rebuild now and then.
+            # The rebuild happens off to the side and is swapped in, so readers never
+            # see a half-loaded store.
+            if self.loaded and time.monotonic() - self._full_sync_monotonic > self.full_resync_every:
+                rebuilt = AnalyticsStore(self.fetch_page, self.page_size, overlap=0)
+                await rebuilt._sync()
+                self._adopt(rebuilt)
+            else:
+                await self._sync()
+
+            self.refreshed_at = datetime.now(timezone.utc)
+            self._refreshed_monotonic = time.monotonic()
+
+    async def _sync(self):
+        if not self.loaded and not self.contributions:
+            self._full_sync_monotonic = time.monotonic()
+
+        cursor = self._watermark_key
+        if cursor is not None and self.overlap:
+            cursor = ((self.watermark - self.overlap).isoformat(), NIL_UUID)
+
+        while True:
+            rows = await self.fetch_page(cursor, self.page_size)
+            for row in rows:
+                self.apply(row)
+            if len(rows) < self.page_size:
+                break
+            cursor = (rows[-1]["updated_at"], rows[-1]["id"])
+
+    def _adopt(self, other: "AnalyticsStore"):
+        self.contributions = other.contributions
+        self.area_totals = other.area_totals
+        self._trends = other._trends
+        self.status_counts = other.status_counts
+        self.geo = other.geo
+        self.watermark = other.watermark
+        self._watermark_key = other._watermark_key
+        self._full_sync_monotonic = other._full_sync_monotonic
+
+    # Queries
+
+    def severity(self, limit: int = 10) -> List[dict]:
+        top = heapq.nlargest(limit, self.area_totals.items(), key=lambda item: item[1][0] / item[1][1])
+        return [
+            {"name": f"Area {lat}, {lon}", "severity": round(total / count, 1)}
+            for (lat, lon), (total, count) in top
+        ]
+
+    def trend(self, **query) -> List[dict]:
+        """Coverage per day (or week/month) with optional range, rolling mean and percentiles; see TrendRollup.query."""
+        return self.trends.query(**query)
+
+    def status(self) -> List[dict]:
+        return [
+            {"name": name, "value": self.status_counts.get(key, 0), "color": color}
+            for name, key, color in STATUS_COLORS
+        ]
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import os
+import tarfile
+import zipfile
+from typing import AsyncIterator, Callable, Iterator, List, Tuple, Union
+
+from fastapi import UploadFile
+
+from analysis_engine import AnalysisEngine, EngineSaturated
+from detection_params import DEFAULT_QUALITY
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "500"))
+# Per image or archive member; larger ones are reported as errors without being read
+MAX_BATCH_IMAGE_BYTES = int(os.getenv("MAX_BATCH_IMAGE_BYTES", str(50 * 1024 * 1024)))
+
+# (name, bytes), or (name, error) for an image that is not read
+BatchItem = Tuple[str, Union[bytes, Exception]]
+
+
+def _is_image(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _is_archive(upload: UploadFile) -> bool:
+    name = (upload.filename or "").lower()
+    return name.endswith(ARCHIVE_EXTENSIONS) or upload.content_type in (
+        "application/zip", "application/x-tar", "application/gzip", "application/x-gzip",
+    )
+
+
+def _too_large(size: int) -> Exception:
+    return ValueError(f"Image is {size} bytes, over the {MAX_BATCH_IMAGE_BYTES} byte limit")
+
+
+def _iter_archive(upload: UploadFile) -> Iterator[Tuple[str, int, Callable[[], bytes]]]:
+    # UploadFile is spooled to disk past 1 MB, so members are read one at a time
+    # rather than extracting the whole archive into memory. The sizes checked are
+    # the uncompressed ones from the archive headers, and reads stop there.
+    # Yields (name, size, read); read() must be called before the next member.
+    upload.file.seek(0)
+    if zipfile.is_zipfile(upload.file):
+        upload.file.seek(0)
+        with zipfile.ZipFile(upload.file) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and _is_image(info.filename):
+                    yield info.filename, info.file_size, lambda info=info: zf.read(info)
+        return
+
+    upload.file.seek(0)
+    with tarfile.open(fileobj=upload.file, mode="r|*") as tf:
+        for member in tf:
+            if member.isfile() and _is_image(member.name):
+                yield member.name, member.size, lambda member=member: tf.extractfile(member).read()
+
+
+def _iter_upload(upload: UploadFile, default_name: str) -> Iterator[Tuple[str, int, Callable[[], bytes]]]:
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+
+    def read() -> bytes:
+        upload.file.seek(0)
+        return upload.file.read()
+
+    yield upload.filename or default_name, size, read
+
+
+class BatchImages:
+    """
+    Iterates (name, bytes) for every image in the uploads, expanding zip/tar archives,
+    up to MAX_BATCH_IMAGES. Images past the limit are counted in `skipped` without
+    being read, so the batch summary can report them once iteration ends.
+    Blocking (file reads, decompression): consume it from a thread.
+    """
+
+    def __init__(self, uploads: List[UploadFile], limit: int):
+        self.limit = limit
+        self.skipped = 0
+        self._items = self._iter(uploads)
+
+    def __iter__(self) -> "BatchImages":
+        return self
+
+    def __next__(self) -> BatchItem:
+        return next(self._items)
+
+    def _iter(self, uploads: List[UploadFile]) -> Iterator[BatchItem]:
+        count = 0
+        for upload in uploads:
+            if _is_archive(upload):
+                members = _iter_archive(upload)
+            else:
+                members = _iter_upload(upload, f"image_{count}")
+
+            for name, size, read in members:
+                if count >= self.limit:
+                    self.skipped += 1
+                    continue
+                count += 1
+                yield name, _too_large(size) if size > MAX_BATCH_IMAGE_BYTES else read()
+
+
+def iter_batch_images(uploads: List[UploadFile]) -> BatchImages:
+    return BatchImages(uploads, MAX_BATCH_IMAGES)
+
+
+async def _analyze_with_backoff(engine: AnalysisEngine, data: bytes, quality: str) -> float:
+    # The batch was already admitted, so wait out saturation instead of failing images
+    while True:
+        try:
+            # strict: an undecodable part is reported as an error, not as 0% coverage
+            return await engine.analyze(data, quality, strict=True)
+        except EngineSaturated as e:
+            await asyncio.sleep(min(e.retry_after, 5))
+
+
+async def stream_batch_results(engine: AnalysisEngine, images: Iterator[BatchItem],
+                               quality: str = DEFAULT_QUALITY) -> AsyncIterator[str]:
+    """
+    Fans images out across the engine workers and yields one NDJSON line per image
+    as soon as it finishes, followed by a summary line with the batch aggregate
+    and the number of images skipped past the batch limit. Items are pulled from
+    `images` in a thread, so reading and decompressing uploads never blocks the
+    event loop.
+    """
+    async def run(index: int, name: str, data: Union[bytes, Exception]) -> dict:
+        try:
+            if isinstance(data, Exception):
+                raise data
+            coverage = await _analyze_with_backoff(engine, data, quality)
+            return {"index": index, "name": name, "coverage_percent": coverage}
+        except Exception as e:
+            return {"index": index, "name": name, "error": str(e)}
+
+    def record(result: dict) -> str:
+        if "error" in result:
+            failed.append(result["index"])
+        else:
+            coverages.append(result["coverage_percent"])
+        return json.dumps(result) + "\n"
+
+    # Keep only a window of images in flight so a large batch never holds the
+    # whole archive in memory nor hogs the admission queue.
+    window = max(engine.workers, 1)
+    in_flight = set()
+    coverages = []
+    failed = []
+    index = 0
+
+    while True:
+        item = await asyncio.to_thread(next, images, None)
+        if item is None:
+            break
+        name, data = item
+        in_flight.add(asyncio.ensure_future(run(index, name, data)))
+        index += 1
+        if len(in_flight) >= window:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield record(task.result())
+
+    while in_flight:
+        done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield record(task.result())
+
+    average = round(sum(coverages) / len(coverages), 2) if coverages else 0.0
+    summary = {
+        "images": index,
+        "analyzed": len(coverages),
+        "failed": len(failed),
+        # Past MAX_BATCH_IMAGES: not analyzed, resubmit them in another batch
+        "skipped": getattr(images, "skipped", 0),
+        "average_coverage": average,
+    }
+    yield json.dumps({"summary": summary}) + "\n"
@@ -0,0 +1,107 @@
+"""
+Load-tests API endpoints in process through an ASGI client, with Supabase stubbed.
+
+    cd backend
+    python -m benchmarks.bench_api --output bench_api.json
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.common import summarize, write_results
+from benchmarks.scenes import encode_jpeg, make_scene
+from benchmarks.stubs import FakeSupabase, make_submissions
+
+import main
+from analysis_engine import engine
+from db import db
+from metrics import InstrumentedSupabase
+
+
+async def load(client: httpx.AsyncClient, name: str, send, requests: int, concurrency: int) -> dict:
+    samples = []
+    errors = 0
+    rejected = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors, rejected
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await send(client)
+            samples.append(time.perf_counter() - start)
+            if response.status_code == 503:
+                rejected += 1
+            elif response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "name": f"api/{name}",
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "rejected": rejected,
+        "rps": round(requests / elapsed, 2),
+        "latency": summarize(samples),
+    }
+
+
+async def run(args) -> list:
+    db.client = InstrumentedSupabase(FakeSupabase({"submissions": make_submissions(args.rows)}))
+
+    # Measure real analysis work, not cache hits
+    engine.cache = None
+    engine.start()
+
+    image = encode_jpeg(make_scene(args.image_width, "mixed"))
+
+    def get(path):
+        return lambda client: client.get(path)
+
+    def analyze(client):
+        return client.post("/api/analyze", files={"file": ("scene.jpg", image, "image/jpeg")})
+
+    scenarios = [
+        ("GET /analytics/severity", get("/analytics/severity"), args.requests),
+        ("GET /analytics/trend", get("/analytics/trend"), args.requests),
+        ("GET /analytics/status", get("/analytics/status"), args.requests),
+        ("POST /api/analyze", analyze, args.analyze_requests),
+    ]
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, send, requests in scenarios:
+            result = await load(client, name, send, requests, args.concurrency)
+            latency = result["latency"]
+            print(f"{result['name']:<32} {result['rps']:>9.1f} req/s  p50 {latency['p50_ms']:>8.2f} ms  "
+                  f"p95 {latency['p95_ms']:>8.2f} ms  errors {result['errors']}  503s {result['rejected']}")
+            results.append(result)
+
+    engine.shutdown()
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000, help="synthetic submissions in the stubbed table")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--analyze-requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--image-width", type=int, default=1280)
+    parser.add_argument("--output", default="bench_api.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    write_results(args.output, "api", results)
+
+
+if __name__ == "__main__":
+    main_cli()
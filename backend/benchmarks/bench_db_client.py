@@ -0,0 +1,116 @@
+"""
+Compares Supabase access patterns against a local stub PostgREST server:
+
+  before  a new sync client per request (create_client), run in a worker thread,
+          as routers/coupons.py's get_supabase dependency used to do
+  after   the shared async client from db.py with a pooled keep-alive httpx client
+
+    cd backend
+    python -m benchmarks.bench_db_client --output bench_db_client.json
+"""
+import argparse
+import asyncio
+import socket
+import threading
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from benchmarks.common import summarize, write_results
+
+from db import Database
+
+PARKS = [
+    {"id": f"park-{i}", "name": f"Park {i}", "city": "Bengaluru", "state": "KA",
+     "ticket_price": 50 + i, "description": None, "is_active": True}
+    for i in range(20)
+]
+
+
+def start_stub_postgrest() -> str:
+    async def table(request):
+        return JSONResponse(PARKS)
+
+    app = Starlette(routes=[Route("/rest/v1/{table}", table)])
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+async def drive(name: str, call, requests: int, concurrency: int) -> dict:
+    samples = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            await call()
+            samples.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "name": f"db/{name}",
+        "requests": requests,
+        "concurrency": concurrency,
+        "rps": round(requests / elapsed, 2),
+        "latency": summarize(samples),
+    }
+
+
+async def run(args) -> list:
+    from supabase import create_client
+
+    url = start_stub_postgrest()
+    key = "benchmark"
+
+    def client_per_request():
+        client = create_client(url, key)
+        return client.table("parks_gardens").select("*").eq("is_active", True).execute()
+
+    async def before():
+        await asyncio.to_thread(client_per_request)
+
+    database = Database()
+    await database.connect(url, key)
+
+    async def after():
+        await database.client.table("parks_gardens").select("*").eq("is_active", True).execute()
+
+    results = []
+    for name, call in (("client-per-request", before), ("shared-pooled-async", after)):
+        await drive(name, call, min(args.requests, 20), args.concurrency)  # warm-up
+        result = await drive(name, call, args.requests, args.concurrency)
+        latency = result["latency"]
+        print(f"{result['name']:<26} {result['rps']:>9.1f} req/s  p50 {latency['p50_ms']:>8.2f} ms  "
+              f"p95 {latency['p95_ms']:>8.2f} ms")
+        results.append(result)
+
+    await database.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", default="bench_db_client.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    write_results(args.output, "db_client", results)
+
+
+if __name__ == "__main__":
+    main()
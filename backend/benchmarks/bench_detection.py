@@ -0,0 +1,72 @@
+"""
+Times detect_hyacinth end to end and stage by stage on synthetic scenes.
+With --overlay, times detect_hyacinth_overlay instead, so the components and
+encode_overlay stages show what the mask overlay adds.
+
+    cd backend
+    python -m benchmarks.bench_detection --output bench_detection.json
+"""
+import argparse
+import time
+from typing import Optional
+
+from benchmarks.common import summarize, write_results
+from benchmarks.scenes import SCENE_KINDS, SCENE_WIDTHS, encode_jpeg, make_scene
+
+from image_processing import detect_hyacinth, detect_hyacinth_overlay
+
+
+def bench_scene(width: int, kind: str, repeats: int, overlay: Optional[str] = None, scale: float = 0.5) -> dict:
+    data = encode_jpeg(make_scene(width, kind))
+    if overlay:
+        def detect(data, timings=None):
+            return detect_hyacinth_overlay(data, scale, overlay, timings)["coverage_percent"]
+    else:
+        detect = detect_hyacinth
+    coverage = detect(data)  # warm-up
+
+    samples = []
+    stage_totals = {}
+    for _ in range(repeats):
+        timings = {}
+        start = time.perf_counter()
+        detect(data, timings)
+        samples.append(time.perf_counter() - start)
+        for stage, seconds in timings.items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+
+    return {
+        "name": f"detect/{kind}/{width}" + (f"/overlay-{overlay}" if overlay else ""),
+        "width": width,
+        "kind": kind,
+        "bytes": len(data),
+        "coverage_percent": coverage,
+        "latency": summarize(samples),
+        "stages_ms": {stage: round(total / repeats * 1000, 3) for stage, total in stage_totals.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SCENE_WIDTHS))
+    parser.add_argument("--kinds", nargs="+", default=list(SCENE_KINDS), choices=SCENE_KINDS)
+    parser.add_argument("--repeats", type=int, default=10, help="runs per scene at 640 px; fewer for larger scenes")
+    parser.add_argument("--overlay", choices=("png", "rle"), help="also encode the mask overlay")
+    parser.add_argument("--overlay-scale", type=float, default=0.5)
+    parser.add_argument("--output", default="bench_detection.json")
+    args = parser.parse_args()
+
+    results = []
+    for width in args.sizes:
+        repeats = max(3, args.repeats * 640 // width)
+        for kind in args.kinds:
+            result = bench_scene(width, kind, repeats, args.overlay, args.overlay_scale)
+            latency = result["latency"]
+            print(f"{result['name']:<40} p50 {latency['p50_ms']:>9.2f} ms  p95 {latency['p95_ms']:>9.2f} ms")
+            results.append(result)
+
+    write_results(args.output, "detection", results)
+
+
+if __name__ == "__main__":
+    main()
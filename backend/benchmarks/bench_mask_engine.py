@@ -0,0 +1,71 @@
+"""
+Compares the original compute_hyacinth_mask with DetectionEngine.mask on decoded
+frames: latency per call and bytes allocated per call (tracemalloc peak, which
+sees NumPy and OpenCV output arrays).
+
+    cd backend
+    python -m benchmarks.bench_mask_engine --output bench_mask_engine.json
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.common import summarize, write_results
+from benchmarks.scenes import make_scene
+
+from image_processing import DetectionEngine, compute_hyacinth_mask
+
+
+def peak_allocated(fn, img) -> int:
+    tracemalloc.start()
+    try:
+        fn(img)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench(name: str, fn, img: np.ndarray, repeats: int) -> dict:
+    fn(img)  # warm-up (the engine allocates its buffers here)
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(img)
+        samples.append(time.perf_counter() - start)
+    allocated = peak_allocated(fn, img)
+    return {
+        "name": f"mask/{name}/{img.shape[1]}",
+        "width": img.shape[1],
+        "latency": summarize(samples),
+        "allocated_bytes": allocated,
+        "allocated_bytes_per_pixel": round(allocated / (img.shape[0] * img.shape[1]), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[640, 1000, 1920])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", default="bench_mask_engine.json")
+    args = parser.parse_args()
+
+    engine = DetectionEngine()
+    results = []
+    for width in args.sizes:
+        img = make_scene(width, "mixed")
+        if not np.array_equal(compute_hyacinth_mask(img), engine.mask(img)):
+            raise SystemExit(f"DetectionEngine mask differs from compute_hyacinth_mask at {width} px")
+        for name, fn in (("reference", compute_hyacinth_mask), ("engine", engine.mask)):
+            result = bench(name, fn, img, args.repeats)
+            latency = result["latency"]
+            print(f"{result['name']:<24} p50 {latency['p50_ms']:>8.2f} ms  p95 {latency['p95_ms']:>8.2f} ms  "
+                  f"allocated {result['allocated_bytes'] / 1e6:>8.2f} MB ({result['allocated_bytes_per_pixel']} B/px)")
+            results.append(result)
+
+    write_results(args.output, "mask_engine", results)
+
+
+if __name__ == "__main__":
+    main()
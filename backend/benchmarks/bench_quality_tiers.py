@@ -0,0 +1,114 @@
+"""
+Latency and accuracy of each detection quality tier on the synthetic test set.
+
+Every scene comes with the mask of the pixels painted as plants, so besides
+end-to-end latency (decode through count, from JPEG bytes) each tier is scored
+against ground truth: absolute coverage error in percentage points, and IoU of
+the detected mask with the ground truth resized to the analyzed resolution.
+
+    cd backend
+    python -m benchmarks.bench_quality_tiers --output bench_quality_tiers.json
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.common import summarize, write_results
+from benchmarks.scenes import SCENE_KINDS, SCENE_WIDTHS, encode_jpeg, make_labeled_scene
+
+from detection_params import QUALITY_TIERS
+from image_processing import DetectionEngine
+
+
+def score(mask: np.ndarray, truth: np.ndarray) -> dict:
+    detected = mask > 0
+    if truth.shape != detected.shape:
+        # A cell is plant if at least half of its source pixels are
+        area = cv2.resize(truth.view(np.uint8), (detected.shape[1], detected.shape[0]), interpolation=cv2.INTER_AREA)
+        truth = area >= 0.5
+    union = np.count_nonzero(detected | truth)
+    return {
+        "coverage_percent": round(np.count_nonzero(detected) / detected.size * 100.0, 2),
+        "iou": round(np.count_nonzero(detected & truth) / union, 4) if union else 1.0,
+    }
+
+
+def bench_tier(quality: str, width: int, kind: str, seeds: int, repeats: int) -> dict:
+    engine = DetectionEngine(QUALITY_TIERS[quality])
+    samples = []
+    errors = []
+    ious = []
+    analyzed = None
+    for seed in range(seeds):
+        img, truth = make_labeled_scene(width, kind, seed)
+        data = encode_jpeg(img)
+        true_coverage = np.count_nonzero(truth) / truth.size * 100.0
+
+        engine.mask(engine.decode(data))  # warm-up (buffers for this size)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            decoded = engine.decode(data)
+            mask = engine.mask(decoded)
+            cv2.countNonZero(mask)
+            samples.append(time.perf_counter() - start)
+
+        result = score(mask, truth)
+        errors.append(abs(result["coverage_percent"] - true_coverage))
+        ious.append(result["iou"])
+        analyzed = [int(decoded.shape[1]), int(decoded.shape[0])]
+
+    return {
+        "name": f"tier/{quality}/{kind}/{width}",
+        "quality": quality,
+        "width": width,
+        "kind": kind,
+        "analyzed_size": analyzed,
+        "latency": summarize(samples),
+        "accuracy": {
+            "scenes": seeds,
+            "mean_abs_coverage_error": round(float(np.mean(errors)), 3),
+            "max_abs_coverage_error": round(float(np.max(errors)), 3),
+            "mean_iou": round(float(np.mean(ious)), 4),
+            "min_iou": round(float(np.min(ious)), 4),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiers", nargs="+", default=list(QUALITY_TIERS), choices=list(QUALITY_TIERS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SCENE_WIDTHS))
+    parser.add_argument("--kinds", nargs="+", default=list(SCENE_KINDS), choices=SCENE_KINDS)
+    parser.add_argument("--seeds", type=int, default=3, help="scenes per size and kind")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per scene at 640 px; fewer for larger scenes")
+    parser.add_argument("--output", default="bench_quality_tiers.json")
+    args = parser.parse_args()
+
+    results = []
+    for width in args.sizes:
+        repeats = max(1, args.repeats * 640 // width)
+        for kind in args.kinds:
+            for quality in args.tiers:
+                result = bench_tier(quality, width, kind, args.seeds, repeats)
+                latency, accuracy = result["latency"], result["accuracy"]
+                print(
+                    f"{result['name']:<34} p50 {latency['p50_ms']:>9.2f} ms  "
+                    f"err {accuracy['mean_abs_coverage_error']:>6.2f} pp  IoU {accuracy['mean_iou']:.4f}"
+                )
+                results.append(result)
+
+    print()
+    for quality in args.tiers:
+        tier = [r for r in results if r["quality"] == quality]
+        p50 = np.mean([r["latency"]["p50_ms"] for r in tier])
+        error = np.mean([r["accuracy"]["mean_abs_coverage_error"] for r in tier])
+        iou = min(r["accuracy"]["min_iou"] for r in tier)
+        print(f"{quality:<10} mean p50 {p50:>9.2f} ms  mean err {error:>6.2f} pp  worst IoU {iou:.4f}")
+
+    write_results(args.output, "quality_tiers", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Concurrent point redemptions against a local Postgres (see testing_postgres.py):
+
+  legacy  the old router flow: read balance, write the new balance, insert the
+          coupon - three round-trips with no transaction around them
+  rpc     one call to redeem_points() from coupon_functions.sql
+
+Reports latency and whether the final balances add up (points spent vs coupons issued).
+
+    cd backend
+    python -m benchmarks.bench_redemption --output bench_redemption.json
+"""
+import argparse
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import summarize, write_results
+
+from routers.coupons import generate_coupon_code
+from testing_postgres import drop_database, fresh_database
+
+
+def legacy_redeem(conn, user_id, points: int):
+    balance = conn.execute("select wallet_balance from profiles where id = %s", (user_id,)).fetchone()[0]
+    if balance < points:
+        return False
+    conn.execute("update profiles set wallet_balance = %s where id = %s", (balance - points, user_id))
+    conn.execute(
+        "insert into coupon_codes (user_id, code, points_used, value_rupees, status) values (%s, %s, %s, %s, 'active')",
+        (user_id, generate_coupon_code(), points, points * 10),
+    )
+    return True
+
+
+def rpc_redeem(conn, user_id, points: int):
+    import psycopg
+    try:
+        conn.execute("select redeem_points(%s, %s)", (user_id, points))
+        return True
+    except psycopg.Error:
+        return False
+
+
+def run_flow(uri: str, name: str, redeem, users: int, balance: int, attempts: int, workers: int) -> dict:
+    import psycopg
+
+    with psycopg.connect(uri, autocommit=True) as conn:
+        user_ids = [uuid.uuid4() for _ in range(users)]
+        for user_id in user_ids:
+            conn.execute("insert into auth.users (id) values (%s)", (user_id,))
+            conn.execute("update profiles set wallet_balance = %s where id = %s", (balance, user_id))
+
+    calls = [user_id for user_id in user_ids for _ in range(attempts)]
+
+    def work(chunk):
+        samples = []
+        with psycopg.connect(uri, autocommit=True) as conn:
+            for user_id in chunk:
+                start = time.perf_counter()
+                redeem(conn, user_id, 1)
+                samples.append(time.perf_counter() - start)
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        samples = [s for chunk in pool.map(work, [calls[i::workers] for i in range(workers)]) for s in chunk]
+    elapsed = time.perf_counter() - started
+
+    with psycopg.connect(uri, autocommit=True) as conn:
+        issued, remaining = conn.execute(
+            "select (select coalesce(sum(points_used), 0) from coupon_codes where user_id = any(%s)),"
+            " (select sum(wallet_balance) from profiles where id = any(%s))",
+            (user_ids, user_ids),
+        ).fetchone()
+
+    return {
+        "name": f"redeem/{name}",
+        "redemptions": len(calls),
+        "workers": workers,
+        "rps": round(len(calls) / elapsed, 2),
+        "latency": summarize(samples),
+        "points_granted": users * balance,
+        "points_issued_as_coupons": int(issued),
+        "points_left": int(remaining),
+        "consistent": int(issued) + int(remaining) == users * balance and int(issued) <= users * balance,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--balance", type=int, default=50)
+    parser.add_argument("--attempts", type=int, default=100, help="redemptions per user")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--output", default="bench_redemption.json")
+    args = parser.parse_args()
+
+    uri = fresh_database(["backend/coupon_functions.sql"])
+    results = []
+    try:
+        for name, redeem in (("legacy-3-round-trips", legacy_redeem), ("rpc", rpc_redeem)):
+            result = run_flow(uri, name, redeem, args.users, args.balance, args.attempts, args.workers)
+            latency = result["latency"]
+            print(f"{result['name']:<28} {result['rps']:>9.1f} req/s  p50 {latency['p50_ms']:>7.2f} ms  "
+                  f"p95 {latency['p95_ms']:>7.2f} ms  issued {result['points_issued_as_coupons']}"
+                  f"/{result['points_granted']}  consistent={result['consistent']}")
+            results.append(result)
+    finally:
+        drop_database(uri)
+    write_results(args.output, "redemption", results)
+
+
+if __name__ == "__main__":
+    main()
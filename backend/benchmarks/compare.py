@@ -0,0 +1,49 @@
+"""
+Compares two benchmark result files and flags regressions.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 0.10
+
+Exits with status 1 if any benchmark's p50 latency grew by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        payload = json.load(f)
+    return {result["name"]: result for result in payload["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative p50 slowdown")
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    current = load(args.current)
+
+    regressions = 0
+    for name, result in current.items():
+        if name not in baseline:
+            print(f"{name:<36} (new)")
+            continue
+        before = baseline[name]["latency"]["p50_ms"]
+        after = result["latency"]["p50_ms"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:<36} {before:>9.2f} -> {after:>9.2f} ms  ({change:+.1%}){flag}")
+
+    if regressions:
+        print(f"{regressions} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
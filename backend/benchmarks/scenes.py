@@ -0,0 +1,50 @@
+"""Synthetic scenes for benchmarks: textured vegetation, open water, or a mix."""
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+SCENE_KINDS = ("vegetation", "water", "mixed")
+
+# 4:3 frames from a small phone preview up to an 8k drone frame
+SCENE_WIDTHS = (640, 1280, 1920, 4000, 8000)
+
+
+def make_scene(width: int, kind: str = "mixed", seed: int = 0) -> np.ndarray:
+    """Returns a BGR frame of the given width (4:3) and kind."""
+    return make_labeled_scene(width, kind, seed)[0]
+
+
+def make_labeled_scene(width: int, kind: str = "mixed", seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Like make_scene, plus the ground-truth boolean mask of the pixels painted as plants."""
+    height = width * 3 // 4
+    rng = np.random.default_rng(seed)
+
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = (170, 90, 40)
+    img = cv2.add(img, rng.integers(0, 20, (height, width, 3), dtype=np.uint8))
+    if kind == "water":
+        return img, np.zeros((height, width), dtype=bool)
+
+    if kind == "vegetation":
+        plants = np.ones((height, width), dtype=bool)
+    else:
+        cells = (max(height // 200, 2), max(width // 200, 2))
+        coarse = cv2.resize(rng.random(cells).astype(np.float32), (width, height))
+        plants = coarse > 0.5
+
+    # Leaf texture: blocky green noise so edges survive downscaling
+    leaves = cv2.resize(
+        rng.integers(120, 255, (max(height // 4, 1), max(width // 4, 1)), dtype=np.uint8),
+        (width, height),
+        interpolation=cv2.INTER_NEAREST,
+    )
+    img[plants, 0] = 30
+    img[plants, 1] = leaves[plants]
+    img[plants, 2] = 40
+    return img, plants
+
+
+def encode_jpeg(img: np.ndarray, quality: int = 90) -> bytes:
+    _, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes()
@@ -0,0 +1,158 @@
+"""In-memory stand-ins for the Supabase client so API benchmarks need no network."""
+import random
+import re
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+_KEYSET = re.compile(r'(\w+)\.gt\."([^"]+)",and\(\1\.eq\."[^"]+",id\.gt\.([^)]+)\)')
+
+
+class FakeQuery:
+    """
+    Accepts any PostgREST builder chain (async, like AsyncClient). eq, in_, gte, lt,
+    lte, order, limit, insert and the keyset or_ filter are honoured; anything else is ignored.
+    """
+
+    def __init__(self, rows: List[dict]):
+        self.rows = rows
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._insert = None
+
+    def __getattr__(self, name):
+        # select/single/range/... just keep the chain going
+        return lambda *args, **kwargs: self
+
+    def eq(self, column, value):
+        self._filters.append(lambda r: r.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self._filters.append(lambda r: r.get(column) in values)
+        return self
+
+    def gte(self, column, value):
+        self._filters.append(lambda r: r.get(column) is not None and r[column] >= value)
+        return self
+
+    def lt(self, column, value):
+        self._filters.append(lambda r: r.get(column) is not None and r[column] < value)
+        return self
+
+    def lte(self, column, value):
+        self._filters.append(lambda r: r.get(column) is not None and r[column] <= value)
+        return self
+
+    def insert(self, rows):
+        self._insert = [dict(row) for row in (rows if isinstance(rows, list) else [rows])]
+        return self
+
+    def or_(self, expression):
+        match = _KEYSET.fullmatch(expression)
+        if match:
+            column, cursor = match.group(1), (match.group(2), match.group(3))
+            self._filters.append(lambda r: (r[column], r["id"]) > cursor)
+        return self
+
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    async def execute(self):
+        if self._insert is not None:
+            for row in self._insert:
+                row.setdefault("id", str(uuid.uuid4()))
+                row.setdefault("created_at", datetime.utcnow().isoformat() + "+00:00")
+            self.rows.extend(self._insert)
+            return FakeResponse(self._insert)
+        rows = [r for r in self.rows if all(f(r) for f in self._filters)]
+        for column, desc in reversed(self._order):
+            rows.sort(key=lambda r: r.get(column), reverse=desc)
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return FakeResponse(rows)
+
+
+class FakeSupabase:
+    def __init__(self, tables: Dict[str, List[dict]], rpcs: Optional[Dict[str, Callable[[dict], list]]] = None):
+        self.tables = tables
+        self.rpcs = rpcs if rpcs is not None else reference_rpcs(tables.get("submissions", []))
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self.tables.setdefault(name, []))
+
+    def rpc(self, fn: str, params: Optional[dict] = None) -> FakeQuery:
+        return FakeQuery(self.rpcs[fn](params or {}))
+
+
+def reference_rpcs(submissions: List[dict]) -> Dict[str, Callable[[dict], list]]:
+    """Python equivalents of analytics_functions.sql over an in-memory submissions list."""
+
+    def severity_by_area(params):
+        groups = defaultdict(list)
+        for sub in submissions:
+            if sub.get("latitude") and sub.get("longitude") and sub.get("coverage_percent"):
+                groups[(round(sub["latitude"], 2), round(sub["longitude"], 2))].append(sub["coverage_percent"])
+        rows = [
+            {"latitude": lat, "longitude": lon, "severity": sum(c) / len(c), "submissions": len(c)}
+            for (lat, lon), c in groups.items()
+        ]
+        rows.sort(key=lambda r: r["severity"], reverse=True)
+        return rows[:params.get("p_limit", 10)]
+
+    def daily_trend(params):
+        groups = defaultdict(list)
+        for sub in submissions:
+            if sub.get("coverage_percent"):
+                groups[sub["created_at"].split("T")[0]].append(sub["coverage_percent"])
+        return [
+            {"day": day, "average_coverage": sum(c) / len(c), "submissions": len(c)}
+            for day, c in sorted(groups.items())
+        ]
+
+    def status_counts(params):
+        counts = defaultdict(int)
+        for sub in submissions:
+            counts[sub.get("status")] += 1
+        return [{"status": status, "count": count} for status, count in counts.items()]
+
+    return {
+        "analytics_severity_by_area": severity_by_area,
+        "analytics_daily_trend": daily_trend,
+        "analytics_status_counts": status_counts,
+    }
+
+
+def make_submissions(count: int, seed: int = 0) -> List[dict]:
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    statuses = ("pending", "accepted", "completed", "rejected")
+    rows = []
+    for i in range(count):
+        created = start + timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+        rows.append({
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "user_id": f"user-{rng.randint(0, 500)}",
+            "image_url": f"https://example.invalid/{i}.jpg",
+            "latitude": 12.9 + rng.random() * 0.5,
+            "longitude": 77.5 + rng.random() * 0.5,
+            "coverage_percent": round(rng.uniform(0, 100), 2),
+            "status": rng.choice(statuses),
+            "created_at": created.isoformat() + "+00:00",
+            "updated_at": created.isoformat() + "+00:00",
+        })
+    return rows
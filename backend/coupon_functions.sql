@@ -0,0 +1,121 @@
+-- ==============================================================================
+-- AquaWatch - Atomic coupon and park ticket redemption
+-- Run after coupon_schema.sql and park_schema.sql. Each function checks, deducts
+-- and inserts in one transaction, so the backend needs a single RPC per
+-- redemption and concurrent requests can neither double-spend nor half-apply.
+--
+-- Errors use PostgREST's PTxxx SQLSTATEs, which become HTTP status xxx.
+-- ==============================================================================
+
+-- Random code in the AQW-XXXX-XXXX format (uppercase letters and digits)
+create or replace function coupon_generate_code()
+returns text
+language sql volatile
+as $$
+  select 'AQW-' || string_agg(
+    case when i = 5 then '-' else substr('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', 1 + floor(random() * 36)::int, 1) end,
+    '' order by i
+  )
+  from generate_series(1, 9) as i;
+$$;
+
+-- Converts points into a coupon worth 10 rupees per point.
+create or replace function redeem_points(p_user_id uuid, p_points int)
+returns coupon_codes
+language plpgsql
+as $$
+declare
+  v_coupon coupon_codes;
+  v_attempt int := 0;
+begin
+  -- Conditional update takes the row lock, so concurrent redemptions for the
+  -- same user queue here and each sees the balance left by the previous one.
+  update profiles
+     set wallet_balance = wallet_balance - p_points
+   where id = p_user_id
+     and p_points > 0
+     and coalesce(wallet_balance, 0) >= p_points;
+
+  if not found then
+    if not exists (select 1 from profiles where id = p_user_id) then
+      raise exception 'User not found' using errcode = 'PT404';
+    elsif p_points <= 0 then
+      raise exception 'Points must be greater than 0' using errcode = 'PT400';
+    else
+      raise exception 'Insufficient points' using errcode = 'PT400';
+    end if;
+  end if;
+
+  loop
+    begin
+      insert into coupon_codes (user_id, code, points_used, value_rupees, status)
+      values (p_user_id, coupon_generate_code(), p_points, p_points * 10, 'active')
+      returning * into v_coupon;
+      return v_coupon;
+    exception when unique_violation then
+      -- Code collision: only the insert is rolled back, try a fresh code
+      v_attempt := v_attempt + 1;
+      if v_attempt >= 5 then
+        raise;
+      end if;
+    end;
+  end loop;
+end;
+$$;
+
+-- Spends an active coupon on a park ticket.
+create or replace function redeem_park_ticket(p_user_id uuid, p_park_id uuid, p_coupon_code text)
+returns json
+language plpgsql
+as $$
+declare
+  v_coupon coupon_codes;
+  v_park parks_gardens;
+  v_ticket park_tickets;
+begin
+  -- Lock the coupon so a second concurrent redemption waits and then sees it redeemed
+  select * into v_coupon
+    from coupon_codes
+   where code = p_coupon_code and user_id = p_user_id
+   for update;
+  if not found then
+    raise exception 'Invalid Coupon Code' using errcode = 'PT404';
+  end if;
+  if v_coupon.status <> 'active' then
+    raise exception 'Coupon is already used or expired' using errcode = 'PT400';
+  end if;
+
+  select * into v_park from parks_gardens where id = p_park_id;
+  if not found then
+    raise exception 'Park not found' using errcode = 'PT404';
+  end if;
+  if v_coupon.value_rupees < v_park.ticket_price then
+    raise exception 'Insufficient Coupon Value (₹%). Ticket requires ₹%', v_coupon.value_rupees, v_park.ticket_price
+      using errcode = 'PT400';
+  end if;
+
+  update coupon_codes
+     set status = 'redeemed', redeemed_at = timezone('utc'::text, now())
+   where id = v_coupon.id;
+
+  insert into park_tickets (user_id, park_id, coupon_code_id, ticket_status)
+  values (p_user_id, p_park_id, v_coupon.id, 'valid')
+  returning * into v_ticket;
+
+  return json_build_object(
+    'id', v_ticket.id,
+    'park_name', v_park.name,
+    'ticket_status', v_ticket.ticket_status,
+    'issued_at', v_ticket.issued_at,
+    'coupon_code', v_coupon.code
+  );
+end;
+$$;
+
+-- These act on behalf of any user_id, so only the backend (service role) may call them.
+revoke execute on function coupon_generate_code() from public, anon, authenticated;
+revoke execute on function redeem_points(uuid, int) from public, anon, authenticated;
+revoke execute on function redeem_park_ticket(uuid, uuid, text) from public, anon, authenticated;
+grant execute on function coupon_generate_code() to service_role;
+grant execute on function redeem_points(uuid, int) to service_role;
+grant execute on function redeem_park_ticket(uuid, uuid, text) to service_role;
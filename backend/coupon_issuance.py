@@ -0,0 +1,208 @@
+"""
+Bulk coupon issuance for reward campaigns.
+
+Grants (user_id, points) are processed in batches: a few queries check which
+users exist and which generated codes are taken, and one insert writes the
+whole batch, so issuing thousands of coupons takes a handful of round-trips
+per BULK_BATCH_SIZE rows instead of several per coupon. Coupons are issued
+directly; wallet balances are not touched.
+
+The existence checks are GETs with an in.(...) filter in the URL, so they go
+IN_FILTER_MAX values at a time: 100 UUIDs make a ~4 KB request line, under the
+8-16 KB limit of common gateways and proxies (500 would be ~19 KB, a 414).
+"""
+import codecs
+import csv
+import os
+import uuid
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+from postgrest import APIError
+
+BULK_BATCH_SIZE = int(os.getenv("COUPON_BULK_BATCH_SIZE", "500"))
+BULK_MAX_ROWS = int(os.getenv("COUPON_BULK_MAX_ROWS", "50000"))
+CODE_ATTEMPTS = 5
+IN_FILTER_MAX = 100
+
+# (row number, user_id, points) as submitted, before validation
+Grant = Tuple[int, object, object]
+
+
+def _failed(row: int, user_id, points, error: str) -> dict:
+    return {"row": row, "user_id": user_id, "points": points, "status": "failed", "error": error}
+
+
+def _validate(grant: Grant) -> Tuple[Optional[Tuple[int, str, int]], Optional[dict]]:
+    row, user_id, points = grant
+    if points is None:
+        return None, _failed(row, user_id, points, "Expected user_id,points")
+    try:
+        user_id = str(uuid.UUID(str(user_id).strip()))
+    except ValueError:
+        return None, _failed(row, user_id, points, "Invalid user_id")
+    try:
+        points = int(str(points).strip())
+    except ValueError:
+        return None, _failed(row, user_id, points, "Points must be an integer")
+    if points <= 0:
+        return None, _failed(row, user_id, points, "Points must be greater than 0")
+    return (row, user_id, points), None
+
+
+async def _existing(supabase, table: str, column: str, values: List[str]) -> Set[str]:
+    """The values present in table.column, checked IN_FILTER_MAX at a time."""
+    found: Set[str] = set()
+    for i in range(0, len(values), IN_FILTER_MAX):
+        res = await supabase.table(table).select(column).in_(column, values[i:i + IN_FILTER_MAX]).execute()
+        found.update(r[column] for r in res.data or [])
+    return found
+
+
+async def _unused_codes(supabase, count: int, generate_code: Callable[[], str]) -> List[str]:
+    """`count` distinct codes, none of which exist in coupon_codes yet."""
+    codes: List[str] = []
+    for _ in range(CODE_ATTEMPTS):
+        candidates = set(codes)
+        while len(candidates) < count:
+            candidates.add(generate_code())
+        taken = await _existing(supabase, "coupon_codes", "code", list(candidates))
+        codes = [c for c in candidates if c not in taken]
+        if len(codes) == count:
+            return codes
+    raise RuntimeError("Could not generate unique coupon codes")
+
+
+async def _insert_batch(supabase, grants: List[Tuple[int, str, int]], generate_code: Callable[[], str]):
+    """Inserts one coupon per grant; returns (codes, inserted rows by code)."""
+    for attempt in range(1, CODE_ATTEMPTS + 1):
+        codes = await _unused_codes(supabase, len(grants), generate_code)
+        payload = [
+            {"user_id": user_id, "code": code, "points_used": points, "value_rupees": points * 10, "status": "active"}
+            for (_, user_id, points), code in zip(grants, codes)
+        ]
+        try:
+            res = await supabase.table("coupon_codes").insert(payload).execute()
+        except APIError as e:
+            # 23505: a concurrent insert took one of our codes after the check; redo the batch
+            if e.code == "23505" and attempt < CODE_ATTEMPTS:
+                continue
+            raise
+        return codes, {c["code"]: c for c in res.data or []}
+
+
+async def issue_batch(supabase, grants: List[Grant], generate_code: Callable[[], str]) -> List[dict]:
+    """Issues one batch of grants; returns a result per grant in input order."""
+    results: Dict[int, dict] = {}
+    valid = []
+    for grant in grants:
+        parsed, failure = _validate(grant)
+        if failure is not None:
+            results[failure["row"]] = failure
+        else:
+            valid.append(parsed)
+
+    # Database errors fail this batch's rows only: earlier batches are already
+    # issued, so the request must still return the full report
+    if valid:
+        user_ids = list({user_id for _, user_id, _ in valid})
+        try:
+            known = await _existing(supabase, "profiles", "id", user_ids)
+        except (APIError, httpx.HTTPError) as e:
+            print(f"Error checking users during bulk issuance: {e}")
+            known = set()
+            for row, user_id, points in valid:
+                results[row] = _failed(row, user_id, points, "User check failed")
+            valid = []
+        for row, user_id, points in valid:
+            if user_id not in known:
+                results[row] = _failed(row, user_id, points, "User not found")
+        valid = [g for g in valid if g[1] in known]
+
+    if valid:
+        try:
+            codes, inserted = await _insert_batch(supabase, valid, generate_code)
+        except (APIError, RuntimeError) as e:
+            print(f"Error during bulk issuance: {e}")
+            for row, user_id, points in valid:
+                results[row] = _failed(row, user_id, points, "Insert failed")
+        except httpx.HTTPError as e:
+            # e.g. a timeout: the insert may have been committed after all
+            print(f"Error during bulk issuance: {e}")
+            for row, user_id, points in valid:
+                results[row] = _failed(row, user_id, points, "Insert outcome unknown, check before retrying")
+        else:
+            for (row, user_id, points), code in zip(valid, codes):
+                results[row] = {
+                    "row": row, "user_id": user_id, "points": points, "status": "issued",
+                    "coupon_id": inserted.get(code, {}).get("id"), "code": code, "value_rupees": points * 10,
+                }
+
+    return [results[grant[0]] for grant in grants]
+
+
+async def issue_coupons(supabase, grants: AsyncIterator[Grant], generate_code: Callable[[], str],
+                        on_issued: Optional[Callable[[dict], None]] = None,
+                        batch_size: int = BULK_BATCH_SIZE) -> dict:
+    """Issues coupons for every grant, batch by batch, and returns the per-row report."""
+    results: List[dict] = []
+
+    async def flush(batch):
+        for result in await issue_batch(supabase, batch, generate_code):
+            results.append(result)
+            if on_issued is not None and result["status"] == "issued":
+                on_issued(result)
+
+    batch: List[Grant] = []
+    truncated = False
+    async for grant in grants:
+        # Earlier batches are already issued, so stop here rather than fail the request
+        if len(results) + len(batch) >= BULK_MAX_ROWS:
+            truncated = True
+            break
+        batch.append(grant)
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+
+    issued = sum(1 for r in results if r["status"] == "issued")
+    return {"issued": issued, "failed": len(results) - issued, "truncated": truncated, "results": results}
+
+
+async def grants_from_list(items: Iterable[dict]) -> AsyncIterator[Grant]:
+    for row, item in enumerate(items, start=1):
+        yield row, item.get("user_id"), item.get("points")
+
+
+async def grants_from_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Grant]:
+    """Parses a streamed `user_id,points` CSV (header optional) without buffering the body."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    row = 0
+
+    def parse(line: str):
+        nonlocal row
+        if not line.strip():
+            return None
+        fields = next(csv.reader([line]))
+        row += 1
+        if row == 1 and fields and fields[0].strip().lower() == "user_id":
+            row = 0
+            return None
+        if len(fields) != 2:
+            return row, ",".join(fields), None
+        return row, fields[0], fields[1]
+
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            grant = parse(line)
+            if grant is not None:
+                yield grant
+    buffer += decoder.decode(b"", final=True)
+    grant = parse(buffer)
+    if grant is not None:
+        yield grant
@@ -0,0 +1,75 @@
+"""
+Application-wide Supabase access.
+
+One async Supabase client backed by a single pooled httpx.AsyncClient is created
+in the app lifespan and shared by every router, so requests reuse keep-alive
+connections instead of building a client (and new TCP/TLS sessions) per call.
+"""
+import os
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from supabase import AsyncClient, AsyncClientOptions, acreate_client
+
+from metrics import InstrumentedSupabase
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL") # Reusing frontend env var name if shared, or use specific
+SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") # We need service role to deduct points safely
+
+# Connection pool and timeout settings (seconds)
+POOL_MAX_CONNECTIONS = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "50"))
+POOL_MAX_KEEPALIVE = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30"))
+CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+REQUEST_TIMEOUT = float(os.getenv("SUPABASE_REQUEST_TIMEOUT", "15"))
+
+
+def build_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=POOL_MAX_KEEPALIVE,
+            keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        follow_redirects=True,
+    )
+
+
+class Database:
+    def __init__(self):
+        self.client: Optional[AsyncClient] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+    async def connect(self, url: Optional[str] = SUPABASE_URL, key: Optional[str] = SUPABASE_KEY):
+        if self.client is not None:
+            return
+        if not url or not key:
+            print("Warning: Supabase credentials not found in env. Backend logic involving DB will fail.")
+            return
+        self._http = build_http_client()
+        options = AsyncClientOptions(httpx_client=self._http, postgrest_client_timeout=REQUEST_TIMEOUT)
+        self.client = InstrumentedSupabase(await acreate_client(url, key, options=options))
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+        self._http = None
+        self.client = None
+
+    def require(self) -> AsyncClient:
+        if self.client is None:
+            raise HTTPException(status_code=500, detail="Database configuration error")
+        return self.client
+
+
+db = Database()
+
+
+def get_supabase() -> AsyncClient:
+    """FastAPI dependency returning the shared client."""
+    return db.require()
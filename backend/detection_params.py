@@ -0,0 +1,103 @@
+"""
+Tunable parameters of the hyacinth detector.
+
+Kept free of heavy imports (cv2, skimage) so the API process can read the
+parameter version without loading the image stack.
+
+The module constants are the "standard" tier. QUALITY_TIERS holds one
+DetectionConfig per named quality tier, selectable per request.
+"""
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field, replace
+from typing import Dict, Optional, Tuple
+
+# Images wider than this are downscaled before analysis
+MAX_WIDTH = 1000
+
+# Decode large JPEGs with DCT scaling (1/2, 1/4, 1/8) instead of at full size
+REDUCED_JPEG_DECODE = True
+
+# HSV green range (OpenCV scale: H 0-179, S/V 0-255)
+HSV_LOWER = (25, 50, 50)
+HSV_UPPER = (90, 255, 255)
+
+# LBP texture
+LBP_RADIUS = 1
+
+# Canny edge thresholds
+CANNY_LOW = 50
+CANNY_HIGH = 150
+
+# Edge dilation used to grow leaf edges into plant "blobs"
+BLOB_KERNEL_SIZE = 5
+BLOB_ITERATIONS = 2
+
+# Pipeline stages, in order (implemented in image_processing.PIPELINE_STAGES).
+# "texture" computes the LBP map, which does not affect the mask; it is off by default.
+STAGES = ("decode", "resize", "color_mask", "texture", "edges", "combine")
+DEFAULT_STAGES = ("decode", "resize", "color_mask", "edges", "combine")
+REQUIRED_STAGES = ("decode", "color_mask", "combine")
+
+
+@dataclass(frozen=True)
+class DetectionConfig:
+    """One complete set of detector parameters. max_width=None keeps native resolution."""
+
+    max_width: Optional[int] = MAX_WIDTH
+    reduced_jpeg_decode: bool = REDUCED_JPEG_DECODE
+    hsv_lower: Tuple[int, int, int] = HSV_LOWER
+    hsv_upper: Tuple[int, int, int] = HSV_UPPER
+    lbp_radius: int = LBP_RADIUS
+    canny_low: int = CANNY_LOW
+    canny_high: int = CANNY_HIGH
+    blob_kernel_size: int = BLOB_KERNEL_SIZE
+    blob_iterations: int = BLOB_ITERATIONS
+    stages: Tuple[str, ...] = field(default=DEFAULT_STAGES)
+
+    def __post_init__(self):
+        unknown = [stage for stage in self.stages if stage not in STAGES]
+        if unknown:
+            raise ValueError(f"Unknown pipeline stage(s): {', '.join(unknown)}")
+        missing = [stage for stage in REQUIRED_STAGES if stage not in self.stages]
+        if missing:
+            raise ValueError(f"Pipeline is missing required stage(s): {', '.join(missing)}")
+        if list(self.stages) != sorted(self.stages, key=STAGES.index):
+            raise ValueError(f"Pipeline stages must run in the order {', '.join(STAGES)}")
+
+    @property
+    def params(self) -> Dict:
+        return asdict(self)
+
+    @property
+    def version(self) -> str:
+        # Changes whenever any parameter changes, so cached results are invalidated automatically
+        return hashlib.sha1(json.dumps(self.params, sort_keys=True).encode()).hexdigest()[:12]
+
+    def with_stages(self, *extra: str) -> "DetectionConfig":
+        """The same config with extra (diagnostic) stages switched on, kept in pipeline order."""
+        wanted = set(self.stages) | set(extra)
+        return replace(self, stages=tuple(stage for stage in STAGES if stage in wanted))
+
+
+DEFAULT_QUALITY = "standard"
+
+QUALITY_TIERS: Dict[str, DetectionConfig] = {
+    # Mobile previews: about 4x fewer pixels than standard
+    "fast": DetectionConfig(max_width=512, canny_low=20, canny_high=60),
+    "standard": DetectionConfig(),
+    # Admin review: full decode at native resolution
+    "accurate": DetectionConfig(max_width=None, reduced_jpeg_decode=False),
+}
+
+
+def get_config(quality: str = DEFAULT_QUALITY) -> DetectionConfig:
+    try:
+        return QUALITY_TIERS[quality]
+    except KeyError:
+        raise ValueError(f"Unknown quality tier {quality!r} (expected one of {', '.join(QUALITY_TIERS)})")
+
+
+DETECTION_PARAMS = QUALITY_TIERS[DEFAULT_QUALITY].params
+
+DETECTION_VERSION = QUALITY_TIERS[DEFAULT_QUALITY].version
@@ -0,0 +1,67 @@
+"""
+Background delivery of notification emails.
+
+Endpoints enqueue and return immediately; a few worker tasks drain the queue and
+run the (blocking) sender in a thread, so a campaign issuing thousands of coupons
+never waits on mail delivery.
+"""
+import asyncio
+from typing import Callable, List, Optional
+
+
+class EmailQueue:
+    def __init__(self, send: Callable[..., None], workers: int = 2, max_size: int = 10000):
+        self.send = send
+        self.workers = workers
+        self.max_size = max_size
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(self.max_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def enqueue(self, *args) -> bool:
+        """Queues send(*args); False if the queue is full and the email was dropped."""
+        self.start()
+        try:
+            self._queue.put_nowait(args)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"Email queue full, dropping notification: {args}")
+            return False
+
+    async def _worker(self):
+        while True:
+            args = await self._queue.get()
+            try:
+                await asyncio.to_thread(self.send, *args)
+                self.sent += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Email delivery failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def drain(self):
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        """Delivers what is already queued, then stops the workers."""
+        await self.drain()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
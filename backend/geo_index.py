@@ -0,0 +1,210 @@
+"""
+Multi-resolution geohash grid over submissions.
+
+Every point is counted in its geohash cell at each precision 1..MAX_PRECISION, so
+a map viewport at any zoom can be answered from pre-aggregated cells, and the
+finest cells double as buckets for bounding-box point queries.
+"""
+import bisect
+import math
+from typing import Dict, Iterator, List, Optional, Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+MAX_PRECISION = 8  # ~38 m x 19 m cells
+
+# Web map zoom level -> geohash precision giving a few dozen cells per viewport
+_ZOOM_TO_PRECISION = (1, 1, 1, 2, 2, 2, 3, 3, 4, 4, 4, 5, 5, 6, 6, 6, 7, 7, 8)
+
+# Refuse to enumerate more covering cells than this; scan the stored cells instead
+_MAX_COVERING_CELLS = 4096
+
+BBox = Tuple[float, float, float, float]  # (min_lat, min_lon, max_lat, max_lon)
+
+
+def geohash_encode(lat: float, lon: float, precision: int = MAX_PRECISION) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value = (value << 1) | 1
+                lon_lo = mid
+            else:
+                value <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def geohash_bounds(cell: str) -> BBox:
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for c in cell:
+        value = _DECODE[c]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                if bit:
+                    lon_lo = mid
+                else:
+                    lon_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lon_lo, lat_hi, lon_hi
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(height, width) in degrees of a geohash cell at this precision."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def zoom_to_precision(zoom: int) -> int:
+    return _ZOOM_TO_PRECISION[max(0, min(zoom, len(_ZOOM_TO_PRECISION) - 1))]
+
+
+def _intersects(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def covering_cells(bbox: BBox, precision: int) -> Optional[List[str]]:
+    """Geohash cells at `precision` overlapping bbox, or None if there would be too many."""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    height, width = cell_size(precision)
+    rows = int((max_lat - min_lat) / height) + 2
+    cols = int((max_lon - min_lon) / width) + 2
+    if rows * cols > _MAX_COVERING_CELLS:
+        return None
+
+    cells = set()
+    for r in range(rows):
+        lat = min(min_lat + r * height, max_lat)
+        for c in range(cols):
+            lon = min(min_lon + c * width, max_lon)
+            cells.add(geohash_encode(lat, lon, precision))
+    return [cell for cell in cells if _intersects(geohash_bounds(cell), bbox)]
+
+
+class GeoGridIndex:
+    def __init__(self, max_precision: int = MAX_PRECISION):
+        self.max_precision = max_precision
+        # precision -> cell -> [count, coverage_sum, lat_sum, lon_sum]
+        self.cells: Dict[int, Dict[str, List[float]]] = {p: {} for p in range(1, max_precision + 1)}
+        # finest cell -> submission id -> point record
+        self.members: Dict[str, Dict[str, dict]] = {}
+        # Sorted finest cells: all cells under a coarse prefix form one contiguous range
+        self._finest: List[str] = []
+
+    def add(self, point_id: str, lat: float, lon: float, coverage: float, status: str) -> str:
+        cell = geohash_encode(lat, lon, self.max_precision)
+        for p in range(1, self.max_precision + 1):
+            self._bump(self.cells[p], cell[:p], lat, lon, coverage, +1)
+        bucket = self.members.get(cell)
+        if bucket is None:
+            bucket = self.members[cell] = {}
+            bisect.insort(self._finest, cell)
+        bucket[point_id] = {
+            "id": point_id, "latitude": lat, "longitude": lon,
+            "coverage_percent": coverage, "status": status,
+        }
+        return cell
+
+    def remove(self, point_id: str, cell: str):
+        bucket = self.members.get(cell, {})
+        point = bucket.pop(point_id, None)
+        if point is None:
+            return
+        if not bucket:
+            del self.members[cell]
+            del self._finest[bisect.bisect_left(self._finest, cell)]
+        for p in range(1, self.max_precision + 1):
+            self._bump(self.cells[p], cell[:p], point["latitude"], point["longitude"], point["coverage_percent"], -1)
+
+    @staticmethod
+    def _bump(cells: dict, key: str, lat: float, lon: float, coverage: float, sign: int):
+        entry = cells.get(key)
+        if entry is None:
+            entry = cells[key] = [0, 0.0, 0.0, 0.0]
+        entry[0] += sign
+        entry[1] += sign * coverage
+        entry[2] += sign * lat
+        entry[3] += sign * lon
+        if entry[0] == 0:
+            del cells[key]
+
+    def _cells_in(self, bbox: BBox, precision: int) -> Iterator[Tuple[str, List[float]]]:
+        stored = self.cells[precision]
+        candidates = covering_cells(bbox, precision)
+        if candidates is None or len(candidates) > len(stored):
+            candidates = [cell for cell in stored if _intersects(geohash_bounds(cell), bbox)]
+        for cell in candidates:
+            entry = stored.get(cell)
+            if entry is not None:
+                yield cell, entry
+
+    def clusters(self, bbox: BBox, precision: int) -> List[dict]:
+        """Pre-aggregated count, average coverage and centroid per cell in bbox."""
+        precision = max(1, min(precision, self.max_precision))
+        results = []
+        for cell, (count, coverage_sum, lat_sum, lon_sum) in self._cells_in(bbox, precision):
+            results.append({
+                "cell": cell,
+                "count": int(count),
+                "average_coverage": round(coverage_sum / count, 1),
+                "latitude": lat_sum / count,
+                "longitude": lon_sum / count,
+                "bounds": geohash_bounds(cell),
+            })
+        results.sort(key=lambda r: r["count"], reverse=True)
+        return results
+
+    def points(self, bbox: BBox, limit: int) -> List[dict]:
+        """Individual submissions inside bbox, at most `limit`."""
+        # Cover the viewport with the finest precision that needs only a modest
+        # number of cells, then walk the finest cells under each prefix.
+        prefixes = None
+        for precision in range(self.max_precision, 0, -1):
+            prefixes = covering_cells(bbox, precision)
+            if prefixes is not None and len(prefixes) <= 256:
+                break
+
+        min_lat, min_lon, max_lat, max_lon = bbox
+        results = []
+        for prefix in sorted(prefixes or []):
+            start = bisect.bisect_left(self._finest, prefix)
+            end = bisect.bisect_left(self._finest, prefix + "~")  # '~' sorts after every base32 char
+            for cell in self._finest[start:end]:
+                for point in self.members[cell].values():
+                    if min_lat <= point["latitude"] <= max_lat and min_lon <= point["longitude"] <= max_lon:
+                        results.append(point)
+                        if len(results) >= limit:
+                            return results
+        return results
@@ -1,135 +1,652 @@
 
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
 import cv2
 import numpy as np
+from PIL import Image
 from skimage.feature import local_binary_pattern
 
-def detect_hyacinth(image_bytes: bytes) -> float:
+from mask_encoding import component_stats, encode_mask
+from detection_params import (
+    MAX_WIDTH, REDUCED_JPEG_DECODE, HSV_LOWER, HSV_UPPER, LBP_RADIUS,
+    CANNY_LOW, CANNY_HIGH, BLOB_KERNEL_SIZE, BLOB_ITERATIONS,
+    DEFAULT_QUALITY, QUALITY_TIERS, DetectionConfig, get_config,
+)
+
+class StageClock:
+    """
+    Records per-stage wall time into a dict: call lap(name) at the end of each
+    stage. A clock built with timings=None does nothing.
+    """
+
+    def __init__(self, timings: Optional[Dict[str, float]] = None):
+        self.timings = timings
+        self._last = time.perf_counter() if timings is not None else 0.0
+
+    def lap(self, name: str):
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings[name] = self.timings.get(name, 0.0) + (now - self._last)
+        self._last = now
+
+def compute_hyacinth_mask(img: np.ndarray, timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """
+    Returns the binary (0/255) hyacinth mask for a decoded BGR image:
+    green in HSV AND close to leaf edges.
+
+    This is the original, allocating implementation, kept as the reference for
+    DetectionEngine (which the detect_* functions use) and for benchmarks.
+
+    If a timings dict is passed, seconds spent in each stage are added to it.
+    """
+    clock = StageClock(timings)
+
+    # 2. HSV Color Filtering
+    hsv_img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    
+    # User suggested range: H in [25, 85], S in [60, 255], V in [60, 255]
+    # Note: OpenCV H range is [0, 179], S and V are [0, 255]
+    # 25-85 in standard 0-360 scale corresponds to approx 12-42 in OpenCV's H scale.
+    # However, the user said "H in [25, 85]" likely referring to OpenCV scale or standard. 
+    # Vegetation green is usually around 30-90 in 360 scale -> 15-45 in OpenCV.
+    # But if the user specifically gave [25, 85], I should respect it or verify.
+    # Let's assume user means standard degree (0-360) / 2 for OpenCV? 
+    # OR user means raw values. 
+    # Standard green in OpenCV is around H=60. 
+    # Let's stick closer to standard vegetation detection: H=[35, 85] (OpenCV 0-180 scale would be very different).
+    # WAIT. A common range for GREEN in OpenCV is (40, 40, 40) to (70, 255, 255).
+    # Range [25, 85] in OpenCV is actually quite wide covering yellow to cyan. This is reasonable for hyacinth which can be yellowish-green.
+    
+    lower_green = np.array(HSV_LOWER) # Using slightly wider lower bound on S/V for shadows
+    upper_green = np.array(HSV_UPPER)
+    
+    mask_hsv = cv2.inRange(hsv_img, lower_green, upper_green)
+    clock.lap("hsv_mask")
+
+    # 3. LBP Texture Filtering
+    # Convert to grayscale
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    clock.lap("grayscale")
+    
+    # LBP parameters
+    radius = LBP_RADIUS
+    n_points = 8 * radius
+    
+    # Compute LBP
+    lbp = local_binary_pattern(gray, n_points, radius, method='uniform')
+    clock.lap("lbp")
+    
+    # Hyacinth texture is complex, not smooth like water.
+    # Water/Smooth areas tends to have specific LBP codes or low variance.
+    # Let's use an entropy-like approach or simply filter out very uniform areas if needed.
+    # However, a simpler approch for "texture" in this context might be high frequency variation.
+    # Let's try combining with Edge detection as a proxy for "roughness" in the masked area.
+    # OR we can assume "Vegetation" has a specific LBP histogram.
+    # Given the user instruction "Use LBP map to reduce false positives from smooth green areas",
+    # We can look for edges/texture.
+    # Let's use a simplified texture check: Uniform LBP areas (low contrast) are likely not Hyacinth clumps.
+    # Hyacinth has leaves, edges.
+    
+    # Simplified LBP usage: Just ensuring there is "content" (edges/variation)
+    # Actually, let's use the Edge Detection as the primary texture confirmation as user anticipated.
+    
+    # 4. Edge Detection (Canny)
+    # Use lower thresholds to catch leaf textures
+    edges = cv2.Canny(gray, CANNY_LOW, CANNY_HIGH)
+    clock.lap("canny")
+    
+    # Dilate edges to connect clumps
+    kernel = np.ones((3,3), np.uint8)
+    edges_dilated = cv2.dilate(edges, kernel, iterations=1)
+    clock.lap("edge_dilate")
+    
+    # 5. Combine Masks
+    # We want pixels that are:
+    # a) Green (HSV)
+    # b) AND (have texture OR are near edges)
+    
+    # If we just AND them, we might lose inner parts of leaves.
+    # So we use Edge density to validate the Green blobs.
+    
+    # Alternative Interpretation of user request:
+    # "Filter pixels that fall in HSV ... Reduce false positives ... Combine the masks"
+    # Let's strict AND for now: Green AND (Edge/Texture).
+    # But to avoid losing the "inside" of the plant leaves (which are smooth green),
+    # we usually fill holes in the edge mask or use LBP texture variance.
+    
+    # Let's iterate: 
+    # Valid Hyacinth = Green Mask AND (LBP High Variance OR Edges near)
+    # LBP 'uniform' method output values: 0 to n_points+1.
+    # We can treat specific LBP patterns as "smooth".
+    
+    # Let's keep it robust but simple:
+    # 1. Get Green Mask.
+    # 2. Removing large "smooth" green areas (like algal bloom or reflection) might be tricky with just lines.
+    # Let's rely on the HSV mask primarily and use edges to remove "flat" green water if any.
+    
+    # REFINED STRATEGY for "Combine":
+    # Green Mask is the candidate. 
+    # Check if the Green Mask area has texture.
+    # If a connected component of Green Mask has NO edges/texture, it's likely algae/scum, not hyacinth.
+    # But pixel-wise AND might be too aggressive.
+    # Let's stick to the User's instruction: "Only count pixels that satisfy color + texture + edge support."
+    
+    # Let's use a "Textured Green" mask.
+    valid_mask = cv2.bitwise_and(mask_hsv, mask_hsv, mask=edges_dilated)
+    clock.lap("valid_mask")
+    
+    # To be safe and not over-reduced, let's allow "Green" that is close to "Edges".
+    # So we dilate the edge mask significantly to cover the "blobs" of plants.
+    edges_blob_mask = cv2.dilate(edges, np.ones((BLOB_KERNEL_SIZE, BLOB_KERNEL_SIZE), np.uint8), iterations=BLOB_ITERATIONS)
+    clock.lap("blob_dilate")
+    
+    final_mask = cv2.bitwise_and(mask_hsv, edges_blob_mask)
+    clock.lap("combine")
+    
+    return final_mask
+
+# Declarative detection pipeline
+#
+# A DetectionConfig (detection_params.py) names the stages to run, in order, and
+# their parameters. Each stage is a function (engine, frame, clock) that reads
+# and adds entries of `frame` ("bytes" -> "img" -> "green", "edges" -> "mask")
+# and laps its own timings, so tiers differ only in configuration.
+
+def _stage_decode(engine: "DetectionEngine", frame: Dict[str, Any], clock: StageClock):
+    config = engine.config
+    frame["img"] = _decode(frame["bytes"], config.max_width, config.reduced_jpeg_decode)
+    clock.lap("decode")
+
+def _stage_resize(engine: "DetectionEngine", frame: Dict[str, Any], clock: StageClock):
+    frame["img"] = _resize(frame["img"], engine.config.max_width)
+    clock.lap("resize")
+
+def _stage_color_mask(engine: "DetectionEngine", frame: Dict[str, Any], clock: StageClock):
+    b = frame["buffers"]
+    cv2.cvtColor(frame["img"], cv2.COLOR_BGR2HSV, dst=b["hsv"])
+    cv2.inRange(b["hsv"], engine.lower, engine.upper, dst=b["green"])
+    frame["green"] = b["green"]
+    clock.lap("hsv_mask")
+
+def _gray(frame: Dict[str, Any], clock: StageClock) -> np.ndarray:
+    # Shared by the texture and edges stages; converted once per frame
+    if "gray" not in frame:
+        cv2.cvtColor(frame["img"], cv2.COLOR_BGR2GRAY, dst=frame["buffers"]["gray"])
+        frame["gray"] = frame["buffers"]["gray"]
+        clock.lap("grayscale")
+    return frame["gray"]
+
+def _stage_texture(engine: "DetectionEngine", frame: Dict[str, Any], clock: StageClock):
+    radius = engine.config.lbp_radius
+    engine.lbp = local_binary_pattern(_gray(frame, clock), 8 * radius, radius, method='uniform')
+    clock.lap("lbp")
+
+def _stage_edges(engine: "DetectionEngine", frame: Dict[str, Any], clock: StageClock):
+    b = frame["buffers"]
+    cv2.Canny(_gray(frame, clock), engine.config.canny_low, engine.config.canny_high, edges=b["edges"])
+    frame["edges"] = b["edges"]
+    clock.lap("canny")
+
+def _stage_combine(engine: "DetectionEngine", frame: Dict[str, Any], clock: StageClock):
+    b = frame["buffers"]
+    green = frame["green"]
+    if "edges" not in frame:
+        # Color only
+        np.copyto(b["mask"], green)
+        frame["mask"] = b["mask"]
+        clock.lap("combine")
+        return
+
+    if engine.compute_valid_mask:
+        cv2.dilate(frame["edges"], engine.edge_kernel, dst=b["edges_dilated"], iterations=1)
+        clock.lap("edge_dilate")
+        b["valid"][:] = 0
+        cv2.bitwise_and(green, green, dst=b["valid"], mask=b["edges_dilated"])
+        engine.valid_mask = b["valid"]
+        clock.lap("valid_mask")
+
+    cv2.dilate(frame["edges"], engine.blob_kernel, dst=b["blob"], iterations=engine.config.blob_iterations)
+    clock.lap("blob_dilate")
+
+    cv2.bitwise_and(green, b["blob"], dst=b["mask"])
+    frame["mask"] = b["mask"]
+    clock.lap("combine")
+
+PIPELINE_STAGES: Dict[str, Callable[["DetectionEngine", Dict[str, Any], StageClock], None]] = {
+    "decode": _stage_decode,
+    "resize": _stage_resize,
+    "color_mask": _stage_color_mask,
+    "texture": _stage_texture,
+    "edges": _stage_edges,
+    "combine": _stage_combine,
+}
+_DECODE_STAGES = ("decode", "resize")
+
+class DetectionEngine:
+    """
+    Runs the stages of a DetectionConfig without per-call allocations.
+
+    Kernels and HSV bounds are built once, and every mask stage writes into
+    buffers preallocated for the frame size (via dst=), so repeated calls on
+    same-sized images allocate nothing. With the default (standard) config the
+    mask equals compute_hyacinth_mask(img). Stages that do not affect the result
+    (the LBP map and the edge-AND "valid" mask) are skipped unless enabled; when
+    enabled they are kept on the engine (lbp, valid_mask) for inspection.
+
+    Not thread-safe: use one engine per thread (see get_detection_engine).
+    The returned mask is a view of an internal buffer, overwritten by the next call.
+    """
+
+    MAX_SHAPES = 4
+    # Buffers take 8-10 bytes per pixel. Frames over this budget (e.g. native-
+    # resolution "accurate" input) get buffers for the call only, so a worker
+    # doesn't hold hundreds of MB for its lifetime.
+    MAX_BUFFER_BYTES = int(os.getenv("DETECTION_BUFFER_MAX_BYTES", str(64 * 1024 * 1024)))
+
+    def __init__(self, config: Optional[DetectionConfig] = None, compute_lbp: bool = False,
+                 compute_valid_mask: bool = False):
+        config = config or get_config(DEFAULT_QUALITY)
+        if compute_lbp:
+            config = config.with_stages("texture")
+        self.config = config
+        self.compute_valid_mask = compute_valid_mask
+        self.lower = np.array(config.hsv_lower, np.uint8)
+        self.upper = np.array(config.hsv_upper, np.uint8)
+        self.edge_kernel = np.ones((3, 3), np.uint8)
+        self.blob_kernel = np.ones((config.blob_kernel_size, config.blob_kernel_size), np.uint8)
+        self.decode_stages = [PIPELINE_STAGES[s] for s in config.stages if s in _DECODE_STAGES]
+        self.mask_stages = [PIPELINE_STAGES[s] for s in config.stages if s not in _DECODE_STAGES]
+        self.lbp: Optional[np.ndarray] = None
+        self.valid_mask: Optional[np.ndarray] = None
+        # (height, width) -> buffers; a few sizes so tiles at image edges don't thrash
+        self._buffers: "OrderedDict[Tuple[int, int], Dict[str, np.ndarray]]" = OrderedDict()
+
+    def _buffers_for(self, height: int, width: int) -> Dict[str, np.ndarray]:
+        key = (height, width)
+        buffers = self._buffers.get(key)
+        if buffers is None:
+            buffers = {
+                "hsv": np.empty((height, width, 3), np.uint8),
+                "green": np.empty((height, width), np.uint8),
+                "gray": np.empty((height, width), np.uint8),
+                "edges": np.empty((height, width), np.uint8),
+                "blob": np.empty((height, width), np.uint8),
+                "mask": np.empty((height, width), np.uint8),
+            }
+            if self.compute_valid_mask:
+                buffers["edges_dilated"] = np.empty((height, width), np.uint8)
+                buffers["valid"] = np.empty((height, width), np.uint8)
+            size = sum(b.nbytes for b in buffers.values())
+            if size > self.MAX_BUFFER_BYTES:
+                return buffers
+            self._buffers[key] = buffers
+            while len(self._buffers) > self.MAX_SHAPES or self.buffer_bytes() > self.MAX_BUFFER_BYTES:
+                self._buffers.popitem(last=False)
+        else:
+            self._buffers.move_to_end(key)
+        return buffers
+
+    def buffer_bytes(self) -> int:
+        """Memory held by the cached buffer sets."""
+        return sum(b.nbytes for buffers in self._buffers.values() for b in buffers.values())
+
+    def decode(self, image_bytes: bytes, timings: Optional[Dict[str, float]] = None) -> Optional[np.ndarray]:
+        """Runs the decode and resize stages. Returns None if the image cannot be decoded."""
+        clock = StageClock(timings)
+        frame: Dict[str, Any] = {"bytes": image_bytes}
+        for stage in self.decode_stages:
+            stage(self, frame, clock)
+            if frame["img"] is None:
+                return None
+        return frame.get("img")
+
+    def mask(self, img: np.ndarray, timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """Runs the mask stages (color_mask through combine) on a decoded BGR image."""
+        clock = StageClock(timings)
+        frame: Dict[str, Any] = {"img": img, "buffers": self._buffers_for(img.shape[0], img.shape[1])}
+        for stage in self.mask_stages:
+            stage(self, frame, clock)
+        return frame["mask"]
+
+_thread_engines = threading.local()
+
+def get_detection_engine(quality: str = DEFAULT_QUALITY) -> DetectionEngine:
+    """The calling thread's DetectionEngine for a quality tier (one per pool worker process / tile thread)."""
+    engines = getattr(_thread_engines, "engines", None)
+    if engines is None:
+        engines = _thread_engines.engines = {}
+    engine = engines.get(quality)
+    if engine is None:
+        engine = engines[quality] = DetectionEngine(get_config(quality))
+    return engine
+
+# EXIF orientations 5-8 rotate the image by 90 degrees, swapping width and height
+_TRANSPOSING_ORIENTATIONS = (5, 6, 7, 8)
+
+_REDUCED_JPEG_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+def _read_header(image_bytes: bytes) -> Optional[Tuple[str, int, int]]:
+    """Returns (format, width, height) after EXIF orientation, reading only the header."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as header:
+            width, height = header.size
+            orientation = header.getexif().get(0x0112, 1)
+            if orientation in _TRANSPOSING_ORIENTATIONS:
+                width, height = height, width
+            return header.format, width, height
+    except Exception:
+        return None
+
+def _decode(image_bytes: bytes, max_width: Optional[int], reduced: bool) -> Optional[np.ndarray]:
+    nparr = np.frombuffer(image_bytes, np.uint8)
+
+    flag = cv2.IMREAD_COLOR
+    header = _read_header(image_bytes) if reduced and max_width else None
+    if header is not None and header[0] == "JPEG":
+        for factor, reduced_flag in _REDUCED_JPEG_FLAGS:
+            if header[1] // factor >= max_width:
+                flag = reduced_flag
+                break
+
+    return cv2.imdecode(nparr, flag)
+
+def _resize(img: np.ndarray, max_width: Optional[int]) -> np.ndarray:
+    # Resize the rest of the way (INTER_AREA averages, matching the old full-size path)
+    height, width = img.shape[:2]
+    if max_width and width > max_width:
+        scale_percent = max_width / width
+        width = int(img.shape[1] * scale_percent)
+        height = int(img.shape[0] * scale_percent)
+        img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+    return img
+
+def decode_image(image_bytes: bytes, max_width: Optional[int] = MAX_WIDTH) -> Optional[np.ndarray]:
+    """
+    Decodes an upload to a BGR image no wider than max_width (None: native size).
+
+    For JPEGs the header is read first and the largest DCT scaling mode
+    (1/8, 1/4, 1/2) that still yields at least max_width is used, so a 12 MP photo
+    is never decoded at full resolution. OpenCV applies the EXIF orientation.
+    """
+    img = _decode(image_bytes, max_width, REDUCED_JPEG_DECODE)
+    if img is None:
+        return None
+    return _resize(img, max_width)
+
+def detect_hyacinth(image_bytes: bytes, timings: Optional[Dict[str, float]] = None,
+                    quality: str = DEFAULT_QUALITY, strict: bool = False) -> float:
     """
     Analyzes an image to determine the percentage coverage of water hyacinth
     using a hybrid approach: HSV Color + LBP Texture + Edge Detection.
+
+    `quality` names the tier (see detection_params.QUALITY_TIERS).
+    If a timings dict is passed, seconds spent in each stage are added to it.
+    Returns 0.0 for bytes that can't be decoded or analyzed; with strict=True it
+    raises instead (ValueError for undecodable input).
     """
     try:
-        # 1. Decode image from bytes
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
+        engine = get_detection_engine(quality)
+
+        # 1. Decode image from bytes (at reduced scale when possible)
+        img = engine.decode(image_bytes, timings)
         if img is None:
+            if strict:
+                raise ValueError("Could not decode image")
             return 0.0
 
-        # Resize for faster processing if image is too large (optional, but good for performance)
-        height, width = img.shape[:2]
-        if width > 1000:
-            scale_percent = 1000 / width
-            width = int(img.shape[1] * scale_percent)
-            height = int(img.shape[0] * scale_percent)
-            img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
-
-        # 2. HSV Color Filtering
-        hsv_img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        
-        # User suggested range: H in [25, 85], S in [60, 255], V in [60, 255]
-        # Note: OpenCV H range is [0, 179], S and V are [0, 255]
-        # 25-85 in standard 0-360 scale corresponds to approx 12-42 in OpenCV's H scale.
-        # However, the user said "H in [25, 85]" likely referring to OpenCV scale or standard. 
-        # Vegetation green is usually around 30-90 in 360 scale -> 15-45 in OpenCV.
-        # But if the user specifically gave [25, 85], I should respect it or verify.
-        # Let's assume user means standard degree (0-360) / 2 for OpenCV? 
-        # OR user means raw values. 
-        # Standard green in OpenCV is around H=60. 
-        # Let's stick closer to standard vegetation detection: H=[35, 85] (OpenCV 0-180 scale would be very different).
-        # WAIT. A common range for GREEN in OpenCV is (40, 40, 40) to (70, 255, 255).
-        # Range [25, 85] in OpenCV is actually quite wide covering yellow to cyan. This is reasonable for hyacinth which can be yellowish-green.
-        
-        lower_green = np.array([25, 50, 50]) # Using slightly wider lower bound on S/V for shadows
-        upper_green = np.array([90, 255, 255]) 
-        
-        mask_hsv = cv2.inRange(hsv_img, lower_green, upper_green)
-
-        # 3. LBP Texture Filtering
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # LBP parameters
-        radius = 1
-        n_points = 8 * radius
-        
-        # Compute LBP
-        lbp = local_binary_pattern(gray, n_points, radius, method='uniform')
-        
-        # Hyacinth texture is complex, not smooth like water.
-        # Water/Smooth areas tends to have specific LBP codes or low variance.
-        # Let's use an entropy-like approach or simply filter out very uniform areas if needed.
-        # However, a simpler approch for "texture" in this context might be high frequency variation.
-        # Let's try combining with Edge detection as a proxy for "roughness" in the masked area.
-        # OR we can assume "Vegetation" has a specific LBP histogram.
-        # Given the user instruction "Use LBP map to reduce false positives from smooth green areas",
-        # We can look for edges/texture.
-        # Let's use a simplified texture check: Uniform LBP areas (low contrast) are likely not Hyacinth clumps.
-        # Hyacinth has leaves, edges.
-        
-        # Simplified LBP usage: Just ensuring there is "content" (edges/variation)
-        # Actually, let's use the Edge Detection as the primary texture confirmation as user anticipated.
-        
-        # 4. Edge Detection (Canny)
-        # Use lower thresholds to catch leaf textures
-        edges = cv2.Canny(gray, 50, 150)
-        
-        # Dilate edges to connect clumps
-        kernel = np.ones((3,3), np.uint8)
-        edges_dilated = cv2.dilate(edges, kernel, iterations=1)
-        
-        # 5. Combine Masks
-        # We want pixels that are:
-        # a) Green (HSV)
-        # b) AND (have texture OR are near edges)
-        
-        # If we just AND them, we might lose inner parts of leaves.
-        # So we use Edge density to validate the Green blobs.
-        
-        # Alternative Interpretation of user request:
-        # "Filter pixels that fall in HSV ... Reduce false positives ... Combine the masks"
-        # Let's strict AND for now: Green AND (Edge/Texture).
-        # But to avoid losing the "inside" of the plant leaves (which are smooth green),
-        # we usually fill holes in the edge mask or use LBP texture variance.
-        
-        # Let's iterate: 
-        # Valid Hyacinth = Green Mask AND (LBP High Variance OR Edges near)
-        # LBP 'uniform' method output values: 0 to n_points+1.
-        # We can treat specific LBP patterns as "smooth".
-        
-        # Let's keep it robust but simple:
-        # 1. Get Green Mask.
-        # 2. Removing large "smooth" green areas (like algal bloom or reflection) might be tricky with just lines.
-        # Let's rely on the HSV mask primarily and use edges to remove "flat" green water if any.
-        
-        # REFINED STRATEGY for "Combine":
-        # Green Mask is the candidate. 
-        # Check if the Green Mask area has texture.
-        # If a connected component of Green Mask has NO edges/texture, it's likely algae/scum, not hyacinth.
-        # But pixel-wise AND might be too aggressive.
-        # Let's stick to the User's instruction: "Only count pixels that satisfy color + texture + edge support."
-        
-        # Let's use a "Textured Green" mask.
-        valid_mask = cv2.bitwise_and(mask_hsv, mask_hsv, mask=edges_dilated)
-        
-        # To be safe and not over-reduced, let's allow "Green" that is close to "Edges".
-        # So we dilate the edge mask significantly to cover the "blobs" of plants.
-        edges_blob_mask = cv2.dilate(edges, np.ones((5,5), np.uint8), iterations=2)
-        
-        final_mask = cv2.bitwise_and(mask_hsv, edges_blob_mask)
+        final_mask = engine.mask(img, timings)
+        clock = StageClock(timings)
         
         # Calculate Percentage
-        valid_pixels = np.count_nonzero(final_mask)
+        valid_pixels = cv2.countNonZero(final_mask)
         total_pixels = img.shape[0] * img.shape[1]
         
         percentage = (valid_pixels / total_pixels) * 100.0
+        clock.lap("count")
         
         return round(min(percentage, 100.0), 2)
         
     except Exception as e:
+        if strict:
+            raise
         print(f"Error in image processing: {e}")
         return 0.0
 
+def detect_hyacinth_overlay(
+    image_bytes: bytes,
+    scale: float = 0.5,
+    encoding: str = "png",
+    timings: Optional[Dict[str, float]] = None,
+    quality: str = DEFAULT_QUALITY,
+) -> dict:
+    """
+    Like detect_hyacinth, but also returns the mask that was counted, encoded
+    compactly at `scale` (see mask_encoding.py), and connected-component stats.
+    Raises ValueError if the image cannot be decoded.
+    """
+    engine = get_detection_engine(quality)
+    img = engine.decode(image_bytes, timings)
+    if img is None:
+        raise ValueError("Could not decode image")
+
+    final_mask = engine.mask(img, timings)
+    clock = StageClock(timings)
+
+    valid_pixels = cv2.countNonZero(final_mask)
+    percentage = valid_pixels / final_mask.size * 100.0
+    clock.lap("count")
+
+    components = component_stats(final_mask)
+    clock.lap("components")
+    overlay = encode_mask(final_mask, scale, encoding)
+    clock.lap("encode_overlay")
+
+    return {
+        "coverage_percent": round(min(percentage, 100.0), 2),
+        "quality": quality,
+        "width": int(img.shape[1]),
+        "height": int(img.shape[0]),
+        "components": components,
+        "overlay": overlay,
+    }
+
+def warm_up(width: int = 640) -> Dict[str, float]:
+    """
+    Runs every quality tier once on a dummy JPEG, so the codecs, OpenCV's lazily
+    created thread pool and each tier's engine and buffers exist before the first
+    real upload. Returns seconds spent per tier.
+    """
+    rng = np.random.default_rng(0)
+    img = np.empty((width * 3 // 4, width, 3), np.uint8)
+    img[:] = (30, 160, 40)
+    img = cv2.add(img, rng.integers(0, 60, img.shape, dtype=np.uint8))
+    _, encoded = cv2.imencode(".jpg", img)
+    data = encoded.tobytes()
+
+    seconds = {}
+    for quality in QUALITY_TIERS:
+        started = time.perf_counter()
+        detect_hyacinth(data, quality=quality)
+        seconds[quality] = time.perf_counter() - started
+    return seconds
+
+# Tiled analysis for very large orthomosaics
+
+# The mask looks at most 4 px away (Canny 3x3 + two 5x5 dilations), so a small
+# overlap is enough to make tile seams invisible in the result.
+DEFAULT_TILE_SIZE = 2048
+DEFAULT_TILE_OVERLAP = 16
+
+class TiffRegions:
+    """
+    Read-only (height, width, samples) view of a compressed or tiled TIFF that
+    decodes only the tiles (or strips) a slice touches, so a compressed
+    orthomosaic is read region by region instead of in full. Supports the
+    [y0:y1, x0:x1, ...] slicing the tiled detector does; safe to share between
+    tile threads.
+    """
+
+    def __init__(self, path: str):
+        import tifffile
+        self._tiff = tifffile.TiffFile(path)
+        page = self._page = self._tiff.pages.first
+        if page.planarconfig != 1 or len(page.chunked) != 3:
+            self._tiff.close()
+            raise ValueError("Unsupported TIFF layout (expected interleaved samples)")
+        self.shape = page.shape
+        self.dtype = page.dtype
+        self.ndim = len(self.shape)
+        self._segment = page.chunks[:2]  # tile or strip (rows, cols)
+        self._per_row = page.chunked[1]
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._tiff.close()
+
+    def _read_segment(self, index: int) -> np.ndarray:
+        page = self._page
+        with self._lock:
+            handle = self._tiff.filehandle
+            handle.seek(page.dataoffsets[index])
+            data = handle.read(page.databytecounts[index])
+        try:
+            segment, _, _ = page.decode(data, index, jpegtables=page.jpegtables, jpegheader=page.jpegheader)
+        except Exception as e:
+            # e.g. a compression whose codec (imagecodecs) is missing
+            raise ValueError(f"Could not decode TIFF tile: {e}") from e
+        return segment[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        height, width = self.shape[:2]
+        y0, y1, _ = key[0].indices(height)
+        x0, x1, _ = (key[1] if len(key) > 1 else slice(None)).indices(width)
+        seg_h, seg_w = self._segment
+
+        out = np.empty((y1 - y0, x1 - x0) + tuple(self.shape[2:]), self.dtype)
+        for row in range(y0 // seg_h, (y1 - 1) // seg_h + 1):
+            for col in range(x0 // seg_w, (x1 - 1) // seg_w + 1):
+                segment = self._read_segment(row * self._per_row + col)
+                sy0, sx0 = row * seg_h, col * seg_w
+                ty0, ty1 = max(y0, sy0), min(y1, sy0 + seg_h)
+                tx0, tx1 = max(x0, sx0), min(x1, sx0 + seg_w)
+                out[ty0 - y0:ty1 - y0, tx0 - x0:tx1 - x0] = (
+                    segment[ty0 - sy0:ty1 - sy0, tx0 - sx0:tx1 - sx0].reshape(ty1 - ty0, tx1 - tx0, *self.shape[2:])
+                )
+        return out[(slice(None), slice(None)) + key[2:]]
+
+def open_large_image(path: str) -> Tuple[Any, bool]:
+    """
+    Opens an image for tiled reading. Returns (array, is_rgb).
+
+    Raw .npy files and uncompressed TIFFs are memory-mapped, so only the pages of
+    the tiles being processed are ever resident. Compressed or tiled TIFFs are
+    read one TIFF tile/strip at a time (TiffRegions). Other compressed formats
+    (JPEG, PNG) cannot be read by region and are decoded once in full.
+    Raises ValueError for images without at least 3 color channels.
+    """
+    lower = path.lower()
+    if lower.endswith(".npy"):
+        image, is_rgb = np.load(path, mmap_mode="r"), False
+    elif lower.endswith((".tif", ".tiff")):
+        import tifffile
+        try:
+            image, is_rgb = tifffile.memmap(path, mode="r"), True
+        except ValueError:
+            # Compressed or tiled TIFF: not memory-mappable
+            image, is_rgb = TiffRegions(path), True
+    else:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode image")
+        is_rgb = False
+
+    if image.ndim != 3 or image.shape[2] < 3:
+        if isinstance(image, TiffRegions):
+            image.close()
+        raise ValueError("Expected a color image with at least 3 channels (RGB)")
+    return image, is_rgb
+
+def _tile_coverage(image: np.ndarray, is_rgb: bool, y0: int, y1: int, x0: int, x1: int, overlap: int) -> Tuple[int, int]:
+    height, width = image.shape[:2]
+    py0, py1 = max(y0 - overlap, 0), min(y1 + overlap, height)
+    px0, px1 = max(x0 - overlap, 0), min(x1 + overlap, width)
+
+    # Slicing a memmap only touches the pages of this tile
+    tile = np.ascontiguousarray(image[py0:py1, px0:px1, :3])
+    if is_rgb:
+        tile = cv2.cvtColor(tile, cv2.COLOR_RGB2BGR)
+
+    mask = get_detection_engine().mask(tile)
+    # Count only the tile's own region; the overlap is there for context
+    core = mask[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+    return cv2.countNonZero(core), core.size
+
+def detect_hyacinth_tiled(
+    image: np.ndarray,
+    is_rgb: bool = False,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    overlap: int = DEFAULT_TILE_OVERLAP,
+    workers: Optional[int] = None,
+) -> dict:
+    """
+    Runs the hyacinth mask over an image in overlapping tiles at native resolution.
+    Peak memory is bounded by tile_size and the number of workers, not image size.
+    workers defaults to every core; inside a pool worker pass that worker's share.
+
+    Returns the overall coverage plus a rows x cols grid of per-tile coverage.
+    """
+    height, width = image.shape[:2]
+    rows = (height + tile_size - 1) // tile_size
+    cols = (width + tile_size - 1) // tile_size
+
+    bounds = [
+        (r * tile_size, min((r + 1) * tile_size, height), c * tile_size, min((c + 1) * tile_size, width))
+        for r in range(rows)
+        for c in range(cols)
+    ]
+
+    # OpenCV releases the GIL, so threads run tiles on all cores without copying the image
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        results = list(pool.map(lambda b: _tile_coverage(image, is_rgb, *b, overlap), bounds))
+
+    grid = [[0.0] * cols for _ in range(rows)]
+    valid_pixels = 0
+    for i, (valid, total) in enumerate(results):
+        grid[i // cols][i % cols] = round(valid / total * 100.0, 2)
+        valid_pixels += valid
+
+    return {
+        "coverage_percent": round(valid_pixels / (height * width) * 100.0, 2),
+        "width": width,
+        "height": height,
+        "tile_size": tile_size,
+        "rows": rows,
+        "cols": cols,
+        "grid": grid,
+    }
+
+def detect_hyacinth_tiled_file(path: str, tile_size: int = DEFAULT_TILE_SIZE, overlap: int = DEFAULT_TILE_OVERLAP,
+                               workers: Optional[int] = None) -> dict:
+    image, is_rgb = open_large_image(path)
+    try:
+        return detect_hyacinth_tiled(image, is_rgb=is_rgb, tile_size=tile_size, overlap=overlap, workers=workers)
+    finally:
+        if isinstance(image, TiffRegions):
+            image.close()
+
 if __name__ == "__main__":
     # Simple test if run directly
     print("Image processing module ready.")
@@ -0,0 +1,495 @@
+"""
+Durable analysis job queue.
+
+Uploads are stored in a local SQLite database (WAL mode) and return a job id at
+once; JobWorker pulls queued jobs, runs them on the analysis engine and records
+the result. Failed jobs are retried with exponential backoff, and jobs left
+running by a crashed worker are retried the same way once their lease expires.
+
+Coverage for jobs tied to a submission goes through an outbox table in the same
+SQLite database and is written to submissions.coverage_percent in batches. Rows
+the database rejects (e.g. an id that is not a submission UUID) are moved to a
+coverage_parked table, so they can't hold back the rest of the outbox.
+
+Workers run inside the API process by default (JOB_WORKERS_IN_PROCESS=1). Set it
+to 0 and run `python -m job_queue` to scale analysis separately from the API;
+both sides only need to share JOB_DB_PATH.
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Set
+
+from postgrest import APIError
+
+from analysis_engine import AnalysisEngine, EngineSaturated
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "analysis_jobs.db")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "60"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))
+JOB_WORKERS_IN_PROCESS = os.getenv("JOB_WORKERS_IN_PROCESS", "1") != "0"
+COVERAGE_FLUSH_SECONDS = float(os.getenv("COVERAGE_FLUSH_SECONDS", "2"))
+COVERAGE_BATCH_SIZE = int(os.getenv("COVERAGE_BATCH_SIZE", "500"))
+
+TERMINAL = ("done", "failed")
+
+
+class QueueFull(Exception):
+    pass
+
+
+def backoff_seconds(attempt: int, base: float = JOB_RETRY_BASE_SECONDS, cap: float = JOB_RETRY_MAX_SECONDS) -> float:
+    """Delay before retry number `attempt` (1-based): exponential with +/-25% jitter."""
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    return delay * random.uniform(0.75, 1.25)
+
+
+class JobStore:
+    def __init__(self, path: str = JOB_DB_PATH, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 retry_base: float = JOB_RETRY_BASE_SECONDS, retry_max: float = JOB_RETRY_MAX_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("pragma journal_mode=wal")
+        self._db.execute("pragma synchronous=normal")
+        self._db.executescript(
+            """
+            create table if not exists jobs (
+              id text primary key,
+              status text not null,
+              submission_id text,
+              attempts integer not null default 0,
+              max_attempts integer not null,
+              run_at real not null,
+              lease_until real,
+              result text,
+              error text,
+              created_at real not null,
+              updated_at real not null
+            );
+            create index if not exists jobs_ready on jobs (status, run_at);
+            create table if not exists job_payloads (job_id text primary key, data blob not null);
+            create table if not exists coverage_outbox (
+              submission_id text primary key,
+              coverage real not null,
+              queued_at real not null
+            );
+            create table if not exists coverage_parked (
+              submission_id text not null,
+              coverage real not null,
+              error text,
+              parked_at real not null
+            );
+            """
+        )
+
+    def close(self):
+        self._db.close()
+
+    def _transaction(self, fn):
+        # BEGIN IMMEDIATE takes the write lock up front, so claims from several
+        # worker processes never hand out the same job
+        with self._lock:
+            self._db.execute("begin immediate")
+            try:
+                result = fn()
+            except BaseException:
+                self._db.execute("rollback")
+                raise
+            self._db.execute("commit")
+            return result
+
+    # Producer side
+
+    def enqueue(self, data: bytes, submission_id: Optional[str] = None, max_queued: int = JOB_QUEUE_MAX) -> dict:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+
+        def insert():
+            queued = self._db.execute("select count(*) from jobs where status in ('queued', 'running')").fetchone()[0]
+            if queued >= max_queued:
+                raise QueueFull(f"{queued} jobs already waiting")
+            self._db.execute(
+                "insert into jobs (id, status, submission_id, max_attempts, run_at, created_at, updated_at)"
+                " values (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, submission_id, self.max_attempts, now, now, now),
+            )
+            self._db.execute("insert into job_payloads (job_id, data) values (?, ?)", (job_id, data))
+
+        self._transaction(insert)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("select * from jobs where id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("select status, count(*) from jobs group by status").fetchall()
+        return {status: count for status, count in rows}
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "submission_id": row["submission_id"],
+            "attempts": row["attempts"],
+            "max_attempts": row["max_attempts"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        if row["status"] == "queued" and row["attempts"]:
+            job["next_attempt_at"] = row["run_at"]
+        return job
+
+    # Worker side
+
+    def claim(self, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[dict]:
+        """
+        Takes the next runnable job and leases it. Jobs whose worker's lease
+        expired (the process died, e.g. an image that crashes the decoder) count
+        as a failed attempt: they are queued again with backoff, or failed once
+        they have used up their attempts.
+        """
+        now = time.time()
+
+        def take():
+            expired = self._db.execute(
+                "select id, attempts, max_attempts from jobs where status = 'running' and lease_until < ?", (now,)
+            ).fetchall()
+            for row in expired:
+                if row["attempts"] >= row["max_attempts"]:
+                    self._db.execute(
+                        "update jobs set status = 'failed', error = ?, lease_until = null, updated_at = ? where id = ?",
+                        ("Worker lost while analyzing (lease expired)", now, row["id"]),
+                    )
+                    self._db.execute("delete from job_payloads where job_id = ?", (row["id"],))
+                else:
+                    delay = backoff_seconds(row["attempts"], self.retry_base, self.retry_max)
+                    self._db.execute(
+                        "update jobs set status = 'queued', error = ?, run_at = ?, lease_until = null, updated_at = ?"
+                        " where id = ?",
+                        ("Worker lost while analyzing (lease expired)", now + delay, now, row["id"]),
+                    )
+            return self._db.execute(
+                "update jobs set status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ?"
+                " where id = ("
+                "   select id from jobs where status = 'queued' and run_at <= ? order by run_at limit 1"
+                " ) returning *",
+                (now + lease_seconds, now, now),
+            ).fetchall()
+
+        rows = self._transaction(take)
+        return self._to_dict(rows[0]) if rows else None
+
+    def payload(self, job_id: str) -> bytes:
+        with self._lock:
+            row = self._db.execute("select data from job_payloads where job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise LookupError(f"payload for job {job_id} is missing")
+        return row[0]
+
+    def complete(self, job_id: str, result: dict):
+        now = time.time()
+
+        def finish():
+            rows = self._db.execute(
+                "update jobs set status = 'done', result = ?, error = null, lease_until = null, updated_at = ?"
+                " where id = ? and status = 'running' returning submission_id",
+                (json.dumps(result), now, job_id),
+            ).fetchall()
+            self._db.execute("delete from job_payloads where job_id = ?", (job_id,))
+            if rows and rows[0][0] and "coverage_percent" in result:
+                # Same transaction as the result, so the write to Supabase can't be lost
+                self._db.execute(
+                    "insert or replace into coverage_outbox (submission_id, coverage, queued_at) values (?, ?, ?)",
+                    (rows[0][0], result["coverage_percent"], now),
+                )
+
+        self._transaction(finish)
+
+    def fail(self, job_id: str, error: str, retry_in: Optional[float] = None, count_attempt: bool = True,
+             final: bool = False):
+        """
+        Records a failed attempt. The job is queued again after `retry_in` seconds
+        (default: exponential backoff) until it runs out of attempts. With
+        count_attempt=False the attempt is handed back, e.g. on shutdown; with
+        final=True the job fails now, for errors a retry can't fix.
+        """
+        now = time.time()
+
+        def record():
+            row = self._db.execute("select attempts, max_attempts from jobs where id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            attempts = row["attempts"] if count_attempt else row["attempts"] - 1
+            if final or attempts >= row["max_attempts"]:
+                self._db.execute(
+                    "update jobs set status = 'failed', attempts = ?, error = ?, lease_until = null, updated_at = ?"
+                    " where id = ?",
+                    (attempts, error, now, job_id),
+                )
+                self._db.execute("delete from job_payloads where job_id = ?", (job_id,))
+                return
+            delay = retry_in if retry_in is not None else backoff_seconds(attempts, self.retry_base, self.retry_max)
+            self._db.execute(
+                "update jobs set status = 'queued', attempts = ?, error = ?, run_at = ?, lease_until = null,"
+                " updated_at = ? where id = ?",
+                (attempts, error, now + delay, now, job_id),
+            )
+
+        self._transaction(record)
+
+    def purge(self, older_than: float = JOB_RETENTION_SECONDS) -> int:
+        cutoff = time.time() - older_than
+
+        def delete():
+            return self._db.execute(
+                "delete from jobs where status in ('done', 'failed') and updated_at < ?", (cutoff,)
+            ).rowcount
+
+        return self._transaction(delete)
+
+    # Coverage outbox
+
+    def pending_coverage(self, limit: int = COVERAGE_BATCH_SIZE) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "select submission_id, coverage from coverage_outbox order by queued_at limit ?", (limit,)
+            ).fetchall()
+        return [{"id": r[0], "coverage_percent": r[1]} for r in rows]
+
+    def ack_coverage(self, written: List[dict]):
+        # Only drop rows whose value is unchanged; a newer result queued meanwhile stays
+        def delete():
+            self._db.executemany(
+                "delete from coverage_outbox where submission_id = ? and coverage = ?",
+                [(w["id"], w["coverage_percent"]) for w in written],
+            )
+
+        self._transaction(delete)
+
+    def park_coverage(self, rejected: List[dict], error: str):
+        """Moves rows the database won't accept out of the outbox, keeping them for inspection."""
+        now = time.time()
+
+        def move():
+            for r in rejected:
+                deleted = self._db.execute(
+                    "delete from coverage_outbox where submission_id = ? and coverage = ?",
+                    (r["id"], r["coverage_percent"]),
+                ).rowcount
+                if deleted:
+                    self._db.execute(
+                        "insert into coverage_parked (submission_id, coverage, error, parked_at) values (?, ?, ?, ?)",
+                        (r["id"], r["coverage_percent"], error, now),
+                    )
+
+        self._transaction(move)
+
+    def parked_coverage(self) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "select submission_id, coverage, error from coverage_parked order by parked_at"
+            ).fetchall()
+        return [{"id": r[0], "coverage_percent": r[1], "error": r[2]} for r in rows]
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+class JobWorker:
+    """Runs queued jobs on an AnalysisEngine and flushes coverage results in batches."""
+
+    def __init__(self, store: JobStore, engine: AnalysisEngine, get_client: Callable[[], object],
+                 concurrency: Optional[int] = None, poll_interval: float = 1.0,
+                 flush_interval: float = COVERAGE_FLUSH_SECONDS, batch_size: int = COVERAGE_BATCH_SIZE):
+        self.store = store
+        self.engine = engine
+        self.get_client = get_client
+        self.concurrency = concurrency or engine.workers
+        self.poll_interval = poll_interval
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.completed = 0
+        self.failed_attempts = 0
+        self._running: Set[asyncio.Task] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._flush_loop())]
+
+    def wake(self):
+        """Called after enqueueing in this process so the job starts without waiting for the next poll."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        # In-flight jobs hand their attempt back and are queued again right away
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._running, return_exceptions=True)
+        self._tasks = []
+        await self.flush_coverage()
+
+    async def _run(self):
+        last_purge = 0.0
+        while True:
+            self._wake.clear()
+            while len(self._running) < self.concurrency:
+                job = await self._claim()
+                if job is None:
+                    break
+                task = asyncio.create_task(self._process(job))
+                self._running.add(task)
+                task.add_done_callback(self._job_finished)
+
+            if time.monotonic() - last_purge > 3600:
+                await asyncio.to_thread(self.store.purge)
+                last_purge = time.monotonic()
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> Optional[dict]:
+        # SQLite calls run in a thread: under BEGIN IMMEDIATE they can wait up to
+        # 30 s for another process's write lock, which must not stall the event loop
+        claim = asyncio.ensure_future(asyncio.to_thread(self.store.claim))
+        try:
+            return await asyncio.shield(claim)
+        except asyncio.CancelledError:
+            # Stopped mid-claim: hand back a job the thread may still have leased
+            job = await claim
+            if job is not None:
+                await asyncio.to_thread(self.store.fail, job["job_id"], "interrupted by shutdown", retry_in=0, count_attempt=False)
+            raise
+
+    def _job_finished(self, task: asyncio.Task):
+        self._running.discard(task)
+        self.wake()
+
+    async def _process(self, job: dict):
+        job_id = job["job_id"]
+        try:
+            data = await asyncio.to_thread(self.store.payload, job_id)
+            # strict: an undecodable upload fails instead of writing 0% coverage to its submission
+            coverage = await self.engine.analyze(data, strict=True)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.store.fail, job_id, "interrupted by shutdown", retry_in=0, count_attempt=False)
+            raise
+        except EngineSaturated as e:
+            # The pool is busy with direct /api/analyze calls; not the job's fault
+            await asyncio.to_thread(self.store.fail, job_id, str(e), retry_in=e.retry_after, count_attempt=False)
+        except ValueError as e:
+            # The image can't be decoded; retrying won't change that
+            print(f"Analysis job {job_id} failed: {e}")
+            self.failed_attempts += 1
+            await asyncio.to_thread(self.store.fail, job_id, str(e), final=True)
+        except Exception as e:
+            print(f"Analysis job {job_id} failed (attempt {job['attempts']}): {e}")
+            self.failed_attempts += 1
+            await asyncio.to_thread(self.store.fail, job_id, str(e) or type(e).__name__)
+        else:
+            await asyncio.to_thread(self.store.complete, job_id, {"coverage_percent": coverage})
+            self.completed += 1
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush_coverage()
+            except Exception as e:
+                # Rows stay in the outbox and are retried on the next tick
+                print(f"Coverage flush failed: {e}")
+
+    async def flush_coverage(self) -> int:
+        """Writes queued coverage values to submissions, one RPC per batch."""
+        client = self.get_client()
+        if client is None:
+            return 0
+        written = 0
+        while True:
+            batch = await asyncio.to_thread(self.store.pending_coverage, self.batch_size)
+            if not batch:
+                return written
+            invalid = [r for r in batch if not _is_uuid(r["id"])]
+            if invalid:
+                # The RPC casts ids to uuid, so these would fail every batch they are in
+                await asyncio.to_thread(self.store.park_coverage, invalid, "submission_id is not a UUID")
+            written += await self._write_coverage(client, [r for r in batch if _is_uuid(r["id"])])
+            if len(batch) < self.batch_size:
+                return written
+
+    async def _write_coverage(self, client, batch: List[dict]) -> int:
+        """
+        One RPC for the batch. If the database rejects it, the batch is split to
+        find the rows it rejects, which are parked. Connection errors propagate and
+        leave the rows in the outbox for the next flush.
+        """
+        if not batch:
+            return 0
+        try:
+            await client.rpc("apply_coverage_results", {"p_results": batch}).execute()
+        except APIError as e:
+            if len(batch) == 1:
+                print(f"Coverage for submission {batch[0]['id']} rejected, parking it: {e}")
+                await asyncio.to_thread(self.store.park_coverage, batch, str(e))
+                return 0
+            mid = len(batch) // 2
+            return await self._write_coverage(client, batch[:mid]) + await self._write_coverage(client, batch[mid:])
+        await asyncio.to_thread(self.store.ack_coverage, batch)
+        return len(batch)
+
+
+async def _serve_forever():
+    from analysis_engine import engine
+    from db import db
+
+    engine.start()
+    await db.connect()
+    worker = JobWorker(JobStore(), engine, lambda: db.client)
+    worker.start()
+    print(f"Analysis job worker running on {JOB_DB_PATH} with {engine.workers} processes")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await worker.stop()
+        await db.close()
+        engine.shutdown()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_serve_forever())
+    except KeyboardInterrupt:
+        pass
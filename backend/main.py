@@ -1,13 +1,62 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+# Taken before any other import, so /readyz can report how long loading the app took
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import hashlib
 import os
+import shutil
+import tempfile
+import asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="AquaWatch API")
+import metrics
+from analysis_engine import engine, EngineSaturated, WorkerLost
+from db import db
+from batch_analysis import iter_batch_images, stream_batch_results
+from detection_params import DEFAULT_QUALITY, QUALITY_TIERS
+
+# ?quality= on the analyze endpoints: fast (512 px previews), standard, accurate (native resolution)
+QUALITY_PATTERN = "^(" + "|".join(QUALITY_TIERS) + ")$"
+
+# Filled in by the lifespan; reported by /readyz
+startup = {}
+
+async def warm_up_engine():
+    try:
+        await run_in_threadpool(engine.start)
+    except Exception as e:
+        print(f"Analysis engine warm-up failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The API process doesn't import cv2/numpy at startup: detection runs in the pool
+    # workers, and NumPy is loaded when the analytics store first builds its trend rollup
+    startup["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    await db.connect()
+    coupons.email_queue.start()
+    jobs.start()
+    # Spawn the analysis workers and run a dummy image through every tier in the
+    # background, so the server answers /healthz meanwhile; /readyz reports 503
+    # until the workers are warm and the load balancer holds traffic until then.
+    warm_up = asyncio.create_task(warm_up_engine())
+    startup["startup_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    yield
+    await jobs.stop()
+    await coupons.email_queue.close()
+    await db.close()
+    engine.shutdown()
+    await warm_up
+
+app = FastAPI(title="AquaWatch API", lifespan=lifespan)
 
 # CORS configuration
 origins = [
@@ -22,35 +71,227 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def route_template(request: Request) -> str:
+    # Use the route template so /my-coupons/{user_id} stays one series
+    return getattr(request.scope.get("route"), "path", "unmatched")
+
+@app.exception_handler(WorkerLost)
+async def worker_lost(request: Request, e: WorkerLost):
+    return JSONResponse(
+        {"detail": "Analysis service is restarting, please retry shortly"},
+        status_code=503,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    profiler = metrics.start_sampled_profile()
+    token = metrics.begin_request_accounting()
+    started = time.perf_counter()
+
+    def finish(status: int):
+        route = route_template(request)
+        metrics.http_request_seconds.observe(
+            time.perf_counter() - started, method=request.method, route=route, status=status,
+        )
+        metrics.observe_request_accounting(counts, route)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        counts = metrics.detach_request_accounting(token)
+        finish(500)
+        raise
+    finally:
+        if profiler is not None:
+            # Profiles cover the handler up to the response headers, not a long-lived SSE stream
+            metrics.finish_sampled_profile(profiler, route_template(request))
+    counts = metrics.detach_request_accounting(token)
+
+    # Streamed bodies (batch NDJSON, exports, SSE) keep reading pages after the
+    # headers are sent, so latency and Supabase calls are recorded once the body ends
+    body = response.body_iterator
+
+    async def measured_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            finish(response.status_code)
+
+    response.body_iterator = measured_body()
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    cache = engine.cache.stats() if engine.cache is not None else {}
+    gauges = {
+        "aquawatch_analysis_workers": engine.workers,
+        "aquawatch_analysis_pending": engine.pending,
+        "aquawatch_analysis_ready": int(engine.ready),
+        "aquawatch_email_queue_pending": coupons.email_queue.pending,
+    }
+    if jobs.store is not None:
+        for status, count in jobs.store.counts().items():
+            gauges[f"aquawatch_analysis_jobs_{status}"] = count
+    counters = {
+        "aquawatch_analysis_worker_restarts_total": engine.restarts,
+        "aquawatch_result_cache_hits_total": cache.get("hits", 0),
+        "aquawatch_result_cache_misses_total": cache.get("misses", 0),
+        "aquawatch_result_cache_evictions_total": cache.get("evictions", 0),
+        "aquawatch_emails_sent_total": coupons.email_queue.sent,
+        "aquawatch_emails_failed_total": coupons.email_queue.failed,
+        "aquawatch_emails_dropped_total": coupons.email_queue.dropped,
+        "aquawatch_parks_cache_hits_total": coupons.parks_cache.hits,
+        "aquawatch_parks_cache_misses_total": coupons.parks_cache.misses,
+        "aquawatch_coupons_cache_hits_total": coupons.coupons_cache.hits,
+        "aquawatch_coupons_cache_misses_total": coupons.coupons_cache.misses,
+    }
+    return PlainTextResponse(metrics.render(gauges, counters), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz", include_in_schema=False)
+def healthz():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+def readyz():
+    """Readiness: analysis workers warm, database client and job queue open."""
+    checks = {
+        "analysis_engine": engine.ready,
+        "database": db.client is not None,
+        "job_queue": jobs.store is not None,
+    }
+    ready = all(checks.values())
+    body = {
+        "status": "ready" if ready else "starting",
+        "checks": checks,
+        "startup": {**startup, "analysis_engine": engine.startup},
+    }
+    return JSONResponse(body, status_code=200 if ready else 503, headers={"Cache-Control": "no-store"})
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to AquaWatch API"}
 
 @app.post("/api/analyze")
-async def analyze_image(file: UploadFile = File(...)):
+async def analyze_image(file: UploadFile = File(...), quality: str = Query(DEFAULT_QUALITY, pattern=QUALITY_PATTERN)):
     # Green Pixel Density Analysis
     try:
-        from image_processing import detect_hyacinth
-        
         # Read image
         contents = await file.read()
         
-        # Helper function does the heavy lifting
-        coverage = detect_hyacinth(contents)
+        # Detection runs in the process pool so the event loop stays free
+        coverage = await engine.analyze(contents, quality)
         
-        return {"coverage_percent": coverage}
+        return {"coverage_percent": coverage, "quality": quality}
         
+    except EngineSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis service is busy, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except WorkerLost:
+        raise
     except Exception as e:
         print(f"Analysis Error: {e}")
         # Fallback to random if something breaks (or 0)
         import random
         return {"coverage_percent": round(random.uniform(10.0, 90.0), 2)}
 
+@app.post("/api/analyze/batch")
+async def analyze_batch(files: List[UploadFile] = File(...), quality: str = Query(DEFAULT_QUALITY, pattern=QUALITY_PATTERN)):
+    """
+    Analyzes many images in one request. Accepts several image parts and/or
+    zip/tar archives of images, and streams one NDJSON line per image as it
+    finishes followed by a summary line with the batch average coverage.
+    """
+    if engine.pending >= engine.max_pending:
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis service is busy, please retry shortly",
+            headers={"Retry-After": str(engine.retry_after())},
+        )
+
+    images = iter_batch_images(files)
+    return StreamingResponse(stream_batch_results(engine, images, quality), media_type="application/x-ndjson")
+
+@app.post("/api/analyze/tiled")
+async def analyze_tiled(
+    file: UploadFile = File(...),
+    tile_size: int = Query(2048, ge=256, le=8192),
+    overlap: int = Query(16, ge=0, le=256),
+):
+    """
+    Native-resolution analysis for large orthomosaics. Returns overall coverage and
+    a per-tile coverage grid. Uncompressed TIFF or .npy uploads are memory-mapped;
+    compressed or tiled TIFFs are decoded one TIFF tile at a time.
+    """
+    suffix = os.path.splitext(file.filename or "")[1] or ".img"
+    tmp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        with tmp:
+            await run_in_threadpool(shutil.copyfileobj, file.file, tmp)
+        return await engine.analyze_tiled(tmp.name, tile_size, overlap)
+    except EngineSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis service is busy, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        os.unlink(tmp.name)
+
+@app.post("/api/analyze/overlay")
+async def analyze_overlay(
+    file: UploadFile = File(...),
+    scale: float = Query(0.5, gt=0, le=1),
+    encoding: str = Query("png", pattern="^(png|rle)$"),
+    quality: str = Query(DEFAULT_QUALITY, pattern=QUALITY_PATTERN),
+):
+    """
+    Coverage plus the mask that was counted (as a palettized PNG or run-length
+    encoding at `scale`) and blob stats. The result is cached by the image's
+    sha256, returned as image_sha256, so the admin view can re-fetch it from
+    GET /api/analyze/overlay/{image_sha256} without re-running detection.
+    """
+    contents = await file.read()
+    try:
+        result = await engine.analyze_overlay(contents, scale, encoding, quality)
+    except EngineSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis service is busy, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"image_sha256": hashlib.sha256(contents).hexdigest(), **result}
+
+@app.get("/api/analyze/overlay/{image_sha256}")
+def get_cached_overlay(
+    image_sha256: str,
+    scale: float = Query(0.5, gt=0, le=1),
+    encoding: str = Query("png", pattern="^(png|rle)$"),
+    quality: str = Query(DEFAULT_QUALITY, pattern=QUALITY_PATTERN),
+):
+    result = engine.cached_overlay(image_sha256, scale, encoding, quality)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Overlay not cached; POST the image to /api/analyze/overlay")
+    # Content-addressed, and the key includes the detection version
+    return JSONResponse(
+        {"image_sha256": image_sha256.lower(), **result},
+        headers={"Cache-Control": "private, max-age=86400"},
+    )
+
 # Include Routers
-# Include Routers
-from routers import coupons, analytics
+from routers import coupons, analytics, jobs
 app.include_router(coupons.router)
 app.include_router(analytics.router)
+app.include_router(jobs.router)
 
 if __name__ == "__main__":
     import uvicorn
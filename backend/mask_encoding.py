@@ -0,0 +1,87 @@
+"""
+Compact encodings of binary detection masks for the admin overlay view.
+
+Both encoders are vectorized (NumPy / OpenCV / Pillow's C encoder), so encoding a
+1000 px wide mask costs a few milliseconds next to the detection itself.
+
+rle: row-major run lengths alternating background/foreground, starting with a
+     background run (0 if the first pixel is foreground), like COCO's counts.
+png: 1-bit palettized PNG, transparent background and semi-transparent green
+     foreground, ready to draw over the photo. Base64 encoded.
+"""
+import base64
+import io
+from typing import Dict, List
+
+import cv2
+import numpy as np
+from PIL import Image
+
+ENCODINGS = ("rle", "png")
+
+# Palette index 0: background (fully transparent), 1: hyacinth
+OVERLAY_COLOR = (16, 185, 129)  # Emerald
+OVERLAY_ALPHA = 140
+
+
+def scale_mask(mask: np.ndarray, scale: float) -> np.ndarray:
+    """Boolean mask resized by `scale`; a cell is set if at least half its source pixels are."""
+    binary = mask > 0
+    if scale >= 1.0:
+        return binary
+    height, width = mask.shape[:2]
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    area = cv2.resize(binary.view(np.uint8), size, interpolation=cv2.INTER_AREA)
+    return area >= 0.5
+
+
+def encode_rle(mask: np.ndarray) -> Dict:
+    flat = mask.ravel().astype(bool)
+    # Indices where the value changes, plus both ends, give every run boundary
+    boundaries = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    edges = np.concatenate(([0], boundaries, [flat.size]))
+    counts = np.diff(edges)
+    if flat.size and flat[0]:
+        counts = np.concatenate(([0], counts))
+    return {"size": [int(mask.shape[0]), int(mask.shape[1])], "counts": counts.tolist()}
+
+
+def decode_rle(rle: Dict) -> np.ndarray:
+    height, width = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.arange(len(counts)) % 2 == 1
+    return np.repeat(values, counts).reshape(height, width)
+
+
+def encode_png(mask: np.ndarray) -> Dict:
+    image = Image.fromarray(mask.astype(np.uint8), mode="P")
+    image.putpalette([0, 0, 0, *OVERLAY_COLOR])
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", bits=1, optimize=False, transparency=bytes([0, OVERLAY_ALPHA]))
+    return {
+        "size": [int(mask.shape[0]), int(mask.shape[1])],
+        "media_type": "image/png",
+        "data": base64.b64encode(buffer.getvalue()).decode("ascii"),
+    }
+
+
+def encode_mask(mask: np.ndarray, scale: float = 1.0, encoding: str = "rle") -> Dict:
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown overlay encoding {encoding!r} (expected one of {', '.join(ENCODINGS)})")
+    scaled = scale_mask(mask, scale)
+    encoded = encode_rle(scaled) if encoding == "rle" else encode_png(scaled)
+    return {"encoding": encoding, "scale": scale, **encoded}
+
+
+def component_stats(mask: np.ndarray) -> Dict:
+    """Connected hyacinth blobs (8-connectivity) in the full-resolution mask."""
+    count, _, stats, _ = cv2.connectedComponentsWithStats((mask > 0).view(np.uint8), connectivity=8)
+    areas: List[int] = stats[1:, cv2.CC_STAT_AREA].tolist()  # label 0 is background
+    total = mask.shape[0] * mask.shape[1]
+    largest = max(areas, default=0)
+    return {
+        "blob_count": count - 1,
+        "largest_blob_area": largest,
+        "largest_blob_percent": round(largest / total * 100.0, 2) if total else 0.0,
+        "mean_blob_area": round(sum(areas) / len(areas), 1) if areas else 0.0,
+    }
@@ -0,0 +1,281 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Counters and histograms are kept per label set; render() produces the
+text format served on /metrics. Supabase calls are counted through
+InstrumentedSupabase, which wraps a client without changing how routers use it.
+"""
+import bisect
+import contextvars
+import cProfile
+import inspect
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        return self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        series = self._series.get(key)
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series):
+                    cumulative += count
+                    labels = _format_labels(self.label_names, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {int(cumulative)}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {series[-1]}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {int(cumulative)}")
+        return lines
+
+
+# Registry
+
+http_request_seconds = Histogram(
+    "aquawatch_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"),
+)
+detection_stage_seconds = Histogram(
+    "aquawatch_detection_stage_seconds", "Time spent in each detect_hyacinth stage.", ("stage",),
+)
+supabase_calls = Counter(
+    "aquawatch_supabase_calls_total", "Supabase (PostgREST) calls by table.", ("table",),
+)
+supabase_rows = Counter(
+    "aquawatch_supabase_rows_total", "Rows returned by Supabase calls by table.", ("table",),
+)
+supabase_call_seconds = Histogram(
+    "aquawatch_supabase_call_duration_seconds", "Supabase call latency by table.", ("table",),
+)
+supabase_calls_per_request = Histogram(
+    "aquawatch_supabase_calls_per_request", "Supabase calls made while serving one request.", ("route",), ROW_BUCKETS,
+)
+supabase_rows_per_request = Histogram(
+    "aquawatch_supabase_rows_per_request", "Supabase rows fetched while serving one request.", ("route",), ROW_BUCKETS,
+)
+
+REGISTRY = [
+    http_request_seconds,
+    detection_stage_seconds,
+    supabase_calls,
+    supabase_rows,
+    supabase_call_seconds,
+    supabase_calls_per_request,
+    supabase_rows_per_request,
+]
+
+
+def observe_stages(timings: Dict[str, float]):
+    for stage, seconds in timings.items():
+        detection_stage_seconds.observe(seconds, stage=stage)
+
+
+def render(gauges: Optional[Dict[str, float]] = None, counters: Optional[Dict[str, float]] = None) -> str:
+    """
+    Prometheus text exposition of all registered metrics, plus values owned by
+    other components (engine queue depth, cache counters) passed in at scrape time.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for kind, values in (("gauge", gauges), ("counter", counters)):
+        for name, value in (values or {}).items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Per-request database accounting
+
+# [calls, rows] for the request being served; None outside a request
+_request_db: contextvars.ContextVar = contextvars.ContextVar("request_db", default=None)
+
+
+def begin_request_accounting():
+    return _request_db.set([0, 0])
+
+
+def detach_request_accounting(token) -> list:
+    """
+    Ends accounting in this context and returns the request's [calls, rows]
+    counter. Tasks started during the request (the app, a streaming body) hold
+    the same list and keep adding to it until it is observed.
+    """
+    counts = _request_db.get()
+    _request_db.reset(token)
+    return counts
+
+
+def end_request_accounting(token, route: str):
+    observe_request_accounting(detach_request_accounting(token), route)
+
+
+def observe_request_accounting(counts: list, route: str):
+    calls, rows = counts
+    if calls:
+        supabase_calls_per_request.observe(calls, route=route)
+        supabase_rows_per_request.observe(rows, route=route)
+
+
+def record_supabase_call(table: str, seconds: float, data):
+    rows = len(data) if isinstance(data, list) else (1 if data else 0)
+    supabase_calls.inc(table=table)
+    supabase_rows.inc(rows, table=table)
+    supabase_call_seconds.observe(seconds, table=table)
+    current = _request_db.get()
+    if current is not None:
+        current[0] += 1
+        current[1] += rows
+
+
+class _InstrumentedQuery:
+    def __init__(self, builder, table: str):
+        self._builder = builder
+        self._table = table
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # Keep wrapping builder objects so the final execute() is timed
+            if hasattr(result, "execute"):
+                return _InstrumentedQuery(result, self._table)
+            return result
+
+        return chained
+
+    def execute(self):
+        started = time.perf_counter()
+        response = self._builder.execute()
+        if inspect.isawaitable(response):
+            return self._finish(response, started)
+        record_supabase_call(self._table, time.perf_counter() - started, getattr(response, "data", None))
+        return response
+
+    async def _finish(self, pending, started: float):
+        # Async clients: time the awaited request, not just building the coroutine
+        response = await pending
+        record_supabase_call(self._table, time.perf_counter() - started, getattr(response, "data", None))
+        return response
+
+
+class InstrumentedSupabase:
+    """Wraps a Supabase client so every table(...)/rpc(...) execute() is counted and timed."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str):
+        return _InstrumentedQuery(self._client.table(name), name)
+
+    def rpc(self, fn: str, params: Optional[dict] = None):
+        return _InstrumentedQuery(self._client.rpc(fn, params or {}), f"rpc:{fn}")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# Sampling profiler (opt-in)
+
+# Fraction of requests to run under cProfile, e.g. PROFILE_SAMPLE_RATE=0.01.
+# Profiles are written as .prof files for snakeviz / pstats.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0") or 0)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+
+# cProfile is thread-wide and requests share the event loop thread, so only one
+# sampled profile runs at a time (Python 3.12+ refuses a second one outright).
+# A profile still includes whatever other requests ran on the loop meanwhile.
+_profile_lock = threading.Lock()
+
+
+def start_sampled_profile() -> Optional[cProfile.Profile]:
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None  # another request is being profiled; skip this sample
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except Exception as e:
+        # e.g. another profiling tool is active; profiling must never fail a request
+        _profile_lock.release()
+        print(f"Sampled profile not started: {e}")
+        return None
+    return profiler
+
+
+def finish_sampled_profile(profiler: cProfile.Profile, route: str):
+    try:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        safe_route = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+        path = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{safe_route}.prof")
+        profiler.dump_stats(path)
+    except Exception as e:
+        print(f"Sampled profile not written: {e}")
+    finally:
+        _profile_lock.release()
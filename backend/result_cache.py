@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from detection_params import DETECTION_VERSION
+
+
+class ResultCache:
+    """
+    Content-addressed cache for analysis results.
+
+    Keys are sha256(image bytes) + detection parameter version, so a threshold
+    change never serves stale results. There is an in-process LRU tier and an
+    optional SQLite tier on disk; both are bounded by total stored bytes.
+    Values must be JSON-serializable. From async code use get_async/set_async,
+    which keep disk-tier access off the event loop.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, disk_path: Optional[str] = None,
+                 disk_max_bytes: int = 256 * 1024 * 1024, version: str = DETECTION_VERSION):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.version = version
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # Held for SQLite work only, so memory-tier hits never wait on disk I/O
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("pragma journal_mode=wal")
+            self._db.execute(
+                "create table if not exists results ("
+                " key text primary key, version text not null, value text not null,"
+                " size integer not null, last_access real not null)"
+            )
+            self._db.execute("create index if not exists results_last_access on results (last_access)")
+            # Entries from older detection parameters can never be hit again
+            self._db.execute("delete from results where version != ?", (version,))
+            # Kept as a running total from here on instead of summed on every set
+            self._disk_bytes = self._db.execute("select coalesce(sum(size), 0) from results").fetchone()[0]
+
+    def key(self, data: bytes, namespace: str = "coverage") -> str:
+        return self.key_for_digest(hashlib.sha256(data).hexdigest(), namespace)
+
+    def key_for_digest(self, digest: str, namespace: str = "coverage") -> str:
+        """Key for an image known only by its sha256 hex digest."""
+        return f"{namespace}:{self.version}:{digest.lower()}"
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._get_memory(key)
+        if raw is None and self._db is not None:
+            raw = self._get_disk(key)
+        return self._loaded(raw)
+
+    async def get_async(self, key: str) -> Optional[Any]:
+        """Like get, but a disk-tier lookup runs in a thread so the event loop never waits on SQLite."""
+        raw = self._get_memory(key)
+        if raw is None and self._db is not None:
+            raw = await asyncio.to_thread(self._get_disk, key)
+        return self._loaded(raw)
+
+    def set(self, key: str, value: Any):
+        raw = json.dumps(value)
+        with self._lock:
+            self._put_memory(key, raw)
+        if self._db is not None:
+            self._set_disk(key, raw)
+
+    async def set_async(self, key: str, value: Any):
+        """Like set, but the disk-tier write runs in a thread."""
+        raw = json.dumps(value)
+        with self._lock:
+            self._put_memory(key, raw)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, raw)
+
+    def _loaded(self, raw: Optional[str]) -> Optional[Any]:
+        if raw is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        return json.loads(raw)
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            raw = self._memory.get(key)
+            if raw is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+            return raw
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        with self._disk_lock:
+            row = self._db.execute("select value from results where key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("update results set last_access = ? where key = ?", (time.time(), key))
+        with self._lock:
+            self._put_memory(key, row[0])
+            self.hits += 1
+            self.disk_hits += 1
+        return row[0]
+
+    def _set_disk(self, key: str, raw: str):
+        with self._disk_lock:
+            old = self._db.execute("select size from results where key = ?", (key,)).fetchone()
+            self._db.execute(
+                "insert or replace into results (key, version, value, size, last_access) values (?, ?, ?, ?, ?)",
+                (key, self.version, raw, len(raw), time.time()),
+            )
+            self._disk_bytes += len(raw) - (old[0] if old else 0)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _put_memory(self, key: str, raw: str):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = raw
+        self._memory_bytes += len(raw)
+        while self._memory_bytes > self.max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _evict_disk(self):
+        # Drop least recently used rows until we are back under 90% of the budget,
+        # so the ordered scan runs once per eviction round rather than on every set
+        target = self._disk_bytes - int(self.disk_max_bytes * 0.9)
+        doomed = []
+        for key, size in self._db.execute("select key, size from results order by last_access"):
+            if target <= 0:
+                break
+            doomed.append((key,))
+            target -= size
+            self._disk_bytes -= size
+        self._db.executemany("delete from results where key = ?", doomed)
+        with self._lock:
+            self.evictions += len(doomed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+# Shared cache for the API process
+result_cache = ResultCache(
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    disk_path=os.getenv("RESULT_CACHE_PATH") or None,
+    disk_max_bytes=int(os.getenv("RESULT_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024))),
+)
@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
-from supabase import create_client, Client
+from fastapi import APIRouter, HTTPException, Depends, Response, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import Field
 import os
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import Annotated, List, Dict, Any, Optional
 from collections import defaultdict
-from datetime import datetime
+from datetime import date, datetime, timezone
+
+from analytics_store import AnalyticsStore
+from db import db, get_supabase
+from geo_index import zoom_to_precision
+from routers.coupons import require_admin
+from submission_export import (
+    EXPORT_COLUMNS, EXPORT_FORMATS, EXPORT_MAX_PAGE_SIZE, EXPORT_PAGE_SIZE,
+    export_chunks, iter_pages, prefetch_first,
+)
 
 load_dotenv()
 
@@ -14,60 +24,101 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# Supabase Setup
-url: str = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") # Use Service Role for Admin Access logic if needed
-supabase: Client = create_client(url, key)
+# Incremental aggregate store (see analytics_store.py)
+STORE_COLUMNS = "id, latitude, longitude, coverage_percent, status, created_at, updated_at"
+
+async def fetch_submissions_page(cursor, limit):
+    query = db.require().table("submissions").select(STORE_COLUMNS)
+    if cursor is not None:
+        ts, last_id = cursor
+        # Keyset pagination on (updated_at, id)
+        query = query.or_(f'updated_at.gt."{ts}",and(updated_at.eq."{ts}",id.gt.{last_id})')
+    response = await query.order("updated_at").order("id").limit(limit).execute()
+    return response.data
+
+store = AnalyticsStore(
+    fetch_submissions_page,
+    max_age=float(os.getenv("ANALYTICS_MAX_AGE_SECONDS", "5")),
+)
+
+async def serve_from_store(response: Response) -> bool:
+    """
+    Refreshes the store if it is older than max_age. Returns False if it has never
+    loaded, in which case callers fall back to the SQL aggregation functions.
+    """
+    try:
+        await store.refresh()
+    except Exception as e:
+        print(f"Analytics store refresh failed: {e}")
+    if not store.loaded:
+        return False
+    response.headers["X-Analytics-As-Of"] = store.refreshed_at.isoformat()
+    return True
 
 @router.get("/severity")
-async def get_severity_by_area():
+async def get_severity_by_area(response: Response):
     """
     Returns areas (approximated by rounded coordinates) with highest average infestation.
+    Served from the in-memory store; falls back to analytics_severity_by_area in Postgres.
     """
+    if await serve_from_store(response):
+        return store.severity(10)
     try:
-        response = supabase.table("submissions").select("*").execute()
-        data = response.data
-        
-        # Group by "Area" (Round Lat/Long to 2 decimal places ~1km)
-        area_groups = defaultdict(list)
-        for sub in data:
-            if sub.get('latitude') and sub.get('longitude') and sub.get('coverage_percent'):
-                lat = round(sub['latitude'], 2)
-                lon = round(sub['longitude'], 2)
-                area_name = f"Area {lat}, {lon}" # Simplified Name
-                area_groups[area_name].append(sub['coverage_percent'])
-
-        # Calculate Average
+        result = await db.require().rpc("analytics_severity_by_area", {"p_limit": 10}).execute()
+
         results = []
-        for area, coverages in area_groups.items():
-            avg = sum(coverages) / len(coverages)
-            results.append({"name": area, "severity": round(avg, 1)})
+        for row in result.data:
+            lat = round(float(row['latitude']), 2)
+            lon = round(float(row['longitude']), 2)
+            area_name = f"Area {lat}, {lon}" # Simplified Name
+            results.append({"name": area_name, "severity": round(row['severity'], 1)})
         
         # Sort desc
         results.sort(key=lambda x: x['severity'], reverse=True)
-        return results[:10] # Top 10
+        return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+Percentile = Annotated[float, Field(ge=0, le=100)]
+
 @router.get("/trend")
-async def get_infestation_trend():
+async def get_infestation_trend(
+    response: Response,
+    start: Annotated[Optional[date], Query(alias="from")] = None,
+    end: Annotated[Optional[date], Query(alias="to")] = None,
+    bucket: Annotated[str, Query(pattern="^(day|week|month)$")] = "day",
+    window: Annotated[int, Query(ge=1, le=366)] = 1,
+    percentiles: Annotated[Optional[List[Percentile]], Query(alias="percentile")] = None,
+    min_lat: Annotated[Optional[float], Query(ge=-90, le=90)] = None,
+    min_lon: Annotated[Optional[float], Query(ge=-180, le=180)] = None,
+    max_lat: Annotated[Optional[float], Query(ge=-90, le=90)] = None,
+    max_lon: Annotated[Optional[float], Query(ge=-180, le=180)] = None,
+):
     """
-    Returns daily average infestation over time.
+    Returns average infestation per day, week or month within [from, to]
+    (inclusive dates), with the number of submissions behind each point.
+    window=N adds a rolling average over the last N buckets; each percentile=P
+    adds pP, the P-th percentile of per-area averages in the bucket; a bounding
+    box restricts the series to the areas inside it.
+    Served from the in-memory store; plain daily trends fall back to
+    analytics_daily_trend in Postgres.
     """
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    bbox = _optional_bbox(min_lat, min_lon, max_lat, max_lon)
+    if await serve_from_store(response):
+        return store.trend(start=start, end=end, bucket=bucket, window=window,
+                           percentiles=percentiles or (), bbox=bbox)
+    if bucket != "day" or window > 1 or percentiles or bbox is not None:
+        raise HTTPException(status_code=503, detail="Analytics are not loaded yet")
     try:
-        response = supabase.table("submissions").select("created_at, coverage_percent").order("created_at").execute()
-        data = response.data
-
-        date_groups = defaultdict(list)
-        for sub in data:
-            if sub.get('coverage_percent'):
-                date_str = sub['created_at'].split('T')[0] # YYYY-MM-DD
-                date_groups[date_str].append(sub['coverage_percent'])
-        
-        results = []
-        for date, coverages in date_groups.items():
-            avg = sum(coverages) / len(coverages)
-            results.append({"date": date, "average_coverage": round(avg, 1)})
+        params = {"p_from": start.isoformat() if start else None, "p_to": end.isoformat() if end else None}
+        result = await db.require().rpc("analytics_daily_trend", params).execute()
+
+        results = [
+            {"date": row['day'], "average_coverage": round(row['average_coverage'], 1), "submissions": row['submissions']}
+            for row in result.data
+        ]
         
         # Sort by date
         results.sort(key=lambda x: x['date'])
@@ -76,18 +127,19 @@ async def get_infestation_trend():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/status")
-async def get_status_distribution():
+async def get_status_distribution(response: Response):
     """
     Returns count of reports by status.
+    Served from the in-memory store; falls back to analytics_status_counts in Postgres.
     """
+    if await serve_from_store(response):
+        return store.status()
     try:
-        response = supabase.table("submissions").select("status").execute()
-        data = response.data
+        result = await db.require().rpc("analytics_status_counts", {}).execute()
 
         counts = defaultdict(int)
-        for sub in data:
-            status = sub.get('status', 'unknown')
-            counts[status] += 1
+        for row in result.data:
+            counts[row.get('status') or 'unknown'] += row['count']
         
         results = [
             {"name": "Pending", "value": counts.get("pending", 0), "color": "#f59e0b"}, # Amber
@@ -98,3 +150,117 @@ async def get_status_distribution():
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+# Map endpoints: cost is proportional to the viewport, not the table
+
+def _bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    return (min_lat, min_lon, max_lat, max_lon)
+
+def _optional_bbox(min_lat, min_lon, max_lat, max_lon):
+    corners = (min_lat, min_lon, max_lat, max_lon)
+    if all(c is None for c in corners):
+        return None
+    if any(c is None for c in corners):
+        raise HTTPException(status_code=400, detail="Bounding box needs min_lat, min_lon, max_lat and max_lon")
+    return _bbox(*corners)
+
+async def _require_store(response: Response):
+    if not await serve_from_store(response):
+        raise HTTPException(status_code=503, detail="Analytics are not loaded yet")
+
+@router.get("/map/clusters")
+async def get_map_clusters(
+    response: Response,
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(10, ge=0, le=22),
+):
+    """
+    Returns pre-aggregated clusters (count, average coverage, centroid) for the
+    geohash cells inside the viewport at a precision matching the map zoom.
+    """
+    bbox = _bbox(min_lat, min_lon, max_lat, max_lon)
+    await _require_store(response)
+    return store.geo.clusters(bbox, zoom_to_precision(zoom))
+
+@router.get("/map/points")
+async def get_map_points(
+    response: Response,
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    limit: int = Query(500, ge=1, le=5000),
+):
+    """
+    Returns individual submissions inside the viewport (at most `limit`).
+    """
+    bbox = _bbox(min_lat, min_lon, max_lat, max_lon)
+    await _require_store(response)
+    return store.geo.points(bbox, limit)
+
+# Bulk export for ops and research: streamed, never loaded into one list
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Naive timestamps are taken as UTC, like created_at itself
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+@router.get("/export/submissions", dependencies=[Depends(require_admin)])
+async def export_submissions(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lon: Optional[float] = Query(None, ge=-180, le=180),
+    page_size: int = Query(EXPORT_PAGE_SIZE, ge=1, le=EXPORT_MAX_PAGE_SIZE),
+    supabase = Depends(get_supabase),
+):
+    """
+    Streams every submission created in [from, to) and, if given, inside the
+    bounding box, oldest first, as CSV or NDJSON. Gzipped on the fly when the
+    client sends Accept-Encoding: gzip. Requires the X-Admin-Key header.
+    """
+    bbox = _optional_bbox(min_lat, min_lon, max_lat, max_lon)
+    start, end = _utc(created_from), _utc(created_to)
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+
+    async def fetch_page(cursor, limit):
+        query = supabase.table("submissions").select(", ".join(EXPORT_COLUMNS))
+        if start is not None:
+            query = query.gte("created_at", start.isoformat())
+        if end is not None:
+            query = query.lt("created_at", end.isoformat())
+        if bbox is not None:
+            query = query.gte("latitude", bbox[0]).lte("latitude", bbox[2])
+            query = query.gte("longitude", bbox[1]).lte("longitude", bbox[3])
+        if cursor is not None:
+            ts, last_id = cursor
+            # Keyset pagination on (created_at, id)
+            query = query.or_(f'created_at.gt."{ts}",and(created_at.eq."{ts}",id.gt.{last_id})')
+        response = await query.order("created_at").order("id").limit(limit).execute()
+        return response.data
+
+    try:
+        pages = await prefetch_first(iter_pages(fetch_page, page_size))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    compress = "gzip" in request.headers.get("accept-encoding", "").lower()
+    headers = {
+        "Content-Disposition": f'attachment; filename="submissions.{format}"',
+        "Cache-Control": "no-store",
+        "Vary": "Accept-Encoding",
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export_chunks(pages, format, compress), media_type=EXPORT_FORMATS[format], headers=headers)
@@ -1,25 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response
+from pydantic import BaseModel, TypeAdapter
 from typing import List, Optional
+import hmac
 import os
 import random
 import string
-from supabase import create_client, Client
-from datetime import datetime
+from postgrest import APIError
+from supabase import AsyncClient
 
-router = APIRouter(prefix="/api/coupons", tags=["coupons"])
-
-# Initialize Supabase Client (Verify env vars exist in your setup)
-SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL") # Reusing frontend env var name if shared, or use specific
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") # We need service role to deduct points safely
+from coupon_issuance import grants_from_csv, grants_from_list, issue_coupons
+from db import get_supabase
+from email_queue import EmailQueue
+from ttl_cache import CachedBody, TTLCache
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    print("Warning: Supabase credentials not found in env. Backend logic involving DB will fail.")
-
-def get_supabase() -> Client:
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        raise HTTPException(status_code=500, detail="Database configuration error")
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+router = APIRouter(prefix="/api/coupons", tags=["coupons"])
 
 # Models
 class RedeemRequest(BaseModel):
@@ -48,6 +42,13 @@ class TicketRedeemRequest(BaseModel):
     park_id: str
     coupon_code: str
 
+class BulkGrant(BaseModel):
+    user_id: str
+    points: int
+
+class BulkIssueRequest(BaseModel):
+    grants: List[BulkGrant]
+
 class TicketResponse(BaseModel):
     id: str
     park_name: str
@@ -72,124 +73,122 @@ def send_email_notification(email: str, coupon_code: str, value: int):
     print(f"Here is your coupon code: {coupon_code} (Value: ₹{value})")
     print(f"==========================================")
 
+# Notifications are sent in the background so endpoints never wait on delivery
+email_queue = EmailQueue(send_email_notification)
+
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+def require_admin(x_admin_key: Optional[str] = Header(None)):
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=503, detail="Admin API is not configured")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Admin key required")
+
+# Read-through caches for dashboard reads. Parks rarely change; coupon lists are
+# invalidated whenever this process redeems or issues a coupon for the user.
+PARKS_CACHE_TTL_SECONDS = float(os.getenv("PARKS_CACHE_TTL_SECONDS", "300"))
+COUPONS_CACHE_TTL_SECONDS = float(os.getenv("COUPONS_CACHE_TTL_SECONDS", "60"))
+parks_cache = TTLCache(PARKS_CACHE_TTL_SECONDS, max_entries=16)
+coupons_cache = TTLCache(COUPONS_CACHE_TTL_SECONDS)
+
+# Cached bodies are shaped by the response models, as FastAPI would on the way out
+coupon_list = TypeAdapter(List[CouponResponse])
+park_list = TypeAdapter(List[ParkResponse])
+
+def invalidate_user_coupons(user_id: str):
+    coupons_cache.invalidate(user_id.lower())
+
+def conditional_response(request: Request, entry: CachedBody, cache_control: str) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": cache_control}
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    candidates = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if entry.etag in candidates or "*" in candidates:
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+def raise_for_rpc_error(e: APIError, fallback: str):
+    # The redemption functions raise PTxxx SQLSTATEs for expected failures (xxx = HTTP status)
+    code = e.code or ""
+    if code.startswith("PT") and code[2:].isdigit():
+        raise HTTPException(status_code=int(code[2:]), detail=e.message)
+    print(f"Error during redemption: {e}")
+    raise HTTPException(status_code=500, detail=fallback)
+
 # Endpoints
 @router.post("/redeem", response_model=CouponResponse)
-def redeem_points(request: RedeemRequest, supabase: Client = Depends(get_supabase)):
-    # 1. Check User Balance
-    user_res = supabase.table("profiles").select("wallet_balance, id, full_name").eq("id", request.user_id).single().execute()
-    if not user_res.data:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    current_balance = user_res.data.get("wallet_balance", 0)
-    
-    if current_balance < request.points_to_redeem:
-        raise HTTPException(status_code=400, detail="Insufficient points")
-    
-    if request.points_to_redeem <= 0:
-        raise HTTPException(status_code=400, detail="Points must be greater than 0")
-
-    # 2. Conversion Logic
-    value_rupees = request.points_to_redeem * 10
-    
-    # 3. Generate Code
-    code = generate_coupon_code()
-    # Ensure uniqueness (simple retry logic could be added here, but relying on low collision for now)
-    
-    # 4. Atomic Transaction ?? 
-    # Supabase-py doesn't strictly support "transactions" in the same way as SQLAlchemy session.
-    # We will do: Deduct Points -> Create Coupon. If Coupon fails, we manually Revert points (optimistic).
-    # Ideally should use an RPC function in Postgres for atomicity.
-    
+async def redeem_points(request: RedeemRequest, supabase: AsyncClient = Depends(get_supabase)):
+    # Balance check, deduction and coupon insert happen in one transaction (coupon_functions.sql)
     try:
-        # Deduct Points
-        new_balance = current_balance - request.points_to_redeem
-        supabase.table("profiles").update({"wallet_balance": new_balance}).eq("id", request.user_id).execute()
-        
-        # Create Coupon
-        coupon_data = {
-            "user_id": request.user_id,
-            "code": code,
-            "points_used": request.points_to_redeem,
-            "value_rupees": value_rupees,
-            "status": "active"
-        }
-        res = supabase.table("coupon_codes").insert(coupon_data).execute()
-        created_coupon = res.data[0]
-        
-        # 5. Email
-        # In a real scenario we fetch email from auth.users or profiles if stored there
-        # For now, mocking with "user@example.com" or fetching if available
-        send_email_notification(f"user_{request.user_id}@aquawatch.com", code, value_rupees)
-        
-        return created_coupon
-
-    except Exception as e:
-        print(f"Error during redemption: {e}")
-        # Attempt rollback if points were deducted? 
-        # For this demo, raising 500.
-        raise HTTPException(status_code=500, detail=str(e))
+        res = await supabase.rpc("redeem_points", {
+            "p_user_id": request.user_id,
+            "p_points": request.points_to_redeem,
+        }).execute()
+    except APIError as e:
+        raise_for_rpc_error(e, "Redemption failed. Please try again.")
+
+    created_coupon = res.data
+    invalidate_user_coupons(request.user_id)
+
+    # In a real scenario we fetch email from auth.users or profiles if stored there
+    # For now, mocking with "user@example.com" or fetching if available
+    email_queue.enqueue(f"user_{request.user_id}@aquawatch.com", created_coupon["code"], created_coupon["value_rupees"])
+
+    return created_coupon
+
+@router.post("/admin/bulk-issue", dependencies=[Depends(require_admin)])
+async def bulk_issue_coupons(request: Request, supabase: AsyncClient = Depends(get_supabase)):
+    """
+    Issues coupons to many users at once for reward campaigns.
+
+    Accepts JSON ({"grants": [{"user_id": ..., "points": ...}, ...]}) or a streamed
+    text/csv body of user_id,points lines, and returns a result for every row.
+    """
+    if request.headers.get("content-type", "").startswith("text/csv"):
+        grants = grants_from_csv(request.stream())
+    else:
+        try:
+            body = BulkIssueRequest.model_validate(await request.json())
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        grants = grants_from_list(g.model_dump() for g in body.grants)
+
+    def notify(result):
+        invalidate_user_coupons(result["user_id"])
+        email_queue.enqueue(f"user_{result['user_id']}@aquawatch.com", result["code"], result["value_rupees"])
+
+    return await issue_coupons(supabase, grants, generate_coupon_code, on_issued=notify)
 
 @router.get("/my-coupons/{user_id}", response_model=List[CouponResponse])
-def get_my_coupons(user_id: str, supabase: Client = Depends(get_supabase)):
-    res = supabase.table("coupon_codes").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-    return res.data
+async def get_my_coupons(user_id: str, request: Request, supabase: AsyncClient = Depends(get_supabase)):
+    async def load():
+        res = await supabase.table("coupon_codes").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+        return coupon_list.validate_python(res.data)
 
-@router.get("/parks", response_model=List[ParkResponse])
-def get_parks(supabase: Client = Depends(get_supabase)):
-    res = supabase.table("parks_gardens").select("*").eq("is_active", True).execute()
-    return res.data
+    entry = await coupons_cache.get_or_load(user_id.lower(), load)
+    return conditional_response(request, entry, "private, no-cache")
 
-@router.post("/parks/redeem-ticket", response_model=TicketResponse)
-def redeem_park_ticket(request: TicketRedeemRequest, supabase: Client = Depends(get_supabase)):
-    # 1. Fetch Coupon
-    coupon_res = supabase.table("coupon_codes").select("*").eq("code", request.coupon_code).eq("user_id", request.user_id).execute()
-    if not coupon_res.data:
-        raise HTTPException(status_code=404, detail="Invalid Coupon Code")
-    
-    coupon = coupon_res.data[0]
-    
-    if coupon['status'] != 'active':
-        raise HTTPException(status_code=400, detail="Coupon is already used or expired")
+@router.get("/parks", response_model=List[ParkResponse])
+async def get_parks(request: Request, supabase: AsyncClient = Depends(get_supabase)):
+    async def load():
+        res = await supabase.table("parks_gardens").select("*").eq("is_active", True).execute()
+        return park_list.validate_python(res.data)
 
-    # 2. Fetch Park
-    park_res = supabase.table("parks_gardens").select("*").eq("id", request.park_id).single().execute()
-    if not park_res.data:
-        raise HTTPException(status_code=404, detail="Park not found")
-    
-    park = park_res.data
-    
-    # 3. Validate Value
-    if coupon['value_rupees'] < park['ticket_price']:
-        raise HTTPException(status_code=400, detail=f"Insufficient Coupon Value (₹{coupon['value_rupees']}). Ticket requires ₹{park['ticket_price']}")
+    entry = await parks_cache.get_or_load("active", load)
+    return conditional_response(request, entry, "public, max-age=60")
 
-    # 4. Atomic Redemption (Optimistic)
+@router.post("/parks/redeem-ticket", response_model=TicketResponse)
+async def redeem_park_ticket(request: TicketRedeemRequest, supabase: AsyncClient = Depends(get_supabase)):
+    # Coupon is locked, checked against the park price, redeemed and ticketed atomically
     try:
-        # Mark Coupon Redeemed
-        update_res = supabase.table("coupon_codes").update({
-            "status": "redeemed",
-            "redeemed_at": datetime.utcnow().isoformat()
-        }).eq("id", coupon['id']).execute()
-        
-        # Create Ticket
-        ticket_data = {
-            "user_id": request.user_id,
-            "park_id": request.park_id,
-            "coupon_code_id": coupon['id'],
-            "ticket_status": "valid"
-        }
-        ticket_res = supabase.table("park_tickets").insert(ticket_data).execute()
-        ticket = ticket_res.data[0]
-        
-        return {
-            "id": ticket['id'],
-            "park_name": park['name'],
-            "ticket_status": ticket['ticket_status'],
-            "issued_at": ticket['issued_at'],
-            "coupon_code": coupon['code']
-        }
-
-    except Exception as e:
-        print(e)
-        # In real world, we might need manual rollback here if coupon updated but ticket failed.
-        # supabase.table("coupon_codes").update({"status": "active", "redeemed_at": None}).eq("id", coupon['id']).execute()
-        raise HTTPException(status_code=500, detail="Transaction failed. Please contact support.")
+        res = await supabase.rpc("redeem_park_ticket", {
+            "p_user_id": request.user_id,
+            "p_park_id": request.park_id,
+            "p_coupon_code": request.coupon_code,
+        }).execute()
+    except APIError as e:
+        raise_for_rpc_error(e, "Transaction failed. Please contact support.")
+    finally:
+        # The coupon's status may have changed
+        invalidate_user_coupons(request.user_id)
+
+    return res.data
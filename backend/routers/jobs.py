@@ -0,0 +1,107 @@
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from uuid import UUID
+import asyncio
+import json
+import os
+import time
+
+from analysis_engine import engine
+from db import db
+from job_queue import JOB_WORKERS_IN_PROCESS, TERMINAL, JobStore, JobWorker, QueueFull
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+SSE_POLL_SECONDS = float(os.getenv("JOB_SSE_POLL_SECONDS", "0.5"))
+SSE_HEARTBEAT_SECONDS = 15.0
+
+# Opened in the app lifespan (see start/stop)
+store: Optional[JobStore] = None
+worker: Optional[JobWorker] = None
+
+def start():
+    global store, worker
+    if store is None:
+        store = JobStore()
+    if JOB_WORKERS_IN_PROCESS and worker is None:
+        worker = JobWorker(store, engine, lambda: db.client)
+        worker.start()
+
+async def stop():
+    global store, worker
+    if worker is not None:
+        await worker.stop()
+        worker = None
+    if store is not None:
+        store.close()
+        store = None
+
+def _require_store() -> JobStore:
+    if store is None:
+        raise HTTPException(status_code=503, detail="Job queue is not running")
+    return store
+
+def _get_job(job_id: str) -> dict:
+    job = _require_store().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("", status_code=202)
+async def submit_job(response: Response, file: UploadFile = File(...), submission_id: Optional[UUID] = Form(None)):
+    """
+    Queues an image for analysis and returns immediately with a job id. Poll
+    GET /api/jobs/{job_id} or subscribe to /api/jobs/{job_id}/events for the result.
+    When submission_id is given, its coverage_percent is updated once the job is done;
+    it must be a submission UUID (422 otherwise).
+    """
+    jobs = _require_store()
+    contents = await file.read()
+    try:
+        job = await run_in_threadpool(jobs.enqueue, contents, str(submission_id) if submission_id else None)
+    except QueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis queue is full, please retry shortly",
+            headers={"Retry-After": str(engine.retry_after())},
+        )
+    if worker is not None:
+        worker.wake()
+    response.headers["Location"] = f"{router.prefix}/{job['job_id']}"
+    return job
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    return _get_job(job_id)
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events: a `status` event whenever the job changes, ending once it is done or failed."""
+    # Store reads go to a thread: they wait on the lock a worker holds during its
+    # write transaction, which can block for the SQLite busy timeout
+    job = await run_in_threadpool(_get_job, job_id)
+
+    async def stream(job):
+        last_sent = time.monotonic()
+        yield f"event: status\ndata: {json.dumps(job)}\n\n"
+        while job["status"] not in TERMINAL:
+            await asyncio.sleep(SSE_POLL_SECONDS)
+            current = await run_in_threadpool(_require_store().get, job_id)
+            if current is None:
+                return
+            if (current["status"], current["attempts"]) != (job["status"], job["attempts"]):
+                job = current
+                last_sent = time.monotonic()
+                yield f"event: status\ndata: {json.dumps(job)}\n\n"
+            elif time.monotonic() - last_sent > SSE_HEARTBEAT_SECONDS:
+                # Comment line keeps proxies from closing an idle stream
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        stream(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,112 @@
+"""
+Streaming export of submission histories as CSV or NDJSON.
+
+Rows are read with keyset pagination on (created_at, id) in bounded pages and
+encoded (and optionally gzipped) one page at a time, so memory stays flat
+however many rows match. The response is consumed as it is produced: the next
+page is fetched only once the client has taken the previous one.
+"""
+import csv
+import io
+import json
+import os
+import zlib
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+# fetch(cursor, limit) -> submissions ordered by (created_at, id) strictly after cursor
+FetchPage = Callable[[Optional[Tuple[str, str]], int], Awaitable[List[dict]]]
+
+EXPORT_COLUMNS = (
+    "id", "user_id", "created_at", "updated_at", "status",
+    "coverage_percent", "latitude", "longitude", "image_url",
+)
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+EXPORT_MAX_PAGE_SIZE = 5000
+GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+
+async def iter_pages(fetch_page: FetchPage, page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[List[dict]]:
+    cursor = None
+    while True:
+        rows = await fetch_page(cursor, page_size)
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1]["created_at"], rows[-1]["id"])
+
+
+async def prefetch_first(pages: AsyncIterator[List[dict]]) -> AsyncIterator[List[dict]]:
+    """
+    Reads the first page now and returns an iterator over all pages, so a failing
+    query surfaces as an HTTP error before the response starts instead of as an
+    empty export.
+    """
+    try:
+        first = await pages.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def chained():
+        if first is not None:
+            yield first
+            async for rows in pages:
+                yield rows
+
+    return chained()
+
+
+def encode_page(rows: List[dict], fmt: str, header: bool = False) -> str:
+    if fmt == "ndjson":
+        return "".join(
+            json.dumps({column: row.get(column) for column in EXPORT_COLUMNS}, separators=(",", ":")) + "\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows([row.get(column) for column in EXPORT_COLUMNS] for row in rows)
+    return buffer.getvalue()
+
+
+async def export_chunks(pages: AsyncIterator[List[dict]], fmt: str, compress: bool = False) -> AsyncIterator[bytes]:
+    """
+    Encoded export body, one chunk per page. With compress, a single gzip stream.
+    If reading fails part way, NDJSON gets an {"error": ...} line, and the error
+    is re-raised either way so the server aborts the response without its final
+    chunk (and a gzip body is left unterminated): a truncated export is never
+    mistaken for a complete one.
+    """
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+    def emit(text: str) -> bytes:
+        data = text.encode()
+        return compressor.compress(data) if compressor is not None else data
+
+    header = fmt == "csv"
+    if header:
+        chunk = emit(encode_page([], fmt, header=True))
+        if chunk:
+            yield chunk
+
+    try:
+        async for rows in pages:
+            chunk = emit(encode_page(rows, fmt))
+            if chunk:
+                yield chunk
+    except Exception as e:
+        print(f"Export failed: {e}")
+        if fmt == "ndjson":
+            chunk = emit(json.dumps({"error": "Export interrupted"}) + "\n")
+            yield chunk + (compressor.flush(zlib.Z_SYNC_FLUSH) if compressor is not None else b"")
+        raise
+
+    if compressor is not None:
+        yield compressor.flush()
@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import io
+import json
+import signal
+import tarfile
+import threading
+import time
+import unittest
+import zipfile
+from unittest import mock
+import numpy as np
+import cv2
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from analysis_engine import AnalysisEngine, EngineSaturated, WorkerLost
+import batch_analysis
+from batch_analysis import stream_batch_results
+from result_cache import ResultCache
+
+
+def make_green_image_bytes():
+    img = np.zeros((100, 100, 3), dtype=np.uint8)
+    img[0:50, :, 1] = np.random.randint(150, 255, (50, 100))
+    _, encoded_img = cv2.imencode('.jpg', img)
+    return encoded_img.tobytes()
+
+
+class TestAnalysisEngine(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = AnalysisEngine(workers=1, max_pending=2)
+        cls.engine.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.shutdown()
+
+    async def test_start_warms_every_worker(self):
+        self.assertTrue(self.engine.ready)
+        worker = self.engine.startup["workers"][0]
+        self.assertGreater(worker["import_seconds"], 0)
+        self.assertGreater(worker["warm_up_seconds"], 0)
+
+    async def test_each_worker_warms_up_once(self):
+        engine = AnalysisEngine(workers=3)
+        try:
+            await asyncio.to_thread(engine.start)
+            pids = [w["pid"] for w in engine.startup["workers"]]
+            self.assertEqual(len(set(pids)), 3)
+            self.assertTrue(all(w["import_seconds"] > 0 for w in engine.startup["workers"]))
+        finally:
+            engine.shutdown()
+
+    async def test_dead_worker_pool_is_replaced(self):
+        engine = AnalysisEngine(workers=1)
+        try:
+            await asyncio.to_thread(engine.start)
+            img_bytes = make_green_image_bytes()
+            await engine.analyze(img_bytes)
+
+            os.kill(engine.startup["workers"][0]["pid"], signal.SIGKILL)  # e.g. the OOM killer
+            with self.assertRaises(WorkerLost):
+                for _ in range(50):  # until the pool notices
+                    await engine.analyze(img_bytes)
+                    await asyncio.sleep(0.05)
+            self.assertFalse(engine.ready)
+            self.assertEqual(engine.restarts, 1)
+
+            deadline = time.monotonic() + 30
+            while not engine.ready and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            self.assertTrue(engine.ready)
+            self.assertTrue(30 <= await engine.analyze(img_bytes) <= 60)
+        finally:
+            engine.shutdown()
+
+    async def test_warm_up_holds_worker_until_all_are_warm(self):
+        import analysis_engine
+        barrier = threading.Barrier(2)
+        with mock.patch.dict(analysis_engine._worker_startup, {"barrier": barrier}):
+            warming = asyncio.ensure_future(asyncio.to_thread(analysis_engine._warm_up))
+            await asyncio.sleep(0.3)
+            self.assertFalse(warming.done())  # a fast worker can't pick up a second warm-up task
+            await asyncio.to_thread(barrier.wait, 5)
+            self.assertEqual((await warming)["pid"], os.getpid())
+
+    async def test_submit_starts_pool_off_the_event_loop(self):
+        engine = AnalysisEngine(workers=1)
+        try:
+            self.assertFalse(engine.ready)
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            ticker = asyncio.ensure_future(tick())
+            coverage = await engine.analyze(make_green_image_bytes())
+            ticker.cancel()
+            self.assertTrue(40 <= coverage <= 60)
+            self.assertTrue(engine.ready)
+            self.assertGreater(ticks, 5)  # the loop kept running while workers spawned
+        finally:
+            engine.shutdown()
+        self.assertFalse(engine.ready)
+
+    async def test_analyze_in_pool(self):
+        coverage = await self.engine.analyze(make_green_image_bytes())
+        self.assertTrue(40 <= coverage <= 60, f"Coverage {coverage}% not within expected range 40-60%")
+
+    async def test_saturation_rejects(self):
+        img_bytes = make_green_image_bytes()
+        tasks = [asyncio.ensure_future(self.engine.analyze(img_bytes)) for _ in range(2)]
+        await asyncio.sleep(0)  # let both tasks take their admission slot
+
+        with self.assertRaises(EngineSaturated) as ctx:
+            await self.engine.analyze(img_bytes)
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.engine.pending, 0)
+
+    async def test_overlay_cached_by_image_hash(self):
+        img_bytes = make_green_image_bytes()
+        digest = hashlib.sha256(img_bytes).hexdigest()
+        self.engine.cache = ResultCache()
+        try:
+            self.assertIsNone(self.engine.cached_overlay(digest, 0.5, "rle"))
+            result = await self.engine.analyze_overlay(img_bytes, 0.5, "rle")
+            self.assertEqual(result["overlay"]["size"], [50, 50])
+            self.assertEqual(self.engine.cached_overlay(digest.upper(), 0.50, "rle"), result)
+            self.assertIsNone(self.engine.cached_overlay(digest, 0.5, "png"))
+        finally:
+            self.engine.cache = None
+
+    async def test_batch_streams_results_and_summary(self):
+        img_bytes = make_green_image_bytes()
+        images = iter([(f"img_{i}.jpg", img_bytes) for i in range(4)] + [("broken.jpg", b"not an image")])
+
+        lines = [json.loads(line) async for line in stream_batch_results(self.engine, images)]
+
+        summary = lines[-1]["summary"]
+        self.assertEqual(summary["images"], 5)
+        self.assertEqual(sorted(r["index"] for r in lines[:-1]), [0, 1, 2, 3, 4])
+        self.assertEqual((summary["analyzed"], summary["failed"]), (4, 1))
+        broken = next(r for r in lines[:-1] if r["name"] == "broken.jpg")
+        self.assertNotIn("coverage_percent", broken)
+        self.assertIn("decode", broken["error"])
+        self.assertTrue(30 <= summary["average_coverage"] <= 50)
+
+    async def test_batch_reads_uploads_off_the_event_loop(self):
+        img_bytes = make_green_image_bytes()
+        readers = []
+
+        def images():
+            for i in range(3):
+                readers.append(threading.current_thread())
+                yield f"img_{i}.jpg", img_bytes
+            yield "huge.jpg", ValueError("Image is over the byte limit")
+
+        lines = [json.loads(line) async for line in stream_batch_results(self.engine, images())]
+        self.assertNotIn(threading.main_thread(), readers)
+        self.assertEqual(lines[-1]["summary"]["failed"], 1)
+        self.assertIn("limit", next(r for r in lines[:-1] if r["name"] == "huge.jpg")["error"])
+
+    async def test_batch_summary_counts_images_past_the_limit(self):
+        from starlette.datastructures import UploadFile
+
+        img_bytes = make_green_image_bytes()
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tf:
+            for i in range(4):
+                info = tarfile.TarInfo(f"survey/{i}.jpg")
+                info.size = len(img_bytes)
+                tf.addfile(info, io.BytesIO(img_bytes))
+        buf.seek(0)
+
+        with mock.patch.object(batch_analysis, "MAX_BATCH_IMAGES", 3):
+            images = batch_analysis.iter_batch_images([
+                UploadFile(buf, filename="survey.tar"),
+                UploadFile(io.BytesIO(img_bytes), filename="extra.jpg"),
+            ])
+        lines = [json.loads(line) async for line in stream_batch_results(self.engine, images)]
+
+        summary = lines[-1]["summary"]
+        self.assertEqual((summary["images"], summary["analyzed"], summary["skipped"]), (3, 3, 2))
+        self.assertNotIn("extra.jpg", [r["name"] for r in lines[:-1]])
+
+
+class TestTiledThreads(unittest.IsolatedAsyncioTestCase):
+    async def test_tiled_job_uses_one_workers_share_of_the_cores(self):
+        import tempfile
+        from concurrent.futures import ThreadPoolExecutor
+        import analysis_engine
+        import image_processing
+
+        engine = AnalysisEngine(workers=4)
+        with mock.patch("os.cpu_count", return_value=8), \
+                mock.patch.object(engine, "submit", mock.AsyncMock(return_value={})) as submit:
+            await engine.analyze_tiled("survey.npy", 256, 16)
+        self.assertEqual(submit.call_args.args[1:], ("survey.npy", 256, 16, 2))
+        self.assertEqual(AnalysisEngine(workers=16).tile_threads, 1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "survey.npy")
+            np.save(path, np.zeros((512, 512, 3), dtype=np.uint8))
+            with mock.patch.object(image_processing, "ThreadPoolExecutor", wraps=ThreadPoolExecutor) as pool:
+                analysis_engine._run_tiled_detection(path, 256, 16, 2)
+        pool.assert_called_once_with(max_workers=2)
+
+
+class TestBatchArchive(unittest.TestCase):
+    def test_tar_archive_is_expanded(self):
+        from starlette.datastructures import UploadFile
+        from batch_analysis import iter_batch_images
+
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+            for name in ("survey/a.jpg", "survey/b.png", "survey/notes.txt"):
+                info = tarfile.TarInfo(name)
+                info.size = 3
+                tf.addfile(info, io.BytesIO(b"abc"))
+        buf.seek(0)
+
+        upload = UploadFile(buf, filename="survey.tar.gz")
+        names = [name for name, _ in iter_batch_images([upload])]
+        self.assertEqual(names, ["survey/a.jpg", "survey/b.png"])
+
+
+    def test_oversized_members_are_not_read(self):
+        from starlette.datastructures import UploadFile
+        from batch_analysis import iter_batch_images
+
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("small.jpg", b"x" * 10)
+            zf.writestr("bomb.jpg", b"\0" * 10000)  # compresses to a few bytes
+        buf.seek(0)
+
+        with mock.patch.object(batch_analysis, "MAX_BATCH_IMAGE_BYTES", 100):
+            items = dict(iter_batch_images([
+                UploadFile(buf, filename="survey.zip"),
+                UploadFile(io.BytesIO(b"y" * 200), filename="plain.jpg"),
+            ]))
+        self.assertEqual(items["small.jpg"], b"x" * 10)
+        self.assertIsInstance(items["bomb.jpg"], ValueError)
+        self.assertIsInstance(items["plain.jpg"], ValueError)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+import uuid
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from fastapi import Response
+
+from benchmarks.stubs import FakeSupabase, make_submissions, reference_rpcs
+from testing_postgres import PostgresUnavailable, drop_database, fresh_database
+
+
+class TestAnalyticsFunctions(unittest.TestCase):
+    """Runs analytics_functions.sql on a local Postgres and checks it against the Python aggregation."""
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.uri = fresh_database(["analytics_functions.sql"])
+        except PostgresUnavailable as e:
+            raise unittest.SkipTest(str(e))
+
+        import psycopg
+        cls.conn = psycopg.connect(cls.uri, autocommit=True)
+
+        users = [uuid.uuid4() for _ in range(5)]
+        for user_id in users:
+            cls.conn.execute("insert into auth.users (id) values (%s)", (user_id,))
+
+        cls.rows = make_submissions(400, seed=3)
+        cls.rows[0]["coverage_percent"] = 0.0
+        cls.rows[1]["latitude"] = None
+        for i, row in enumerate(cls.rows):
+            row["user_id"] = str(users[i % len(users)])
+        with cls.conn.cursor() as cur:
+            cur.executemany(
+                "insert into submissions (id, user_id, image_url, latitude, longitude, coverage_percent, status, created_at)"
+                " values (%(id)s, %(user_id)s, %(image_url)s, %(latitude)s, %(longitude)s, %(coverage_percent)s, %(status)s, %(created_at)s)",
+                cls.rows,
+            )
+        cls.reference = reference_rpcs(cls.rows)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        drop_database(cls.uri)
+
+    def query(self, sql, *params):
+        with self.conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def test_severity_by_area(self):
+        rows = self.query("select latitude, longitude, severity, submissions from analytics_severity_by_area(10)")
+        expected = self.reference["analytics_severity_by_area"]({"p_limit": 10})
+        self.assertEqual(len(rows), 10)
+        for (lat, lon, severity, count), ref in zip(rows, expected):
+            self.assertAlmostEqual(float(lat), ref["latitude"], places=6)
+            self.assertAlmostEqual(float(lon), ref["longitude"], places=6)
+            self.assertAlmostEqual(severity, ref["severity"], places=6)
+            self.assertEqual(count, ref["submissions"])
+
+    def test_daily_trend(self):
+        rows = self.query("select day, average_coverage, submissions from analytics_daily_trend()")
+        expected = self.reference["analytics_daily_trend"]({})
+        self.assertEqual([str(r[0]) for r in rows], [e["day"] for e in expected])
+        for (_, avg, count), ref in zip(rows, expected):
+            self.assertAlmostEqual(avg, ref["average_coverage"], places=6)
+            self.assertEqual(count, ref["submissions"])
+
+        first_day = rows[0][0]
+        window = self.query("select day from analytics_daily_trend(%s, %s)", first_day, first_day)
+        self.assertEqual(window, [(first_day,)])
+
+    def test_status_counts(self):
+        rows = dict(self.query("select status, count from analytics_status_counts()"))
+        expected = {r["status"]: r["count"] for r in self.reference["analytics_status_counts"]({})}
+        self.assertEqual(rows, expected)
+        self.assertEqual(sum(rows.values()), len(self.rows))
+
+
+    def test_updates_bump_updated_at(self):
+        row_id = self.rows[5]["id"]
+        before = self.query("select updated_at from submissions where id = %s", row_id)[0][0]
+        self.conn.execute("update submissions set status = 'completed' where id = %s", (row_id,))
+        after = self.query("select updated_at from submissions where id = %s", row_id)[0][0]
+        self.assertGreater(after, before)
+
+
+class TestAnalyticsEndpoints(unittest.TestCase):
+    def call_endpoints(self, analytics):
+        return (
+            asyncio.run(analytics.get_severity_by_area(Response())),
+            asyncio.run(analytics.get_infestation_trend(Response())),
+            asyncio.run(analytics.get_status_distribution(Response())),
+        )
+
+    def test_store_and_rpc_paths_agree(self):
+        from analytics_store import AnalyticsStore
+        from db import db
+        from routers import analytics
+
+        rows = make_submissions(300, seed=1)
+        original_client, original_store = db.client, analytics.store
+        db.client = FakeSupabase({"submissions": rows})
+        try:
+            analytics.store = AnalyticsStore(analytics.fetch_submissions_page)
+            from_store = self.call_endpoints(analytics)
+
+            async def unavailable(cursor, limit):
+                raise ConnectionError("database unreachable")
+            analytics.store = AnalyticsStore(unavailable)
+            from_rpc = self.call_endpoints(analytics)
+        finally:
+            db.client, analytics.store = original_client, original_store
+
+        severity, trend, status = from_store
+        self.assertEqual(len(severity), 10)
+        self.assertTrue(severity[0]["name"].startswith("Area "))
+        self.assertEqual(sum(s["value"] for s in status), 300)
+        self.assertEqual(from_store, from_rpc)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import asyncio
+import unittest
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from analytics_store import AnalyticsStore
+from benchmarks.stubs import make_submissions, reference_rpcs
+
+
+class FakeSubmissions:
+    """In-memory table answering keyset queries on (updated_at, id)."""
+
+    def __init__(self, rows):
+        self.rows = {row["id"]: dict(row) for row in rows}
+        self.fetched = 0
+
+    async def fetch_page(self, cursor, limit):
+        ordered = sorted(self.rows.values(), key=lambda r: (r["updated_at"], r["id"]))
+        if cursor is not None:
+            ordered = [r for r in ordered if (r["updated_at"], r["id"]) > cursor]
+        page = [dict(r) for r in ordered[:limit]]
+        self.fetched += len(page)
+        return page
+
+    def update(self, row_id, updated_at, **changes):
+        self.rows[row_id].update(changes, updated_at=updated_at)
+
+
+def expected_status(rows):
+    counts = {r["status"]: r["count"] for r in reference_rpcs(rows)["analytics_status_counts"]({})}
+    return [counts.get(key, 0) for key in ("pending", "accepted", "completed", "rejected")]
+
+
+class TestAnalyticsStore(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_submissions(250, seed=7)
+        self.table = FakeSubmissions(self.rows)
+        self.store = AnalyticsStore(self.table.fetch_page, page_size=40, max_age=0, overlap=0)
+
+    def refresh(self):
+        asyncio.run(self.store.refresh(force=True))
+
+    def test_initial_load_matches_full_aggregation(self):
+        self.refresh()
+        reference = reference_rpcs(self.rows)
+
+        expected_trend = reference["analytics_daily_trend"]({})
+        self.assertEqual(self.store.trend(), [
+            {"date": r["day"], "average_coverage": round(r["average_coverage"], 1), "submissions": r["submissions"]}
+            for r in expected_trend
+        ])
+        expected_top = reference["analytics_severity_by_area"]({"p_limit": 10})
+        self.assertEqual([s["severity"] for s in self.store.severity(10)],
+                         [round(r["severity"], 1) for r in expected_top])
+        self.assertEqual([s["value"] for s in self.store.status()], expected_status(self.rows))
+        self.assertEqual(self.table.fetched, 250)
+
+    def test_delta_refresh_fetches_only_changed_rows(self):
+        self.refresh()
+        self.table.fetched = 0
+
+        target = self.rows[10]
+        new_status = "rejected" if target["status"] != "rejected" else "completed"
+        self.table.update(target["id"], "2030-01-01T00:00:00+00:00", status=new_status, coverage_percent=99.0)
+        self.refresh()
+
+        self.assertEqual(self.table.fetched, 1)
+        current = list(self.table.rows.values())
+        self.assertEqual([s["value"] for s in self.store.status()], expected_status(current))
+        self.assertEqual(sum(s["value"] for s in self.store.status()), 250)
+
+        reference = reference_rpcs(current)["analytics_daily_trend"]({})
+        day = target["created_at"].split("T")[0]
+        expected_day = next(r for r in reference if r["day"] == day)
+        actual_day = next(t for t in self.store.trend() if t["date"] == day)
+        self.assertEqual(actual_day["average_coverage"], round(expected_day["average_coverage"], 1))
+
+    def test_geo_index_follows_location_changes(self):
+        self.refresh()
+        target = self.rows[3]
+        self.table.update(target["id"], "2030-01-01T00:00:00+00:00", latitude=-33.86, longitude=151.2)
+        self.refresh()
+
+        sydney = self.store.geo.points((-34.0, 151.0, -33.0, 152.0), limit=10)
+        self.assertEqual([p["id"] for p in sydney], [target["id"]])
+        world = (-90.0, -180.0, 90.0, 180.0)
+        self.assertEqual(sum(c["count"] for c in self.store.geo.clusters(world, 2)), 250)
+
+    def test_unchanged_table_refetches_nothing(self):
+        self.refresh()
+        self.table.fetched = 0
+        self.refresh()
+        self.assertEqual(self.table.fetched, 0)
+        self.assertIsNotNone(self.store.refreshed_at)
+
+    def test_periodic_full_resync_drops_deleted_rows(self):
+        self.refresh()
+        deleted = self.table.rows.pop(self.rows[0]["id"])
+        self.store.full_resync_every = 0
+        self.refresh()
+
+        self.assertNotIn(deleted["id"], self.store.contributions)
+        self.assertEqual(sum(s["value"] for s in self.store.status()), 249)
+
+
+if __name__ == '__main__':
+    unittest.main()
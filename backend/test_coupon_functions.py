@@ -0,0 +1,141 @@
+import unittest
+import uuid
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from testing_postgres import PostgresUnavailable, drop_database, fresh_database
+
+
+class TestRedemptionFunctions(unittest.TestCase):
+    """Runs coupon_functions.sql on a local Postgres and hammers it with concurrent redemptions."""
+
+    WORKERS = 16
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.uri = fresh_database(["backend/coupon_functions.sql"])
+        except PostgresUnavailable as e:
+            raise unittest.SkipTest(str(e))
+
+        import psycopg
+        cls.psycopg = psycopg
+        cls.conn = psycopg.connect(cls.uri, autocommit=True)
+        cls.park_id = cls.conn.execute(
+            "insert into parks_gardens (name, city, state, ticket_price) values ('Lalbagh', 'Bengaluru', 'KA', 100) returning id"
+        ).fetchone()[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        drop_database(cls.uri)
+
+    def make_user(self, balance: int) -> uuid.UUID:
+        user_id = uuid.uuid4()
+        # handle_new_user creates the profile
+        self.conn.execute("insert into auth.users (id) values (%s)", (user_id,))
+        self.conn.execute("update profiles set wallet_balance = %s where id = %s", (balance, user_id))
+        return user_id
+
+    def run_concurrently(self, calls):
+        """Runs (sql, params) calls on WORKERS connections; returns the result or SQLSTATE of each."""
+        def work(chunk):
+            results = []
+            with self.psycopg.connect(self.uri, autocommit=True) as conn:
+                for sql, params in chunk:
+                    try:
+                        results.append(conn.execute(sql, params).fetchone()[0])
+                    except self.psycopg.Error as e:
+                        results.append(e.sqlstate)
+            return results
+
+        chunks = [calls[i::self.WORKERS] for i in range(self.WORKERS)]
+        with ThreadPoolExecutor(self.WORKERS) as pool:
+            return [r for chunk in pool.map(work, chunks) for r in chunk]
+
+    def test_concurrent_redemptions_never_overspend(self):
+        users = [self.make_user(50) for _ in range(3)]
+        calls = [("select code from redeem_points(%s, 1)", (user_id,)) for user_id in users for _ in range(100)]
+        results = self.run_concurrently(calls)
+
+        self.assertEqual(sum(1 for r in results if r.startswith("AQW-")), 150)
+        self.assertEqual(results.count("PT400"), 150)
+        for user_id in users:
+            balance = self.conn.execute("select wallet_balance from profiles where id = %s", (user_id,)).fetchone()[0]
+            spent = self.conn.execute(
+                "select count(*), sum(points_used), sum(value_rupees) from coupon_codes where user_id = %s", (user_id,)
+            ).fetchone()
+            self.assertEqual(balance, 0)
+            self.assertEqual(spent, (50, 50, 500))
+
+    def test_redeem_points_errors(self):
+        user_id = self.make_user(5)
+        for sql, params, sqlstate, message in (
+            ("select redeem_points(%s, 1)", (uuid.uuid4(),), "PT404", "User not found"),
+            ("select redeem_points(%s, 0)", (user_id,), "PT400", "Points must be greater than 0"),
+            ("select redeem_points(%s, 6)", (user_id,), "PT400", "Insufficient points"),
+        ):
+            with self.assertRaises(self.psycopg.Error) as ctx:
+                self.conn.execute(sql, params)
+            self.assertEqual(ctx.exception.sqlstate, sqlstate)
+            self.assertIn(message, str(ctx.exception))
+        balance = self.conn.execute("select wallet_balance from profiles where id = %s", (user_id,)).fetchone()[0]
+        self.assertEqual(balance, 5)
+
+    def test_code_collisions_are_retried(self):
+        user_id = self.make_user(10)
+        code = self.conn.execute("select code from redeem_points(%s, 1)", (user_id,)).fetchone()[0]
+        self.assertRegex(code, r"^AQW-[A-Z0-9]{4}-[A-Z0-9]{4}$")
+
+        # Force the generator to repeat the existing code before yielding a new one
+        with self.psycopg.connect(self.uri, autocommit=True) as conn:
+            conn.execute("create sequence collision_seq")
+            conn.execute(
+                "create or replace function coupon_generate_code() returns text language sql volatile as"
+                " $$ select case when nextval('collision_seq') < 3 then %s else 'AQW-TEST-0001' end $$" % repr(code)
+            )
+            try:
+                new_code = conn.execute("select code from redeem_points(%s, 1)", (user_id,)).fetchone()[0]
+            finally:
+                conn.execute("drop sequence collision_seq")
+                conn.execute(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "coupon_functions.sql")).read())
+
+        self.assertEqual(new_code, "AQW-TEST-0001")
+        balance = self.conn.execute("select wallet_balance from profiles where id = %s", (user_id,)).fetchone()[0]
+        self.assertEqual(balance, 8)
+
+    def test_coupon_buys_exactly_one_ticket(self):
+        user_id = self.make_user(20)
+        code = self.conn.execute("select code from redeem_points(%s, 10)", (user_id,)).fetchone()[0]
+        calls = [("select redeem_park_ticket(%s, %s, %s)", (user_id, self.park_id, code))] * 50
+        results = self.run_concurrently(calls)
+
+        tickets = [r for r in results if isinstance(r, dict)]
+        self.assertEqual(len(tickets), 1)
+        self.assertEqual(tickets[0]["park_name"], "Lalbagh")
+        self.assertEqual(tickets[0]["coupon_code"], code)
+        self.assertEqual(results.count("PT400"), 49)
+        status = self.conn.execute("select status from coupon_codes where code = %s", (code,)).fetchone()[0]
+        self.assertEqual(status, "redeemed")
+
+    def test_park_ticket_errors(self):
+        user_id = self.make_user(5)
+        cheap = self.conn.execute("select code from redeem_points(%s, 5)", (user_id,)).fetchone()[0]
+        for params, sqlstate in (
+            ((user_id, self.park_id, "AQW-NONE-NONE"), "PT404"),
+            ((user_id, uuid.uuid4(), cheap), "PT404"),
+            ((user_id, self.park_id, cheap), "PT400"),  # ₹50 coupon, ₹100 ticket
+        ):
+            with self.assertRaises(self.psycopg.Error) as ctx:
+                self.conn.execute("select redeem_park_ticket(%s, %s, %s)", params)
+            self.assertEqual(ctx.exception.sqlstate, sqlstate)
+        status = self.conn.execute("select status from coupon_codes where code = %s", (cheap,)).fetchone()[0]
+        self.assertEqual(status, "active")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import asyncio
+import unittest
+import uuid
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from postgrest import APIError
+
+from benchmarks.stubs import FakeSupabase
+from coupon_issuance import IN_FILTER_MAX, grants_from_csv, grants_from_list, issue_batch, issue_coupons
+from db import get_supabase
+from email_queue import EmailQueue
+from routers import coupons
+
+
+async def collect(agen):
+    return [item async for item in agen]
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class RecordingQueue:
+    def __init__(self):
+        self.sent = []
+
+    def enqueue(self, *args):
+        self.sent.append(args)
+        return True
+
+
+class TestBulkIssuance(unittest.TestCase):
+    def setUp(self):
+        self.users = [str(uuid.uuid4()) for _ in range(3)]
+        self.supabase = FakeSupabase({"profiles": [{"id": u} for u in self.users], "coupon_codes": []})
+
+        app = FastAPI()
+        app.include_router(coupons.router)
+        app.dependency_overrides[get_supabase] = lambda: self.supabase
+        self.client = TestClient(app)
+
+        self.queue = RecordingQueue()
+        self.original = coupons.ADMIN_API_KEY, coupons.email_queue
+        coupons.ADMIN_API_KEY, coupons.email_queue = "secret", self.queue
+
+    def tearDown(self):
+        coupons.ADMIN_API_KEY, coupons.email_queue = self.original
+
+    def post(self, **kwargs):
+        return self.client.post("/api/coupons/admin/bulk-issue", headers={"X-Admin-Key": "secret", **kwargs.pop("headers", {})}, **kwargs)
+
+    def test_json_grants_report_every_row(self):
+        grants = [
+            {"user_id": self.users[0], "points": 5},
+            {"user_id": "not-a-uuid", "points": 5},
+            {"user_id": str(uuid.uuid4()), "points": 5},
+            {"user_id": self.users[1], "points": 0},
+            {"user_id": self.users[2], "points": 7},
+        ]
+        res = self.post(json={"grants": grants})
+        self.assertEqual(res.status_code, 200)
+        report = res.json()
+
+        self.assertEqual((report["issued"], report["failed"]), (2, 3))
+        self.assertEqual([r["row"] for r in report["results"]], [1, 2, 3, 4, 5])
+        self.assertEqual(
+            [r.get("error") for r in report["results"]],
+            [None, "Invalid user_id", "User not found", "Points must be greater than 0", None],
+        )
+        issued = [r for r in report["results"] if r["status"] == "issued"]
+        self.assertEqual([r["value_rupees"] for r in issued], [50, 70])
+        for r in issued:
+            self.assertRegex(r["code"], r"^AQW-[A-Z0-9]{4}-[A-Z0-9]{4}$")
+        self.assertEqual(len(self.supabase.tables["coupon_codes"]), 2)
+        self.assertEqual([args[1] for args in self.queue.sent], [r["code"] for r in issued])
+
+    def test_csv_stream_in_batches(self):
+        body = "user_id,points\n" + "".join(f"{self.users[i % 3]},{i + 1}\n" for i in range(1200))
+        res = self.post(content=body.encode(), headers={"Content-Type": "text/csv"})
+        self.assertEqual(res.status_code, 200)
+        report = res.json()
+        self.assertEqual(report["issued"], 1200)
+        self.assertFalse(report["truncated"])
+        codes = [r["code"] for r in report["results"]]
+        self.assertEqual(len(set(codes)), 1200)
+
+    def test_requires_admin_key(self):
+        res = self.client.post("/api/coupons/admin/bulk-issue", json={"grants": []})
+        self.assertEqual(res.status_code, 403)
+        res = self.post(headers={"X-Admin-Key": "wrong"}, json={"grants": []})
+        self.assertEqual(res.status_code, 403)
+
+    def test_codes_colliding_with_existing_ones_are_replaced(self):
+        self.supabase.tables["coupon_codes"].append({"id": "x", "code": "AQW-AAAA-AAAA"})
+        generated = iter(["AQW-AAAA-AAAA", "AQW-AAAA-AAAA", "AQW-BBBB-BBBB", "AQW-CCCC-CCCC"])
+        grants = [(1, self.users[0], 1), (2, self.users[1], 2)]
+
+        results = asyncio.run(issue_batch(self.supabase, grants, lambda: next(generated)))
+
+        self.assertEqual(sorted(r["code"] for r in results), ["AQW-BBBB-BBBB", "AQW-CCCC-CCCC"])
+
+    def test_in_filters_stay_short(self):
+        users = [str(uuid.uuid4()) for _ in range(500)]
+        self.supabase.tables["profiles"] = [{"id": u} for u in users[:-1]]
+        filters = []
+        table = self.supabase.table
+
+        def recording_table(name):
+            query = table(name)
+            in_ = query.in_
+            query.in_ = lambda column, values: filters.append(list(values)) or in_(column, values)
+            return query
+
+        self.supabase.table = recording_table
+        grants = [(i + 1, u, 1) for i, u in enumerate(users)]
+        results = asyncio.run(issue_batch(self.supabase, grants, coupons.generate_coupon_code))
+
+        self.assertEqual(sum(r["status"] == "issued" for r in results), 499)
+        self.assertEqual(results[-1]["error"], "User not found")
+        self.assertTrue(filters)
+        # in.(...) values as they appear in the GET URL, percent-encoded commas and all
+        self.assertTrue(all(len(values) <= IN_FILTER_MAX for values in filters))
+        self.assertLess(max(len("%2C".join(values)) for values in filters), 8 * 1024)
+
+    def test_failing_batch_keeps_the_report(self):
+        table = self.supabase.table
+        checks = []
+
+        def flaky_table(name):
+            if name == "profiles":
+                checks.append(name)
+                if len(checks) == 2:
+                    raise httpx.ReadTimeout("timed out")
+                if len(checks) == 3:
+                    raise APIError({"message": "boom", "code": "XX000"})
+            elif len(checks) == 4:
+                raise httpx.ReadTimeout("timed out")
+            return table(name)
+
+        self.supabase.table = flaky_table
+        grants = grants_from_list([{"user_id": self.users[i % 3], "points": 1} for i in range(5)])
+        report = asyncio.run(issue_coupons(self.supabase, grants, coupons.generate_coupon_code, batch_size=1))
+
+        self.assertEqual([r["status"] for r in report["results"]], ["issued", "failed", "failed", "failed", "issued"])
+        self.assertEqual(
+            [r["error"] for r in report["results"][1:4]],
+            ["User check failed", "User check failed", "Insert outcome unknown, check before retrying"],
+        )
+        self.assertEqual(len(self.supabase.tables["coupon_codes"]), 2)
+
+    def test_csv_parser_handles_split_chunks(self):
+        body = f"user_id,points\n{self.users[0]},3\n\nbroken-line\n{self.users[1]},4".encode()
+        grants = asyncio.run(collect(grants_from_csv(chunked(body, 7))))
+        self.assertEqual(grants, [(1, self.users[0], "3"), (2, "broken-line", None), (3, self.users[1], "4")])
+
+
+class TestEmailQueue(unittest.TestCase):
+    def test_close_delivers_queued_emails(self):
+        delivered = []
+
+        def send(email, code, value):
+            if code == "bad":
+                raise RuntimeError("smtp down")
+            delivered.append(code)
+
+        async def scenario():
+            queue = EmailQueue(send, workers=2)
+            for i in range(20):
+                queue.enqueue("a@example.com", f"code-{i}", 10)
+            queue.enqueue("a@example.com", "bad", 10)
+            await queue.close()
+            return queue
+
+        queue = asyncio.run(scenario())
+        self.assertEqual(sorted(delivered), sorted(f"code-{i}" for i in range(20)))
+        self.assertEqual((queue.sent, queue.failed, queue.pending), (20, 1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import io
+import unittest
+import numpy as np
+import cv2
+import sys
+import os
+from PIL import Image
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from image_processing import compute_hyacinth_mask, decode_image, detect_hyacinth
+
+
+def make_photo(height, width, seed=0):
+    # Patchy textured vegetation over noisy water, with texture at several scales
+    rng = np.random.default_rng(seed)
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = (170, 90, 40)
+    img = cv2.add(img, rng.integers(0, 20, (height, width, 3), dtype=np.uint8))
+
+    coarse = cv2.resize(rng.random((height // 200, width // 200)).astype(np.float32), (width, height))
+    plants = coarse > 0.5
+    leaves = cv2.resize(rng.integers(120, 255, (height // 4, width // 4), dtype=np.uint8), (width, height),
+                        interpolation=cv2.INTER_NEAREST)
+    img[plants, 0] = 30
+    img[plants, 1] = leaves[plants]
+    img[plants, 2] = 40
+    return img
+
+
+def legacy_coverage(image_bytes):
+    # Pre-existing path: full-resolution decode, then INTER_AREA down to 1000 px
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    height, width = img.shape[:2]
+    if width > 1000:
+        img = cv2.resize(img, (1000, int(height * 1000 / width)), interpolation=cv2.INTER_AREA)
+    mask = compute_hyacinth_mask(img)
+    return np.count_nonzero(mask) / mask.size * 100.0
+
+
+class TestReducedDecode(unittest.TestCase):
+    def test_coverage_matches_full_decode(self):
+        for seed, (height, width) in enumerate([(3000, 4000), (2250, 3000), (1500, 2100)]):
+            _, encoded = cv2.imencode('.jpg', make_photo(height, width, seed), [cv2.IMWRITE_JPEG_QUALITY, 90])
+            data = encoded.tobytes()
+
+            img = decode_image(data)
+            self.assertEqual(img.shape[1], 1000)
+
+            coverage = detect_hyacinth(data)
+            expected = legacy_coverage(data)
+            self.assertAlmostEqual(coverage, expected, delta=2.0,
+                                   msg=f"{width}x{height}: reduced {coverage}% vs full {expected:.2f}%")
+
+    def test_exif_orientation_is_applied(self):
+        photo = Image.fromarray(np.zeros((1500, 2400, 3), dtype=np.uint8))
+        exif = photo.getexif()
+        exif[0x0112] = 6  # rotated 90 degrees clockwise
+        buf = io.BytesIO()
+        photo.save(buf, "JPEG", exif=exif.tobytes())
+
+        img = decode_image(buf.getvalue())
+        # Portrait after rotation, and scaled to the 1000 px width cap
+        self.assertEqual(img.shape[1], 1000)
+        self.assertEqual(img.shape[0], 1600)
+
+    def test_small_and_non_jpeg_images_decode_unchanged(self):
+        img = np.random.randint(0, 255, (120, 200, 3), dtype=np.uint8)
+        _, encoded = cv2.imencode('.png', img)
+        np.testing.assert_array_equal(decode_image(encoded.tobytes()), img)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import threading
+import tracemalloc
+import unittest
+import numpy as np
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from benchmarks.scenes import make_scene
+from image_processing import DetectionEngine, compute_hyacinth_mask, get_detection_engine
+
+
+class TestDetectionEngine(unittest.TestCase):
+    def test_matches_reference_mask(self):
+        engine = DetectionEngine()
+        for width, kind in ((640, "mixed"), (1000, "vegetation"), (640, "water"), (333, "mixed")):
+            img = make_scene(width, kind, seed=width)
+            np.testing.assert_array_equal(engine.mask(img), compute_hyacinth_mask(img))
+
+    def test_optional_stages(self):
+        img = make_scene(640, "mixed")
+        timings = {}
+        engine = DetectionEngine()
+        engine.mask(img, timings)
+        self.assertNotIn("lbp", timings)
+        self.assertNotIn("valid_mask", timings)
+        self.assertIsNone(engine.lbp)
+
+        timings = {}
+        diagnostic = DetectionEngine(compute_lbp=True, compute_valid_mask=True)
+        mask = diagnostic.mask(img, timings)
+        self.assertIn("lbp", timings)
+        self.assertEqual(diagnostic.lbp.shape, img.shape[:2])
+        self.assertTrue(np.all(diagnostic.valid_mask <= mask))  # valid mask is the stricter one
+        np.testing.assert_array_equal(mask, compute_hyacinth_mask(img))
+
+    def test_reuses_buffers_without_allocating(self):
+        engine = DetectionEngine()
+        img = make_scene(1000, "mixed")
+        first = engine.mask(img)
+        other = make_scene(1000, "mixed", seed=1)
+
+        tracemalloc.start()
+        try:
+            second = engine.mask(other)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertIs(first, second)
+        self.assertLess(peak, 64 * 1024)  # reference allocates ~21 bytes per pixel
+
+    def test_buffer_sets_are_bounded(self):
+        engine = DetectionEngine()
+        for width in range(100, 100 + 8 * 16, 16):
+            engine.mask(make_scene(width, "water"))
+        self.assertEqual(len(engine._buffers), DetectionEngine.MAX_SHAPES)
+
+    def test_buffer_cache_is_bounded_by_bytes(self):
+        engine = DetectionEngine()
+        engine.MAX_BUFFER_BYTES = 8 * 1000 * 750 * 5 // 2  # room for two standard-size frames
+        for width in (1000, 1001, 1002):
+            engine.mask(make_scene(width, "water"))
+        self.assertEqual(len(engine._buffers), 2)
+        self.assertLessEqual(engine.buffer_bytes(), engine.MAX_BUFFER_BYTES)
+
+        # Over the budget on its own: correct result, nothing kept
+        img = make_scene(2000, "mixed")
+        np.testing.assert_array_equal(engine.mask(img), compute_hyacinth_mask(img))
+        self.assertNotIn(img.shape[:2], engine._buffers)
+        self.assertLessEqual(engine.buffer_bytes(), engine.MAX_BUFFER_BYTES)
+
+    def test_one_engine_per_thread(self):
+        engines = []
+        thread = threading.Thread(target=lambda: engines.append(get_detection_engine()))
+        thread.start()
+        thread.join()
+        self.assertIs(get_detection_engine(), get_detection_engine())
+        self.assertIsNot(engines[0], get_detection_engine())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import random
+import unittest
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from geo_index import GeoGridIndex, covering_cells, geohash_bounds, geohash_encode
+
+
+class TestGeohash(unittest.TestCase):
+    def test_known_value(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+    def test_bounds_contain_point(self):
+        lat, lon = 12.9716, 77.5946
+        for precision in range(1, 9):
+            min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash_encode(lat, lon, precision))
+            self.assertTrue(min_lat <= lat <= max_lat and min_lon <= lon <= max_lon)
+
+    def test_covering_cells_cover_bbox(self):
+        bbox = (12.9, 77.5, 13.1, 77.7)
+        cells = covering_cells(bbox, 5)
+        rng = random.Random(0)
+        for _ in range(200):
+            lat, lon = rng.uniform(12.9, 13.1), rng.uniform(77.5, 77.7)
+            self.assertIn(geohash_encode(lat, lon, 5), cells)
+
+
+class TestGeoGridIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.points = [
+            (f"p{i}", 12.9 + rng.random() * 0.5, 77.5 + rng.random() * 0.5, rng.uniform(0, 100))
+            for i in range(2000)
+        ]
+        self.index = GeoGridIndex()
+        self.cells = {pid: self.index.add(pid, lat, lon, cov, "pending") for pid, lat, lon, cov in self.points}
+
+    def brute_force(self, bbox):
+        return {pid for pid, lat, lon, _ in self.points
+                if bbox[0] <= lat <= bbox[2] and bbox[1] <= lon <= bbox[3]}
+
+    def test_points_in_bbox(self):
+        bbox = (13.0, 77.6, 13.1, 77.75)
+        found = {p["id"] for p in self.index.points(bbox, limit=10000)}
+        self.assertEqual(found, self.brute_force(bbox))
+
+    def test_clusters_sum_to_total_at_every_precision(self):
+        world = (-90.0, -180.0, 90.0, 180.0)
+        for precision in (1, 3, 5):
+            clusters = self.index.clusters(world, precision)
+            self.assertEqual(sum(c["count"] for c in clusters), 2000)
+
+    def test_remove_updates_aggregates(self):
+        pid, lat, lon, cov = self.points[0]
+        self.index.remove(pid, self.cells[pid])
+        world = (-90.0, -180.0, 90.0, 180.0)
+        self.assertEqual(sum(c["count"] for c in self.index.clusters(world, 4)), 1999)
+        self.assertNotIn(pid, {p["id"] for p in self.index.points((lat - 1e-6, lon - 1e-6, lat + 1e-6, lon + 1e-6), 10)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import subprocess
+import unittest
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+class TestHealthEndpoints(unittest.TestCase):
+    def setUp(self):
+        # No lifespan: nothing is started, as right after boot
+        self.client = TestClient(main.app)
+        self.original = main.engine.ready, main.db.client, main.jobs.store
+
+    def tearDown(self):
+        main.engine.ready, main.db.client, main.jobs.store = self.original
+
+    def test_healthz_is_always_ok(self):
+        res = self.client.get("/healthz")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {"status": "ok"})
+
+    def test_readyz_waits_for_warm_engine(self):
+        main.engine.ready, main.db.client, main.jobs.store = False, object(), object()
+        res = self.client.get("/readyz")
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()["status"], "starting")
+        self.assertEqual(res.json()["checks"], {"analysis_engine": False, "database": True, "job_queue": True})
+
+        main.engine.ready = True
+        res = self.client.get("/readyz")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["status"], "ready")
+        self.assertEqual(res.headers["cache-control"], "no-store")
+
+    def test_dead_worker_is_a_503_not_a_guess(self):
+        async def lost(*args, **kwargs):
+            raise main.WorkerLost(3)
+
+        original = main.engine.analyze
+        main.engine.analyze = lost
+        try:
+            res = self.client.post("/api/analyze", files={"file": ("a.jpg", b"abc", "image/jpeg")})
+        finally:
+            main.engine.analyze = original
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers["retry-after"], "3")
+
+    def test_app_import_leaves_image_stack_to_workers(self):
+        # A fresh interpreter, since other tests import the image stack here
+        code = "import sys, main; print(sorted(m for m in ('cv2', 'numpy', 'skimage') if m in sys.modules))"
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(out.strip(), "[]")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,332 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from postgrest import APIError
+
+from benchmarks.stubs import FakeSupabase
+from job_queue import JobStore, JobWorker, QueueFull, backoff_seconds
+from routers import jobs
+from testing_postgres import PostgresUnavailable, drop_database, fresh_database
+
+
+class FlakyEngine:
+    """Stands in for AnalysisEngine: fails the first `failures` calls per payload."""
+
+    workers = 2
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = {}
+
+    async def analyze(self, data: bytes, quality: str = "standard", strict: bool = False) -> float:
+        self.calls[data] = self.calls.get(data, 0) + 1
+        await asyncio.sleep(0.01)
+        if data == b"not an image":
+            if strict:
+                raise ValueError("Could not decode image")
+            return 0.0
+        if self.calls[data] <= self.failures:
+            raise RuntimeError("decoder crashed")
+        return float(len(data))
+
+
+class RecordingSupabase(FakeSupabase):
+    def __init__(self):
+        self.written = []
+
+        def apply(params):
+            self.written.append(list(params["p_results"]))
+            return [len(params["p_results"])]
+
+        super().__init__({}, rpcs={"apply_coverage_results": apply})
+
+
+class JobStoreCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = JobStore(os.path.join(self.tmp.name, "jobs.db"), max_attempts=3, retry_base=0.01, retry_max=0.05)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+
+class TestJobStore(JobStoreCase):
+    def test_job_lifecycle_and_outbox(self):
+        job = self.store.enqueue(b"img", submission_id="sub-1")
+        self.assertEqual(job["status"], "queued")
+
+        claimed = self.store.claim()
+        self.assertEqual((claimed["job_id"], claimed["status"], claimed["attempts"]), (job["job_id"], "running", 1))
+        self.assertIsNone(self.store.claim())
+        self.assertEqual(self.store.payload(job["job_id"]), b"img")
+
+        self.store.complete(job["job_id"], {"coverage_percent": 42.5})
+        done = self.store.get(job["job_id"])
+        self.assertEqual((done["status"], done["result"]), ("done", {"coverage_percent": 42.5}))
+        self.assertEqual(self.store.pending_coverage(), [{"id": "sub-1", "coverage_percent": 42.5}])
+
+        self.store.ack_coverage(self.store.pending_coverage())
+        self.assertEqual(self.store.pending_coverage(), [])
+        with self.assertRaises(LookupError):
+            self.store.payload(job["job_id"])
+
+    def test_failures_back_off_then_give_up(self):
+        job_id = self.store.enqueue(b"img")["job_id"]
+        for attempt in (1, 2):
+            self.assertEqual(self.store.claim()["attempts"], attempt)
+            self.store.fail(job_id, "boom")
+            retry = self.store.get(job_id)
+            self.assertEqual(retry["status"], "queued")
+            self.assertGreater(retry["next_attempt_at"], time.time() - 0.001)
+            time.sleep(0.08)
+
+        self.store.claim()
+        self.store.fail(job_id, "boom")
+        failed = self.store.get(job_id)
+        self.assertEqual((failed["status"], failed["attempts"], failed["error"]), ("failed", 3, "boom"))
+
+    def test_expired_lease_is_reclaimed(self):
+        job_id = self.store.enqueue(b"img")["job_id"]
+        self.store.claim(lease_seconds=0.01)  # the worker that took it "crashes"
+        time.sleep(0.02)
+        self.assertIsNone(self.store.claim())  # requeued with backoff, not run again at once
+        self.assertEqual(self.store.get(job_id)["status"], "queued")
+        time.sleep(0.08)
+        reclaimed = self.store.claim()
+        self.assertEqual((reclaimed["job_id"], reclaimed["attempts"]), (job_id, 2))
+
+    def test_job_that_keeps_killing_workers_fails(self):
+        job_id = self.store.enqueue(b"img")["job_id"]
+        for _ in range(3):
+            deadline = time.monotonic() + 1
+            while self.store.claim(lease_seconds=0.01) is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.02)  # lease expires without complete() or fail()
+        self.assertIsNone(self.store.claim())
+        failed = self.store.get(job_id)
+        self.assertEqual((failed["status"], failed["attempts"]), ("failed", 3))
+        self.assertIn("lease expired", failed["error"])
+        with self.assertRaises(LookupError):
+            self.store.payload(job_id)
+
+    def test_queue_limit(self):
+        self.store.enqueue(b"a", max_queued=2)
+        self.store.enqueue(b"b", max_queued=2)
+        with self.assertRaises(QueueFull):
+            self.store.enqueue(b"c", max_queued=2)
+
+    def test_backoff_grows_and_is_capped(self):
+        self.assertLess(backoff_seconds(1, 2, 60), backoff_seconds(4, 2, 60))
+        self.assertLessEqual(backoff_seconds(20, 2, 60), 75)
+
+
+class TestJobWorker(JobStoreCase):
+    def test_worker_retries_and_batches_coverage_writes(self):
+        engine = FlakyEngine(failures=1)
+        client = RecordingSupabase()
+        submissions = sorted(str(uuid.uuid4()) for _ in range(6))
+        ids = [self.store.enqueue(f"img-{i}".encode(), submission_id=s)["job_id"] for i, s in enumerate(submissions)]
+
+        async def scenario():
+            worker = JobWorker(self.store, engine, lambda: client, poll_interval=0.01, flush_interval=3600)
+            worker.start()
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                if all(self.store.get(i)["status"] == "done" for i in ids):
+                    break
+                await asyncio.sleep(0.02)
+            await worker.stop()  # final flush
+            return worker
+
+        worker = asyncio.run(scenario())
+        self.assertEqual([self.store.get(i)["attempts"] for i in ids], [2] * 6)
+        self.assertEqual((worker.completed, worker.failed_attempts), (6, 6))
+        self.assertEqual(len(client.written), 1)  # one RPC for the whole batch
+        self.assertEqual(
+            sorted(client.written[0], key=lambda r: r["id"]),
+            [{"id": s, "coverage_percent": 5.0} for s in submissions],
+        )
+        self.assertEqual(self.store.pending_coverage(), [])
+
+    def test_undecodable_image_fails_without_retry(self):
+        engine = FlakyEngine()
+        job_id = self.store.enqueue(b"not an image", submission_id=str(uuid.uuid4()))["job_id"]
+
+        async def scenario():
+            worker = JobWorker(self.store, engine, lambda: None, poll_interval=0.01, flush_interval=3600)
+            worker.start()
+            deadline = time.monotonic() + 5
+            while self.store.get(job_id)["status"] not in ("done", "failed") and time.monotonic() < deadline:
+                await asyncio.sleep(0.02)
+            await worker.stop()
+
+        asyncio.run(scenario())
+        job = self.store.get(job_id)
+        self.assertEqual((job["status"], job["attempts"], job["error"]), ("failed", 1, "Could not decode image"))
+        self.assertEqual(engine.calls[b"not an image"], 1)
+        self.assertEqual(self.store.pending_coverage(), [])  # no 0% written to the submission
+
+    def test_locked_database_does_not_block_event_loop(self):
+        # Another process holds the write lock, so claim() waits inside BEGIN IMMEDIATE
+        other = sqlite3.connect(self.store.path, isolation_level=None)
+        other.execute("begin immediate")
+
+        async def scenario():
+            worker = JobWorker(self.store, FlakyEngine(), lambda: None, poll_interval=0.01, flush_interval=3600)
+            worker.start()
+            ticks = 0
+            started = time.monotonic()
+            while time.monotonic() - started < 0.3:
+                await asyncio.sleep(0.01)
+                ticks += 1
+            other.execute("rollback")
+            await worker.stop()
+            return ticks
+
+        try:
+            self.assertGreater(asyncio.run(scenario()), 10)
+        finally:
+            other.close()
+
+    def test_failed_flush_keeps_outbox(self):
+        class Down:
+            def rpc(self, *args):
+                raise ConnectionError("supabase unreachable")
+
+        self.store.enqueue(b"img", submission_id=str(uuid.uuid4()))
+        job = self.store.claim()
+        self.store.complete(job["job_id"], {"coverage_percent": 1.0})
+        worker = JobWorker(self.store, FlakyEngine(), lambda: Down())
+        with self.assertRaises(ConnectionError):
+            asyncio.run(worker.flush_coverage())
+        self.assertEqual(len(self.store.pending_coverage()), 1)
+
+    def test_rejected_rows_are_parked(self):
+        rejected = str(uuid.uuid4())  # e.g. a row the database refuses
+        good = [str(uuid.uuid4()) for _ in range(5)]
+        written = []
+
+        def apply(params):
+            if any(r["id"] == rejected for r in params["p_results"]):
+                raise APIError({"message": "rejected", "code": "22P02"})
+            written.extend(r["id"] for r in params["p_results"])
+            return [len(params["p_results"])]
+
+        # The bad rows are the oldest, so they would be in every batch
+        for i, submission_id in enumerate(["not-a-uuid", rejected] + good):
+            self.store.enqueue(f"img-{i}".encode(), submission_id=submission_id)
+            job = self.store.claim()
+            self.store.complete(job["job_id"], {"coverage_percent": float(i)})
+
+        client = FakeSupabase({}, rpcs={"apply_coverage_results": apply})
+        worker = JobWorker(self.store, FlakyEngine(), lambda: client, batch_size=4)
+        self.assertEqual(asyncio.run(worker.flush_coverage()), 5)
+        self.assertEqual(sorted(written), sorted(good))
+        self.assertEqual(self.store.pending_coverage(), [])
+        self.assertEqual([p["id"] for p in self.store.parked_coverage()], ["not-a-uuid", rejected])
+
+
+class TestJobEndpoints(JobStoreCase):
+    def setUp(self):
+        super().setUp()
+        app = FastAPI()
+        app.include_router(jobs.router)
+        self.client = TestClient(app)
+        self.original = jobs.store, jobs.worker
+        jobs.store, jobs.worker = self.store, None
+
+    def tearDown(self):
+        jobs.store, jobs.worker = self.original
+        super().tearDown()
+
+    def test_submit_poll_and_stream(self):
+        res = self.client.post("/api/jobs", files={"file": ("a.jpg", b"abc", "image/jpeg")}, data={"submission_id": str(uuid.uuid4())})
+        self.assertEqual(res.status_code, 202)
+        job_id = res.json()["job_id"]
+        self.assertEqual(res.headers["location"], f"/api/jobs/{job_id}")
+        self.assertEqual(self.client.get(f"/api/jobs/{job_id}").json()["status"], "queued")
+
+        # A worker elsewhere finishes the job
+        claimed = self.store.claim()
+        self.store.complete(claimed["job_id"], {"coverage_percent": 3.0})
+
+        with self.client.stream("GET", f"/api/jobs/{job_id}/events") as stream:
+            body = "".join(stream.iter_text())
+        self.assertIn("event: status", body)
+        self.assertIn('"status": "done"', body)
+        self.assertEqual(self.client.get(f"/api/jobs/{job_id}").json()["result"], {"coverage_percent": 3.0})
+        self.assertEqual(self.client.get(f"/api/jobs/{uuid.uuid4()}").status_code, 404)
+
+    def test_event_stream_reads_store_off_the_event_loop(self):
+        job_id = self.store.enqueue(b"img")["job_id"]
+        on_loop = []
+        get = self.store.get
+
+        def recording_get(job_id):
+            on_loop.append(asyncio._get_running_loop() is not None)
+            job = get(job_id)
+            if len(on_loop) == 2:
+                claimed = self.store.claim()
+                self.store.complete(claimed["job_id"], {"coverage_percent": 1.0})
+            return job
+
+        self.store.get = recording_get
+        original_poll, jobs.SSE_POLL_SECONDS = jobs.SSE_POLL_SECONDS, 0.01
+        try:
+            with self.client.stream("GET", f"/api/jobs/{job_id}/events") as stream:
+                body = "".join(stream.iter_text())
+        finally:
+            jobs.SSE_POLL_SECONDS = original_poll
+        self.assertIn('"status": "done"', body)
+        self.assertGreaterEqual(len(on_loop), 3)
+        self.assertFalse(any(on_loop))
+
+    def test_submission_id_must_be_a_uuid(self):
+        res = self.client.post("/api/jobs", files={"file": ("a.jpg", b"abc", "image/jpeg")}, data={"submission_id": "sub-9"})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(self.store.counts(), {})
+
+
+class TestApplyCoverageResults(unittest.TestCase):
+    def test_batch_update(self):
+        try:
+            uri = fresh_database(["backend/analysis_jobs.sql"])
+        except PostgresUnavailable as e:
+            raise unittest.SkipTest(str(e))
+
+        import psycopg
+        from psycopg.types.json import Jsonb
+        try:
+            with psycopg.connect(uri, autocommit=True) as conn:
+                user_id = uuid.uuid4()
+                conn.execute("insert into auth.users (id) values (%s)", (user_id,))
+                ids = [conn.execute(
+                    "insert into submissions (user_id, image_url) values (%s, 'x') returning id", (user_id,)
+                ).fetchone()[0] for _ in range(3)]
+
+                results = [{"id": str(ids[0]), "coverage_percent": 12.5}, {"id": str(ids[2]), "coverage_percent": 80.0},
+                           {"id": str(uuid.uuid4()), "coverage_percent": 1.0}]
+                updated = conn.execute("select apply_coverage_results(%s)", (Jsonb(results),)).fetchone()[0]
+                coverage = dict(conn.execute("select id, coverage_percent from submissions").fetchall())
+        finally:
+            drop_database(uri)
+
+        self.assertEqual(updated, 2)
+        self.assertEqual([coverage[i] for i in ids], [12.5, 0.0, 80.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
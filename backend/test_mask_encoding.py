@@ -0,0 +1,70 @@
+import base64
+import io
+import unittest
+import numpy as np
+import sys
+import os
+from PIL import Image
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from benchmarks.scenes import encode_jpeg, make_scene
+from image_processing import compute_hyacinth_mask, decode_image, detect_hyacinth, detect_hyacinth_overlay
+from mask_encoding import component_stats, decode_rle, encode_mask, encode_rle, scale_mask
+
+
+class TestMaskEncoding(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.mask = np.where(rng.random((60, 80)) > 0.7, 255, 0).astype(np.uint8)
+
+    def test_rle_round_trip(self):
+        for mask in (self.mask, 255 - self.mask, np.zeros((3, 4), np.uint8), np.full((3, 4), 255, np.uint8)):
+            rle = encode_rle(mask)
+            self.assertEqual(sum(rle["counts"]), mask.size)
+            np.testing.assert_array_equal(decode_rle(rle), mask > 0)
+
+    def test_rle_starts_with_background_run(self):
+        mask = np.array([[255, 255, 0, 0, 0, 255]], np.uint8)
+        self.assertEqual(encode_rle(mask)["counts"], [0, 2, 3, 1])
+
+    def test_png_is_palettized_with_transparent_background(self):
+        overlay = encode_mask(self.mask, 1.0, "png")
+        image = Image.open(io.BytesIO(base64.b64decode(overlay["data"])))
+        self.assertEqual(image.mode, "P")
+        self.assertEqual(image.size, (80, 60))
+        np.testing.assert_array_equal(np.array(image) == 1, self.mask > 0)
+        self.assertEqual(image.info["transparency"][0], 0)
+
+    def test_scaling_keeps_majority(self):
+        mask = np.zeros((4, 4), np.uint8)
+        mask[:2, :2] = 255
+        mask[2, 2] = 255  # 1 of 4 pixels in that cell: dropped
+        np.testing.assert_array_equal(scale_mask(mask, 0.5), [[True, False], [False, False]])
+        self.assertEqual(encode_mask(self.mask, 0.25, "rle")["size"], [15, 20])
+
+    def test_component_stats(self):
+        mask = np.zeros((10, 10), np.uint8)
+        mask[0:3, 0:3] = 255
+        mask[6:8, 6:9] = 255
+        stats = component_stats(mask)
+        self.assertEqual((stats["blob_count"], stats["largest_blob_area"]), (2, 9))
+        self.assertEqual(stats["largest_blob_percent"], 9.0)
+        self.assertEqual(component_stats(np.zeros((5, 5), np.uint8))["blob_count"], 0)
+
+    def test_overlay_matches_detection(self):
+        data = encode_jpeg(make_scene(1200, "mixed", 4))
+        result = detect_hyacinth_overlay(data, scale=1.0, encoding="rle")
+
+        self.assertEqual(result["coverage_percent"], detect_hyacinth(data))
+        expected = compute_hyacinth_mask(decode_image(data)) > 0
+        np.testing.assert_array_equal(decode_rle(result["overlay"]), expected)
+        self.assertGreater(result["components"]["blob_count"], 0)
+
+        with self.assertRaises(ValueError):
+            detect_hyacinth_overlay(b"not an image")
+
+
+if __name__ == '__main__':
+    unittest.main()
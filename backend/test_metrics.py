@@ -0,0 +1,93 @@
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+import metrics
+from benchmarks.stubs import FakeSupabase
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        hist = metrics.Histogram("test_latency_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+        hist.observe(0.05, route="/a")
+        hist.observe(0.5, route="/a")
+        hist.observe(5.0, route="/a")
+
+        text = "\n".join(hist.render())
+        self.assertIn('test_latency_seconds_bucket{route="/a",le="0.1"} 1', text)
+        self.assertIn('test_latency_seconds_bucket{route="/a",le="1.0"} 2', text)
+        self.assertIn('test_latency_seconds_bucket{route="/a",le="+Inf"} 3', text)
+        self.assertIn('test_latency_seconds_count{route="/a"} 3', text)
+
+    def test_instrumented_supabase_counts_calls_and_rows(self):
+        client = metrics.InstrumentedSupabase(FakeSupabase({"widgets": [{"id": 1}, {"id": 2}]}))
+        before = metrics.supabase_rows.value(table="widgets")
+
+        async def handle_request():
+            token = metrics.begin_request_accounting()
+            res = await client.table("widgets").select("*").eq("id", 1).order("id").execute()
+            await client.table("widgets").select("*").execute()
+            metrics.end_request_accounting(token, "/widgets")
+            return res
+
+        res = asyncio.run(handle_request())
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(metrics.supabase_rows.value(table="widgets") - before, 3)
+        self.assertEqual(metrics.supabase_calls_per_request.count(route="/widgets"), 1)
+
+
+    def test_one_sampled_profile_at_a_time(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(metrics, "PROFILE_SAMPLE_RATE", 1.0), mock.patch.object(metrics, "PROFILE_DIR", tmp):
+            first = metrics.start_sampled_profile()
+            self.assertIsNotNone(first)
+            self.assertIsNone(metrics.start_sampled_profile())  # overlapping request is not sampled
+            metrics.finish_sampled_profile(first, "/api/analyze")
+            self.assertEqual(len(os.listdir(tmp)), 1)
+
+            class Busy:
+                def enable(self):
+                    raise ValueError("Another profiling tool is already active")
+
+            with mock.patch.object(metrics.cProfile, "Profile", Busy):
+                self.assertIsNone(metrics.start_sampled_profile())
+            after = metrics.start_sampled_profile()  # a failed start doesn't hold the slot
+            self.assertIsNotNone(after)
+            metrics.finish_sampled_profile(after, "/")
+
+    def test_streamed_body_is_measured_to_the_end(self):
+        from fastapi import FastAPI
+        from fastapi.responses import StreamingResponse
+        from fastapi.testclient import TestClient
+        import main
+
+        client = metrics.InstrumentedSupabase(FakeSupabase({"pages": [{"id": 1}, {"id": 2}]}))
+        app = FastAPI()
+        app.middleware("http")(main.record_request_metrics)
+
+        @app.get("/stream-test")
+        async def stream():
+            async def body():
+                for _ in range(3):
+                    # Pages fetched after the headers are sent still count
+                    res = await client.table("pages").select("*").execute()
+                    await asyncio.sleep(0.05)
+                    yield f"{len(res.data)}\n"
+            return StreamingResponse(body())
+
+        res = TestClient(app).get("/stream-test")
+        self.assertEqual(res.text, "2\n2\n2\n")
+        latency = metrics.http_request_seconds._series[("GET", "/stream-test", "200")]
+        self.assertGreaterEqual(latency[-1], 0.15)
+        self.assertEqual(metrics.supabase_calls_per_request._series[("/stream-test",)][-1], 3)
+        self.assertEqual(metrics.supabase_rows_per_request._series[("/stream-test",)][-1], 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from analysis_engine import AnalysisEngine
+from benchmarks.bench_quality_tiers import score
+from benchmarks.scenes import encode_jpeg, make_labeled_scene
+from detection_params import DETECTION_VERSION, QUALITY_TIERS, DetectionConfig, get_config
+from image_processing import DetectionEngine, compute_hyacinth_mask, decode_image, detect_hyacinth, get_detection_engine
+
+
+class TestQualityTiers(unittest.TestCase):
+    def test_standard_tier_is_unchanged(self):
+        img, _ = make_labeled_scene(1600, "mixed")
+        data = encode_jpeg(img)
+        engine = get_detection_engine("standard")
+        np.testing.assert_array_equal(engine.mask(engine.decode(data)), compute_hyacinth_mask(decode_image(data)))
+        self.assertEqual(detect_hyacinth(data), detect_hyacinth(data, quality="standard"))
+        self.assertEqual(get_config("standard").version, DETECTION_VERSION)
+
+    def test_analyzed_resolution_per_tier(self):
+        data = encode_jpeg(make_labeled_scene(1600, "water")[0])
+        widths = {quality: get_detection_engine(quality).decode(data).shape[1] for quality in QUALITY_TIERS}
+        self.assertEqual(widths, {"fast": 512, "standard": 1000, "accurate": 1600})
+
+    def test_tiers_match_ground_truth(self):
+        for width in (640, 1920, 4000):
+            img, truth = make_labeled_scene(width, "mixed", seed=width)
+            data = encode_jpeg(img)
+            true_coverage = truth.mean() * 100.0
+            for quality in QUALITY_TIERS:
+                engine = get_detection_engine(quality)
+                result = score(engine.mask(engine.decode(data)), truth)
+                self.assertLess(abs(result["coverage_percent"] - true_coverage), 1.0, (quality, width))
+                self.assertGreater(result["iou"], 0.98, (quality, width))
+
+    def test_texture_stage_is_optional(self):
+        img, _ = make_labeled_scene(640, "mixed")
+        timings = {}
+        engine = DetectionEngine(get_config("fast").with_stages("texture"))
+        self.assertEqual(engine.config.stages, ("decode", "resize", "color_mask", "texture", "edges", "combine"))
+        mask = engine.mask(img, timings)
+        self.assertIn("lbp", timings)
+        np.testing.assert_array_equal(mask, DetectionEngine(get_config("fast")).mask(img))
+
+    def test_config_validation(self):
+        with self.assertRaises(ValueError):
+            DetectionConfig(stages=("decode", "sharpen", "color_mask", "combine"))
+        with self.assertRaises(ValueError):
+            DetectionConfig(stages=("decode", "edges", "combine"))
+        with self.assertRaises(ValueError):
+            DetectionConfig(stages=("decode", "edges", "color_mask", "combine"))
+        with self.assertRaises(ValueError):
+            get_config("ultra")
+
+        # Color only: every green pixel counts
+        img, _ = make_labeled_scene(640, "mixed")
+        color_only = DetectionEngine(DetectionConfig(stages=("decode", "resize", "color_mask", "combine")))
+        self.assertTrue(np.all(color_only.mask(img) >= compute_hyacinth_mask(img)))
+
+    def test_cache_keys_differ_per_tier(self):
+        namespaces = {AnalysisEngine.tier_namespace("coverage", quality) for quality in QUALITY_TIERS}
+        self.assertEqual(len(namespaces), len(QUALITY_TIERS))
+        self.assertEqual(AnalysisEngine.tier_namespace("coverage", "standard"), "coverage")
+        self.assertEqual(len({config.version for config in QUALITY_TIERS.values()}), len(QUALITY_TIERS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import sys
+import os
+import tempfile
+import threading
+from unittest import mock
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from result_cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+    def test_hit_and_miss_counters(self):
+        cache = ResultCache()
+        key = cache.key(b"image-bytes")
+        self.assertIsNone(cache.get(key))
+        cache.set(key, 42.5)
+        self.assertEqual(cache.get(key), 42.5)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_memory_tier_evicts_least_recently_used(self):
+        cache = ResultCache(max_bytes=25)
+        keys = [cache.key(bytes([i])) for i in range(3)]
+        cache.set(keys[0], "a" * 8)
+        cache.set(keys[1], "b" * 8)
+        cache.get(keys[0])  # keys[0] is now most recent
+        cache.set(keys[2], "c" * 8)
+
+        self.assertEqual(cache.get(keys[0]), "a" * 8)
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_parameter_change_invalidates_disk_entries(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.db")
+            old = ResultCache(disk_path=path, version="v1")
+            old.set(old.key(b"img"), 12.0)
+
+            # Same version: served from disk in a fresh process
+            same = ResultCache(disk_path=path, version="v1")
+            self.assertEqual(same.get(same.key(b"img")), 12.0)
+            self.assertEqual(same.disk_hits, 1)
+
+            # New thresholds: old rows are purged and the key differs
+            new = ResultCache(disk_path=path, version="v2")
+            self.assertIsNone(new.get(new.key(b"img")))
+            count = new._db.execute("select count(*) from results").fetchone()[0]
+            self.assertEqual(count, 0)
+
+    def test_disk_tier_is_size_bounded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResultCache(max_bytes=0, disk_path=os.path.join(tmp, "cache.db"), disk_max_bytes=100)
+            for i in range(20):
+                cache.set(cache.key(bytes([i])), "x" * 18)
+            total = cache._db.execute("select sum(size) from results").fetchone()[0]
+            self.assertLessEqual(total, 100)
+            self.assertEqual(cache.stats()["disk_bytes"], total)
+
+            # Overwrites and a reopen keep the running total in line with the table
+            cache.set(cache.key(bytes([19])), "y" * 5)
+            reopened = ResultCache(disk_path=os.path.join(tmp, "cache.db"), disk_max_bytes=100)
+            total = cache._db.execute("select sum(size) from results").fetchone()[0]
+            self.assertEqual((cache._disk_bytes, reopened._disk_bytes), (total, total))
+
+
+class TestResultCacheAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_disk_tier_is_used_off_the_event_loop(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResultCache(max_bytes=0, disk_path=os.path.join(tmp, "cache.db"))
+            threads = []
+            db = cache._db
+
+            def execute(*args):
+                threads.append(threading.current_thread())
+                return db.execute(*args)
+
+            cache._db = mock.Mock(wraps=db, execute=execute)
+
+            key = cache.key(b"img")
+            self.assertIsNone(await cache.get_async(key))
+            await cache.set_async(key, 12.0)
+            self.assertEqual(await cache.get_async(key), 12.0)
+
+            self.assertEqual(cache.disk_hits, 1)
+            self.assertTrue(threads)
+            self.assertNotIn(threading.main_thread(), threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import tracemalloc
+import unittest
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from benchmarks.stubs import FakeSupabase, make_submissions
+from db import get_supabase
+from routers import analytics, coupons
+from submission_export import EXPORT_COLUMNS, export_chunks, iter_pages
+
+
+def ordered(rows):
+    return sorted(rows, key=lambda r: (r["created_at"], r["id"]))
+
+
+async def collect(agen):
+    return [chunk async for chunk in agen]
+
+
+class CountingSupabase(FakeSupabase):
+    def __init__(self, tables):
+        super().__init__(tables)
+        self.queries = 0
+
+    def table(self, name):
+        self.queries += 1
+        return super().table(name)
+
+
+class TestSubmissionExport(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_submissions(1200, seed=3)
+        # Ties on created_at must not drop or repeat rows at page boundaries
+        for row in self.rows[:30]:
+            row["created_at"] = "2025-06-01T12:00:00+00:00"
+        self.supabase = CountingSupabase({"submissions": self.rows})
+
+        app = FastAPI()
+        app.include_router(analytics.router)
+        app.dependency_overrides[get_supabase] = lambda: self.supabase
+        self.client = TestClient(app)
+
+        self.original_key = coupons.ADMIN_API_KEY
+        coupons.ADMIN_API_KEY = "secret"
+
+    def tearDown(self):
+        coupons.ADMIN_API_KEY = self.original_key
+
+    def export(self, headers=None, **params):
+        return self.client.get(
+            "/analytics/export/submissions",
+            params=params,
+            headers={"X-Admin-Key": "secret", "Accept-Encoding": "identity", **(headers or {})},
+        )
+
+    def test_csv_has_every_row_in_keyset_order(self):
+        res = self.export(page_size=100)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.headers["content-type"].startswith("text/csv"))
+        self.assertNotIn("content-encoding", res.headers)
+
+        records = list(csv.DictReader(io.StringIO(res.text)))
+        self.assertEqual([r["id"] for r in records], [r["id"] for r in ordered(self.rows)])
+        self.assertEqual(tuple(records[0]), EXPORT_COLUMNS)
+        self.assertEqual(self.supabase.queries, 13)  # 12 full pages + the empty one that ends it
+
+    def test_gzip_on_the_fly(self):
+        plain = self.export(format="ndjson").content
+        res = self.export(format="ndjson", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(res.headers["content-encoding"], "gzip")
+        self.assertEqual(res.content, plain)  # the client decompressed the gzip stream
+        self.assertEqual(len(plain.splitlines()), len(self.rows))
+
+    def test_date_range_and_bbox_filters(self):
+        params = {
+            "from": "2025-03-01T00:00:00", "to": "2025-09-01T00:00:00+00:00",
+            "min_lat": 13.0, "min_lon": 77.6, "max_lat": 13.2, "max_lon": 77.9,
+        }
+        res = self.export(format="ndjson", page_size=50, **params)
+        self.assertEqual(res.status_code, 200)
+
+        expected = [
+            r["id"] for r in ordered(self.rows)
+            if "2025-03-01T00:00:00+00:00" <= r["created_at"] < "2025-09-01T00:00:00+00:00"
+            and 13.0 <= r["latitude"] <= 13.2 and 77.6 <= r["longitude"] <= 77.9
+        ]
+        self.assertGreater(len(expected), 0)
+        self.assertEqual([json.loads(line)["id"] for line in res.text.splitlines()], expected)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get("/analytics/export/submissions").status_code, 403)
+        self.assertEqual(self.export(min_lat=13.0).status_code, 400)
+        self.assertEqual(self.export(**{"from": "2025-05-01", "to": "2025-04-01"}).status_code, 400)
+        self.assertEqual(self.export(page_size=100000).status_code, 422)
+        self.assertEqual(self.export(format="xlsx").status_code, 422)
+
+    def test_interrupted_ndjson_ends_with_error_line(self):
+        async def fetch_page(cursor, limit):
+            if cursor is not None:
+                raise RuntimeError("connection reset")
+            return ordered(self.rows)[:limit]
+
+        chunks = []
+
+        async def drain():
+            async for chunk in export_chunks(iter_pages(fetch_page, 10), "ndjson"):
+                chunks.append(chunk)
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(drain())
+        lines = b"".join(chunks).decode().splitlines()
+        self.assertEqual(len(lines), 11)
+        self.assertEqual(json.loads(lines[-1]), {"error": "Export interrupted"})
+
+    def test_interrupted_csv_aborts_the_response(self):
+        table = self.supabase.table
+
+        def failing_table(name):
+            if self.supabase.queries >= 1:  # the first page reads fine, the second fails
+                raise RuntimeError("connection reset")
+            return table(name)
+
+        self.supabase.table = failing_table
+        # A clean end would look like a complete CSV; the server must abort instead
+        with self.assertRaises(RuntimeError):
+            self.export(page_size=100)
+
+    def test_memory_stays_flat(self):
+        template = self.rows[0]
+
+        async def fetch_page(cursor, limit):
+            start = 0 if cursor is None else int(cursor[1]) + 1
+            return [{**template, "id": str(i), "created_at": str(i)} for i in range(start, min(start + limit, 100000))]
+
+        async def drain():
+            size = 0
+            async for chunk in export_chunks(iter_pages(fetch_page, 1000), "csv", compress=True):
+                size += len(chunk)
+            return size
+
+        tracemalloc.start()
+        try:
+            compressed = asyncio.run(drain())
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertGreater(compressed, 0)
+        self.assertLess(peak, 4 * 1024 * 1024)  # the full CSV is ~20 MB
+        body = gzip.decompress(b"".join(asyncio.run(collect(export_chunks(iter_pages(fetch_page, 1000), "csv", True)))))
+        self.assertEqual(body.count(b"\n"), 100001)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import numpy as np
+import cv2
+import sys
+import os
+import tempfile
+import tracemalloc
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+import tifffile
+
+from image_processing import (
+    TiffRegions, compute_hyacinth_mask, detect_hyacinth_tiled, detect_hyacinth_tiled_file, open_large_image,
+)
+
+
+def make_scene(height, width):
+    # Textured green on the left half, flat blue water on the right
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    img[:] = (200, 60, 20)
+    half = width // 2
+    img[:, :half, 1] = np.random.randint(150, 255, (height, half))
+    img[:, :half, 0] = np.random.randint(0, 50, (height, half))
+    img[:, :half, 2] = np.random.randint(0, 50, (height, half))
+    return img
+
+
+class TestTiledDetection(unittest.TestCase):
+    def test_tiles_match_full_frame(self):
+        img = make_scene(700, 900)
+        full = np.count_nonzero(compute_hyacinth_mask(img)) / (700 * 900) * 100.0
+
+        result = detect_hyacinth_tiled(img, tile_size=256, overlap=16, workers=2)
+
+        self.assertEqual((result["rows"], result["cols"]), (3, 4))
+        self.assertAlmostEqual(result["coverage_percent"], full, delta=0.1)
+        # Left column is plant, right column is water
+        self.assertGreater(result["grid"][0][0], 80)
+        self.assertEqual(result["grid"][0][3], 0.0)
+
+    def test_memory_mapped_npy(self):
+        img = make_scene(512, 512)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ortho.npy")
+            np.save(path, img)
+            result = detect_hyacinth_tiled_file(path, tile_size=128)
+
+        self.assertEqual(len(result["grid"]), 4)
+        self.assertTrue(40 <= result["coverage_percent"] <= 55, result["coverage_percent"])
+
+    def test_tiff_layouts_match_in_memory(self):
+        rgb = cv2.cvtColor(make_scene(700, 900), cv2.COLOR_BGR2RGB)
+        expected = detect_hyacinth_tiled(rgb, is_rgb=True, tile_size=256)
+        layouts = {
+            "plain.tif": {},  # memory-mapped
+            "tiled.tif": {"tile": (128, 128), "compression": "zlib"},
+            "strips.tif": {"rowsperstrip": 50, "compression": "zlib"},
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, options in layouts.items():
+                path = os.path.join(tmp, name)
+                tifffile.imwrite(path, rgb, photometric="rgb", **options)
+                self.assertEqual(detect_hyacinth_tiled_file(path, tile_size=256), expected, name)
+
+            image, _ = open_large_image(os.path.join(tmp, "tiled.tif"))
+            try:
+                self.assertIsInstance(image, TiffRegions)
+                np.testing.assert_array_equal(image[100:390, 250:517, :3], rgb[100:390, 250:517])
+            finally:
+                image.close()
+
+    def test_compressed_tiff_is_read_by_region(self):
+        rgb = np.ascontiguousarray(np.tile(cv2.cvtColor(make_scene(256, 256), cv2.COLOR_BGR2RGB), (8, 8, 1)))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ortho.tif")
+            tifffile.imwrite(path, rgb, photometric="rgb", tile=(256, 256), compression="zlib")
+            del rgb
+            tracemalloc.start()
+            try:
+                result = detect_hyacinth_tiled_file(path, tile_size=256)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        self.assertEqual((result["rows"], result["cols"]), (8, 8))
+        self.assertLess(peak, 2048 * 2048 * 3 // 2)  # well under half the 12 MB image
+
+    def test_grayscale_is_rejected(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, options in (("gray.tif", {}), ("gray_zip.tif", {"compression": "zlib"})):
+                path = os.path.join(tmp, name)
+                tifffile.imwrite(path, np.zeros((64, 64), np.uint8), **options)
+                with self.assertRaises(ValueError):
+                    detect_hyacinth_tiled_file(path)
+            path = os.path.join(tmp, "gray.npy")
+            np.save(path, np.zeros((64, 64), np.uint8))
+            with self.assertRaises(ValueError):
+                detect_hyacinth_tiled_file(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import asyncio
+import unittest
+from collections import defaultdict
+from datetime import date, timedelta
+import numpy as np
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from analytics_store import AnalyticsStore
+from benchmarks.stubs import make_submissions
+from routers import analytics
+from trend_engine import TrendRollup
+
+
+def area_of(row):
+    return (round(row["latitude"], 2), round(row["longitude"], 2)) if row.get("latitude") and row.get("longitude") else None
+
+
+def bucket_start(day: str, bucket: str) -> str:
+    d = date.fromisoformat(day)
+    if bucket == "week":
+        d -= timedelta(days=d.weekday())
+    elif bucket == "month":
+        d = d.replace(day=1)
+    return d.isoformat()
+
+
+def reference(rows, bucket="day", start=None, end=None, bbox=None):
+    """(bucket -> coverages, bucket -> area -> coverages) computed row by row."""
+    if start is not None:
+        start = bucket_start(start.isoformat(), bucket)
+    totals = defaultdict(list)
+    per_area = defaultdict(lambda: defaultdict(list))
+    for row in rows:
+        if not row.get("coverage_percent"):
+            continue
+        area = area_of(row)
+        if bbox is not None and (area is None or not (bbox[0] <= area[0] <= bbox[2] and bbox[1] <= area[1] <= bbox[3])):
+            continue
+        day = row["created_at"].split("T")[0]
+        key = bucket_start(day, bucket)
+        if start is not None and key < start:
+            continue
+        if end is not None and key > bucket_start(end.isoformat(), bucket):
+            continue
+        totals[key].append(row["coverage_percent"])
+        if area is not None:
+            per_area[key][area].append(row["coverage_percent"])
+    return totals, per_area
+
+
+class TestTrendRollup(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_submissions(3000, seed=11)
+        for row in self.rows[::7]:
+            row["latitude"] = None  # some submissions have no location
+        self.rollup = TrendRollup(cells=4, days=8)  # small, so both axes have to grow
+        for row in self.rows:
+            if row["coverage_percent"]:
+                self.rollup.add(area_of(row), row["created_at"].split("T")[0], row["coverage_percent"])
+
+    def assert_matches(self, bucket, **query):
+        expected, _ = reference(self.rows, bucket, query.get("start"), query.get("end"), query.get("bbox"))
+        actual = self.rollup.query(bucket=bucket, **query)
+        self.assertEqual([r["date"] for r in actual], sorted(expected))
+        for r in actual:
+            values = expected[r["date"]]
+            self.assertEqual(r["submissions"], len(values))
+            self.assertAlmostEqual(r["average_coverage"], sum(values) / len(values), delta=0.051)
+
+    def test_buckets_match_row_by_row_grouping(self):
+        for bucket in ("day", "week", "month"):
+            self.assert_matches(bucket)
+            self.assert_matches(bucket, start=date(2025, 3, 12), end=date(2025, 8, 20))
+            self.assert_matches(bucket, bbox=(13.0, 77.6, 13.2, 77.8))
+
+    def test_weeks_start_on_monday(self):
+        weeks = self.rollup.query(bucket="week")
+        self.assertTrue(all(date.fromisoformat(w["date"]).weekday() == 0 for w in weeks))
+
+    def test_rolling_average_reaches_before_range(self):
+        expected, _ = reference(self.rows, "week")
+        keys = sorted(expected)
+        actual = self.rollup.query(start=date(2025, 6, 1), bucket="week", window=4)
+        for r in actual:
+            i = keys.index(r["date"])
+            # Weeks are contiguous in this data set, so the last 4 buckets are the last 4 keys
+            values = [v for k in keys[max(i - 3, 0):i + 1] for v in expected[k]]
+            self.assertAlmostEqual(r["rolling_average"], sum(values) / len(values), delta=0.051)
+        self.assertEqual(actual[0]["date"], "2025-05-26")
+
+    def test_percentiles_across_areas(self):
+        _, per_area = reference(self.rows, "month")
+        actual = self.rollup.query(bucket="month", percentiles=[50, 90])
+        for r in actual:
+            means = [sum(v) / len(v) for v in per_area[r["date"]].values()]
+            self.assertAlmostEqual(r["p50"], np.percentile(means, 50), delta=0.051)
+            self.assertAlmostEqual(r["p90"], np.percentile(means, 90), delta=0.051)
+
+    def test_removing_rows_restores_aggregates(self):
+        before = self.rollup.query(bucket="month")
+        extra = make_submissions(50, seed=99)
+        for sign in (1, -1):
+            for row in extra:
+                self.rollup.add(area_of(row), "2019-02-03", row["coverage_percent"], sign)
+        self.assertEqual(self.rollup.query(bucket="month"), before)
+        self.assertEqual(self.rollup.query(end=date(2019, 12, 31)), [])
+
+    def test_empty_and_unknown(self):
+        self.assertEqual(TrendRollup().query(), [])
+        self.assertEqual(self.rollup.query(start=date(2030, 1, 1)), [])
+        with self.assertRaises(ValueError):
+            self.rollup.query(bucket="year")
+
+
+class TestTrendEndpoint(unittest.TestCase):
+    def setUp(self):
+        rows = make_submissions(400, seed=5)
+
+        async def fetch_page(cursor, limit):
+            ordered = sorted(rows, key=lambda r: (r["updated_at"], r["id"]))
+            if cursor is not None:
+                ordered = [r for r in ordered if (r["updated_at"], r["id"]) > cursor]
+            return ordered[:limit]
+
+        self.original = analytics.store
+        analytics.store = AnalyticsStore(fetch_page, max_age=60)
+        app = FastAPI()
+        app.include_router(analytics.router)
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        analytics.store = self.original
+
+    def test_windowed_query(self):
+        res = self.client.get("/analytics/trend", params={
+            "from": "2025-02-01", "to": "2025-06-30", "bucket": "month", "window": 3, "percentile": [25, 75],
+        })
+        self.assertEqual(res.status_code, 200)
+        months = res.json()
+        self.assertEqual([m["date"] for m in months], ["2025-02-01", "2025-03-01", "2025-04-01", "2025-05-01", "2025-06-01"])
+        self.assertEqual(set(months[0]), {"date", "average_coverage", "submissions", "rolling_average", "p25", "p75"})
+        self.assertTrue(all(m["p25"] <= m["p75"] for m in months))
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get("/analytics/trend", params={"bucket": "year"}).status_code, 422)
+        self.assertEqual(self.client.get("/analytics/trend", params={"percentile": 101}).status_code, 422)
+        self.assertEqual(self.client.get("/analytics/trend", params={"from": "2025-05-01", "to": "2025-04-01"}).status_code, 400)
+        self.assertEqual(self.client.get("/analytics/trend", params={"min_lat": 13}).status_code, 400)
+
+    def test_windowed_query_needs_the_store(self):
+        async def unavailable(cursor, limit):
+            raise ConnectionError("database unreachable")
+        analytics.store = AnalyticsStore(unavailable)
+        self.assertEqual(self.client.get("/analytics/trend", params={"window": 7}).status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
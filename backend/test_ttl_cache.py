@@ -0,0 +1,141 @@
+import asyncio
+import time
+import unittest
+import uuid
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from benchmarks.stubs import FakeSupabase
+from db import get_supabase
+from routers import coupons
+from ttl_cache import TTLCache
+
+
+class CountingSupabase(FakeSupabase):
+    def __init__(self, tables):
+        super().__init__(tables, rpcs={})
+        self.calls = 0
+
+    def table(self, name):
+        self.calls += 1
+        return super().table(name)
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_expiry_and_invalidation(self):
+        cache = TTLCache(ttl=0.05)
+        loads = []
+
+        async def load():
+            loads.append(1)
+            return {"n": len(loads)}
+
+        async def scenario():
+            first = await cache.get_or_load("k", load)
+            again = await cache.get_or_load("k", load)
+            self.assertIs(first, again)
+            time.sleep(0.06)
+            expired = await cache.get_or_load("k", load)
+            cache.invalidate("k")
+            invalidated = await cache.get_or_load("k", load)
+            return first, expired, invalidated
+
+        first, expired, invalidated = asyncio.run(scenario())
+        self.assertEqual(len(loads), 3)
+        self.assertEqual(first.body, b'{"n":1}')
+        self.assertNotEqual(first.etag, expired.etag)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_concurrent_misses_share_one_load(self):
+        cache = TTLCache(ttl=60)
+        loads = []
+
+        async def load():
+            loads.append(1)
+            await asyncio.sleep(0.01)
+            return [1, 2, 3]
+
+        async def scenario():
+            return await asyncio.gather(*(cache.get_or_load("k", load) for _ in range(20)))
+
+        entries = asyncio.run(scenario())
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(len({e.etag for e in entries}), 1)
+
+    def test_invalidation_during_load_is_not_overwritten(self):
+        cache = TTLCache(ttl=60)
+
+        async def scenario():
+            async def load():
+                cache.invalidate("k")  # a write lands while the read is in flight
+                return "stale"
+            await cache.get_or_load("k", load)
+            return cache.get("k")
+
+        self.assertIsNone(asyncio.run(scenario()))
+
+
+class TestCachedEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.user_id = str(uuid.uuid4())
+        park = {"id": "p1", "name": "Lalbagh", "city": "Bengaluru", "state": "KA", "ticket_price": 100,
+                "description": None, "is_active": True, "created_at": "2025-01-01T00:00:00+00:00"}
+        self.supabase = CountingSupabase({"parks_gardens": [park], "profiles": [{"id": self.user_id}]})
+
+        app = FastAPI()
+        app.include_router(coupons.router)
+        app.dependency_overrides[get_supabase] = lambda: self.supabase
+        self.client = TestClient(app)
+
+        coupons.parks_cache.clear()
+        coupons.coupons_cache.clear()
+        self.original = coupons.ADMIN_API_KEY, coupons.email_queue
+        coupons.ADMIN_API_KEY = "secret"
+        coupons.email_queue = type("NullQueue", (), {"enqueue": lambda self, *args: True})()
+
+    def tearDown(self):
+        coupons.ADMIN_API_KEY, coupons.email_queue = self.original
+
+    def test_parks_served_from_cache_with_etag(self):
+        first = self.client.get("/api/coupons/parks")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()[0]["name"], "Lalbagh")
+        self.assertNotIn("created_at", first.json()[0])  # still shaped by ParkResponse
+        etag = first.headers["etag"]
+
+        second = self.client.get("/api/coupons/parks", headers={"If-None-Match": etag})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(second.headers["etag"], etag)
+        self.assertEqual(self.supabase.calls, 1)
+
+        stale = self.client.get("/api/coupons/parks", headers={"If-None-Match": '"other"'})
+        self.assertEqual(stale.status_code, 200)
+
+    def test_issuing_coupons_invalidates_user_list(self):
+        path = f"/api/coupons/my-coupons/{self.user_id}"
+        empty = self.client.get(path)
+        self.assertEqual(empty.json(), [])
+        etag = empty.headers["etag"]
+        self.assertEqual(self.client.get(path, headers={"If-None-Match": etag}).status_code, 304)
+
+        res = self.client.post(
+            "/api/coupons/admin/bulk-issue", headers={"X-Admin-Key": "secret"},
+            json={"grants": [{"user_id": self.user_id, "points": 3}]},
+        )
+        self.assertEqual(res.json()["issued"], 1)
+
+        refreshed = self.client.get(path, headers={"If-None-Match": etag})
+        self.assertEqual(refreshed.status_code, 200)
+        self.assertEqual([c["points_used"] for c in refreshed.json()], [3])
+        self.assertNotEqual(refreshed.headers["etag"], etag)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Local Postgres stand-in for SQL tests.
+
+Uses TEST_DATABASE_URL if set, otherwise starts a throwaway server with the
+`pgserver` package. Each call to fresh_database() creates an empty database with
+the Supabase bits our schema relies on (auth.users, auth.uid(), roles) stubbed,
+then loads the project's schema files. Tests skip when neither is available.
+"""
+import os
+import re
+import tempfile
+import uuid
+from typing import Iterable, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASE_SCHEMA = (
+    "supabase_schema.sql",
+    "backend/coupon_schema.sql",
+    "backend/park_schema.sql",
+)
+
+SUPABASE_SHIMS = """
+do $$
+begin
+  if not exists (select 1 from pg_roles where rolname = 'anon') then create role anon; end if;
+  if not exists (select 1 from pg_roles where rolname = 'authenticated') then create role authenticated; end if;
+  if not exists (select 1 from pg_roles where rolname = 'service_role') then create role service_role; end if;
+end $$;
+create schema if not exists auth;
+create table if not exists auth.users (id uuid primary key, raw_user_meta_data jsonb default '{}'::jsonb);
+create or replace function auth.uid() returns uuid language sql stable as $$ select null::uuid $$;
+create or replace function auth.role() returns text language sql stable as $$ select 'service_role'::text $$;
+"""
+
+# Minimal builds (e.g. pgserver) ship without contrib; gen_random_uuid() is built in since PG 13
+UUID_OSSP_SHIM = """
+create or replace function uuid_generate_v4() returns uuid language sql volatile as $$ select gen_random_uuid() $$;
+"""
+_CREATE_UUID_OSSP = re.compile(r'create extension if not exists "uuid-ossp";', re.IGNORECASE)
+
+_server = None
+
+
+class PostgresUnavailable(Exception):
+    pass
+
+
+def _admin_uri() -> str:
+    global _server
+    url = os.getenv("TEST_DATABASE_URL")
+    if url:
+        return url
+    try:
+        import pgserver
+    except ImportError:
+        raise PostgresUnavailable("set TEST_DATABASE_URL or install pgserver")
+    if _server is None:
+        _server = pgserver.get_server(os.path.join(tempfile.gettempdir(), "aquawatch-pgdata"), cleanup_mode="stop")
+    return _server.get_uri()
+
+
+def _with_database(uri: str, dbname: str) -> str:
+    base, _, query = uri.partition("?")
+    base = base.rsplit("/", 1)[0]
+    return f"{base}/{dbname}" + (f"?{query}" if query else "")
+
+
+def fresh_database(extra_sql: Iterable[str] = ()) -> str:
+    """Creates a new database with the base schema plus extra_sql files loaded; returns its URI."""
+    try:
+        import psycopg
+    except ImportError:
+        raise PostgresUnavailable("psycopg is not installed")
+
+    admin = _admin_uri()
+    dbname = f"aquawatch_test_{uuid.uuid4().hex[:12]}"
+    with psycopg.connect(admin, autocommit=True) as conn:
+        conn.execute(f'create database "{dbname}"')
+
+    uri = _with_database(admin, dbname)
+    with psycopg.connect(uri, autocommit=True) as conn:
+        conn.execute(SUPABASE_SHIMS)
+        has_uuid_ossp = conn.execute(
+            "select 1 from pg_available_extensions where name = 'uuid-ossp'"
+        ).fetchone() is not None
+        if not has_uuid_ossp:
+            conn.execute(UUID_OSSP_SHIM)
+
+        for path in list(BASE_SCHEMA) + list(extra_sql):
+            with open(os.path.join(REPO_DIR, path)) as f:
+                sql = f.read()
+            if not has_uuid_ossp:
+                sql = _CREATE_UUID_OSSP.sub("", sql)
+            conn.execute(sql)
+    return uri
+
+
+def drop_database(uri: str):
+    import psycopg
+    dbname = uri.partition("?")[0].rsplit("/", 1)[1]
+    with psycopg.connect(_admin_uri(), autocommit=True) as conn:
+        conn.execute(f'drop database if exists "{dbname}" with (force)')
@@ -0,0 +1,209 @@
+"""
+Daily coverage rollups per area cell, kept in NumPy arrays for windowed trend queries.
+
+Two dense (cells x days) arrays hold the sum of coverage and the number of
+submissions for every area cell (coordinates rounded to 2 decimals, like the
+severity areas) and UTC day; one extra row collects submissions without a
+location. Updates are O(1) array writes, and a query is a slice of the day
+range, a reduceat into day/week/month buckets and a few vectorized reductions,
+so its cost depends on the range asked for, not on the number of submissions.
+
+Memory is cells x days x 12 bytes: 1,000 areas over three years is ~13 MB.
+"""
+import warnings
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BUCKETS = ("day", "week", "month")
+
+Area = Optional[Tuple[float, float]]
+
+_EPOCH = date(1970, 1, 1)
+
+
+def day_number(day: str) -> int:
+    """Days since 1970-01-01 for a YYYY-MM-DD string."""
+    return (date.fromisoformat(day) - _EPOCH).days
+
+
+def _bucket_ids(days: np.ndarray, bucket: str) -> np.ndarray:
+    if bucket == "day":
+        return days
+    if bucket == "week":
+        # ISO weeks start on Monday; 1970-01-01 was a Thursday
+        return days - (days + 3) % 7
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def _bucket_start_day(bucket_id: int, bucket: str) -> int:
+    if bucket == "month":
+        return int(np.datetime64(bucket_id, "M").astype("datetime64[D]").astype(np.int64))
+    return bucket_id
+
+
+def _shift_bucket(bucket_id: int, bucket: str, count: int) -> int:
+    return bucket_id + count * (7 if bucket == "week" else 1)
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    total = np.cumsum(values)
+    total[window:] -= total[:-window].copy()
+    return total
+
+
+def _round(value: float, digits: int = 1) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+class TrendRollup:
+    """Add or remove one submission's coverage with add(); read series with query()."""
+
+    def __init__(self, cells: int = 64, days: int = 64):
+        self.sums = np.zeros((cells, days), np.float64)
+        self.counts = np.zeros((cells, days), np.int32)
+        self.origin = 0  # day number of column 0
+        self.cells: Dict[Area, int] = {}
+        # Cell coordinates for bbox filters; NaN for the no-location row
+        self.cell_lat = np.full(cells, np.nan)
+        self.cell_lon = np.full(cells, np.nan)
+        self.first_day: Optional[int] = None
+        self.last_day: Optional[int] = None
+
+    # Updates
+
+    def _cell(self, area: Area) -> int:
+        row = self.cells.get(area)
+        if row is not None:
+            return row
+        row = self.cells[area] = len(self.cells)
+        if row >= self.sums.shape[0]:
+            extra = self.sums.shape[0]
+            self.sums = np.vstack((self.sums, np.zeros((extra, self.sums.shape[1]), self.sums.dtype)))
+            self.counts = np.vstack((self.counts, np.zeros((extra, self.counts.shape[1]), self.counts.dtype)))
+            self.cell_lat = np.concatenate((self.cell_lat, np.full(extra, np.nan)))
+            self.cell_lon = np.concatenate((self.cell_lon, np.full(extra, np.nan)))
+        if area is not None:
+            self.cell_lat[row], self.cell_lon[row] = area
+        return row
+
+    def _column(self, day: int) -> int:
+        if self.first_day is None:
+            # Center the first day so history can be added in either direction
+            self.origin = day - self.sums.shape[1] // 2
+        width = self.sums.shape[1]
+        if not self.origin <= day < self.origin + width:
+            # Grow by at least half again, so repeated growth is amortized
+            pad = max(64, width // 2)
+            start = min(self.origin, day - pad)
+            end = max(self.origin + width, day + 1 + pad)
+            offset = self.origin - start
+            sums = np.zeros((self.sums.shape[0], end - start), self.sums.dtype)
+            counts = np.zeros((self.counts.shape[0], end - start), self.counts.dtype)
+            sums[:, offset:offset + width] = self.sums
+            counts[:, offset:offset + width] = self.counts
+            self.sums, self.counts, self.origin = sums, counts, start
+        self.first_day = day if self.first_day is None else min(self.first_day, day)
+        self.last_day = day if self.last_day is None else max(self.last_day, day)
+        return day - self.origin
+
+    def add(self, area: Area, day: str, coverage: float, sign: int = 1):
+        row = self._cell(area)
+        col = self._column(day_number(day))
+        self.counts[row, col] += sign
+        if self.counts[row, col] == 0:
+            self.sums[row, col] = 0.0  # drop rounding residue from add/remove pairs
+        else:
+            self.sums[row, col] += sign * coverage
+
+    # Queries
+
+    def query(
+        self,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        bucket: str = "day",
+        window: int = 1,
+        percentiles: Sequence[float] = (),
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+    ) -> List[dict]:
+        """
+        Average coverage per bucket between start and end (inclusive days), one
+        entry per bucket that has submissions, keyed by the bucket's first day.
+        Buckets are whole calendar weeks (Monday first) or months, so a range
+        starting or ending mid-bucket covers that whole bucket.
+
+        window > 1 adds rolling_average: the submission-weighted mean over the
+        last `window` buckets, including buckets before `start`. percentiles
+        adds pNN: the NNth percentile of the per-area averages in the bucket,
+        i.e. how coverage is spread across places. bbox limits the series to
+        area cells inside (min_lat, min_lon, max_lat, max_lon).
+        """
+        if bucket not in BUCKETS:
+            raise ValueError(f"Unknown bucket {bucket!r} (expected one of {', '.join(BUCKETS)})")
+        if self.first_day is None:
+            return []
+        lo = self.first_day if start is None else max((start - _EPOCH).days, self.first_day)
+        hi = self.last_day if end is None else min((end - _EPOCH).days, self.last_day)
+        if lo > hi:
+            return []
+
+        first_bucket, last_bucket = (int(b) for b in _bucket_ids(np.array([lo, hi]), bucket))
+        hi = min(_bucket_start_day(_shift_bucket(last_bucket, bucket, 1), bucket) - 1, self.last_day)
+        # Reach back window-1 whole buckets so the first rolling means are complete
+        lead = _bucket_start_day(_shift_bucket(first_bucket, bucket, -(window - 1)), bucket)
+        lead = max(lead, self.origin)
+
+        days = np.arange(lead, hi + 1)
+        ids = _bucket_ids(days, bucket)
+        starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+        columns = slice(lead - self.origin, hi + 1 - self.origin)
+
+        n = len(self.cells)
+        if bbox is None:
+            rows = slice(0, n)
+            located = ~np.isnan(self.cell_lat[:n])
+        else:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            lat, lon = self.cell_lat[:n], self.cell_lon[:n]
+            rows = np.flatnonzero((lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon))
+            located = np.ones(len(rows), bool)
+
+        cell_sums, cell_counts = self.sums[rows, columns], self.counts[rows, columns]
+        # Collapse the cells first; per-cell buckets are only needed for percentiles
+        total_sums = np.add.reduceat(cell_sums.sum(axis=0), starts)
+        total_counts = np.add.reduceat(cell_counts.sum(axis=0), starts)
+
+        bucket_ids = ids[starts]
+        keep = np.flatnonzero((bucket_ids >= first_bucket) & (total_counts > 0))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            averages = total_sums / total_counts
+            if window > 1:
+                rolling = _rolling_sum(total_sums, window) / _rolling_sum(total_counts, window)
+
+        spread = {}
+        if percentiles and len(keep):
+            area_sums = np.add.reduceat(cell_sums[located], starts, axis=1)[:, keep]
+            area_counts = np.add.reduceat(cell_counts[located], starts, axis=1)[:, keep]
+            means = np.divide(area_sums, area_counts, out=np.full(area_sums.shape, np.nan), where=area_counts > 0)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # buckets with no located submissions
+                values = np.nanpercentile(means, percentiles, axis=0) if len(means) else np.full((len(percentiles), len(keep)), np.nan)
+            for q, row in zip(percentiles, values):
+                spread[f"p{q:g}"] = row
+
+        results = []
+        for i, k in enumerate(keep):
+            start_day = _bucket_start_day(int(bucket_ids[k]), bucket)
+            entry = {
+                "date": str(np.datetime64(start_day, "D")),
+                "average_coverage": _round(averages[k]),
+                "submissions": int(total_counts[k]),
+            }
+            if window > 1:
+                entry["rolling_average"] = _round(rolling[k])
+            for key, row in spread.items():
+                entry[key] = _round(row[i])
+            results.append(entry)
+        return results
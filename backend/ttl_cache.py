@@ -0,0 +1,95 @@
+"""
+Read-through TTL cache for serialized API responses.
+
+Entries hold the encoded JSON body together with a strong ETag (hash of the
+body), so a hit costs no database call and no re-serialization, and clients
+revalidating with If-None-Match can be answered 304 without a body.
+
+Each process has its own cache: writes made through this process invalidate
+immediately, changes made elsewhere show up once the TTL expires.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+
+class CachedBody:
+    __slots__ = ("body", "etag", "expires")
+
+    def __init__(self, data, ttl: float):
+        self.body = json.dumps(jsonable_encoder(data), separators=(",", ":"), ensure_ascii=False).encode()
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.expires = time.monotonic() + ttl
+
+
+class TTLCache:
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedBody]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedBody]:
+        entry = self._entries.get(key)
+        if entry is None or entry.expires <= time.monotonic():
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, data) -> CachedBody:
+        return self._store(key, CachedBody(data, self.ttl))
+
+    def _store(self, key: str, entry: CachedBody) -> CachedBody:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+        # A load already in flight read the old data; don't let it repopulate the cache
+        self._loading.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._loading.clear()
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable]) -> CachedBody:
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+
+        # Concurrent misses for the same key share one database call
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            entry = CachedBody(await load(), self.ttl)
+        except BaseException as e:
+            if self._loading.get(key) is future:
+                del self._loading[key]
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                future.exception()  # retrieved, even if nobody else was waiting
+            else:
+                future.cancel()
+            raise
+
+        if self._loading.get(key) is future:
+            del self._loading[key]
+            self._store(key, entry)
+        future.set_result(entry)
+        return entry